@@ -0,0 +1,41 @@
+from django.core.cache import cache
+
+from .models import UserProfile
+
+DISPLAY_NAME_TIMEOUT = 60 * 60
+
+# public names are shown next to every chat message; they change rarely,
+# so they are cached per user and dropped by accounts.signals when the
+# profile is saved
+
+
+def display_name_key(user_id):
+    return f"accounts:display_name:{user_id}"
+
+
+def invalidate_display_names(user_ids):
+    cache.delete_many([display_name_key(uid) for uid in user_ids])
+
+
+def get_display_name(user_id):
+    key = display_name_key(user_id)
+    name = cache.get(key)
+    if name is None:
+        name = (UserProfile.objects.filter(user_id=user_id)
+                .values_list("public_name", flat=True).first())
+        if name is None:
+            return ""
+        cache.set(key, name, DISPLAY_NAME_TIMEOUT)
+    return name
+
+
+async def aget_display_name(user_id):
+    key = display_name_key(user_id)
+    name = await cache.aget(key)
+    if name is None:
+        name = await (UserProfile.objects.filter(user_id=user_id)
+                      .values_list("public_name", flat=True).afirst())
+        if name is None:
+            return ""
+        await cache.aset(key, name, DISPLAY_NAME_TIMEOUT)
+    return name
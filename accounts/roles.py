@@ -1,3 +1,7 @@
+from django.core.cache import cache
+
+ROLES_TIMEOUT = 60 * 60
+
 
 def roles(request):
     return {"roles": get_roles(request.user)}
@@ -6,6 +10,15 @@ def roles(request):
 # without repeating boilerplate in views
 
 
+def roles_key(user_id):
+    return f"accounts:roles:{user_id}"
+
+
+def invalidate_roles(user_ids):
+    # called from accounts.signals on group membership changes
+    cache.delete_many([roles_key(uid) for uid in user_ids])
+
+
 def get_roles(user):
     """Return a consistent roles dict for templates & code."""
     if not user.is_authenticated:
@@ -15,9 +28,15 @@ def get_roles(user):
         }
 
     # Try to pull group names once
-    # cache on the user to avoid repeated db hits
+    # cache on the user to avoid repeated db hits, and in the cache to
+    # avoid them across requests
     if not hasattr(user, "_role_names"):
-        names = set(user.groups.values_list("name", flat=True))
+        key = roles_key(user.id)
+        names = cache.get(key)
+        if names is None:
+            names = set(user.groups.values_list("name", flat=True))
+            cache.set(key, names, ROLES_TIMEOUT)
+        names = set(names)
         if user.is_superuser:  # treat superusers as 'admin'
             names.add("admin")
         user._role_names = names
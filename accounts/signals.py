@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
 from django.dispatch import receiver
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, User
 from .models import UserProfile
+from .profiles import invalidate_display_names
+from .roles import invalidate_roles
 
 # creates additional User Profile when User is created
 
@@ -11,3 +14,33 @@ def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.get_or_create(
             user=instance, public_name=instance.username)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def profile_changed(sender, instance, **kwargs):
+    invalidate_display_names([instance.user_id])
+
+
+# drop cached role names when group memberships change
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # forward: instance is a User; reverse: instance is a Group and
+    # pk_set holds users
+    if action in ("post_add", "post_remove"):
+        invalidate_roles((pk_set or ()) if reverse else [instance.pk])
+    elif action == "pre_clear":
+        if reverse:
+            invalidate_roles(instance.user_set.values_list("id", flat=True))
+        else:
+            invalidate_roles([instance.pk])
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # renames change what members' names mean; deletes cascade the
+    # memberships without m2m signals
+    invalidate_roles(instance.user_set.values_list("id", flat=True))
@@ -0,0 +1,25 @@
+import pytest
+from django.core.cache import cache
+
+from ..factories import UserFactory
+from ..profiles import display_name_key, get_display_name
+
+
+@pytest.mark.django_db
+def test_display_name_is_cached_until_profile_saved(django_assert_num_queries):
+    user = UserFactory()
+    cache.delete(display_name_key(user.id))
+
+    with django_assert_num_queries(1):
+        assert get_display_name(user.id) == user.profile.public_name
+    with django_assert_num_queries(0):
+        get_display_name(user.id)
+
+    user.profile.public_name = "Renamed"
+    user.profile.save()
+    assert get_display_name(user.id) == "Renamed"
+
+
+@pytest.mark.django_db
+def test_display_name_of_unknown_user_is_empty():
+    assert get_display_name(0) == ""
@@ -1,7 +1,10 @@
 from django.contrib.auth.models import User
+from django.urls import reverse
 from rest_framework import serializers
 from accounts.models import User, UserProfile
-from courses.models import Course, Enrollment, Material
+from courses.models import (Course, CourseDailyStats, CourseRanking,
+                            Enrollment, Material)
+from courses.rankings import RATINGS
 
 
 class UserProfilePublicSerializer(serializers.ModelSerializer):
@@ -62,8 +65,10 @@ class EnrollmentStudentCourseSerializer(serializers.ModelSerializer):
 class CoursePublicSerializer(serializers.ModelSerializer):
     creator = UserPublicSerializer(read_only=True)
     collaborators = UserPublicSerializer(many=True, read_only=True)
-    average_rating = serializers.FloatField(read_only=True)
-    feedback_count = serializers.IntegerField(read_only=True)
+    average_rating = serializers.FloatField(
+        source="rating_avg", read_only=True)
+    feedback_count = serializers.IntegerField(
+        source="rating_count", read_only=True)
 
     class Meta:
         model = Course
@@ -74,6 +79,30 @@ class CoursePublicSerializer(serializers.ModelSerializer):
         ]
 
 
+class CourseRankingSerializer(serializers.ModelSerializer):
+    course = CoursePublicSerializer(read_only=True)
+    # review counts for ratings 0..10, from the precomputed buckets
+    histogram = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CourseRanking
+        fields = ["position", "score", "rating_count", "rating_avg",
+                  "refreshed_at", "histogram", "course"]
+
+    def get_histogram(self, obj):
+        counts = {b.rating: b.count for b in obj.course.rating_buckets.all()}
+        return [counts.get(rating, 0) for rating in RATINGS]
+
+
+class CourseDailyStatsSerializer(serializers.ModelSerializer):
+    rating_avg = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = CourseDailyStats
+        fields = ["date", "enrollments", "unenrollments", "blocks", "unblocks",
+                  "feedback_count", "rating_avg"]
+
+
 class EnrollmentSerializer(serializers.ModelSerializer):
     course = CoursePublicSerializer(read_only=True)
     course_id = serializers.PrimaryKeyRelatedField(
@@ -88,6 +117,27 @@ class EnrollmentSerializer(serializers.ModelSerializer):
 
 
 class MaterialSerializer(serializers.ModelSerializer):
+    # access-checked download endpoint; prefer it over the raw content URL
+    download_url = serializers.SerializerMethodField()
+
     class Meta:
         model = Material
-        fields = ["id", "course", "title", "order", "content"]
+        fields = ["id", "course", "title", "order", "content", "download_url"]
+
+    def get_download_url(self, obj):
+        if not obj.content:
+            return None
+        url = reverse("courses:material_download", args=[obj.id])
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+
+class MaterialSearchSerializer(MaterialSerializer):
+    course_title = serializers.CharField(source="course.title", read_only=True)
+    rank = serializers.FloatField(source="search_rank", read_only=True)
+    # HTML-escaped text with matches wrapped in <mark>
+    snippet = serializers.CharField(source="search_snippet", read_only=True)
+
+    class Meta(MaterialSerializer.Meta):
+        fields = ["id", "course", "course_title", "title", "download_url",
+                  "rank", "snippet"]
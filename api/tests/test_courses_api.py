@@ -1,7 +1,12 @@
+from datetime import timedelta
+
 from conftest import no_pagination
 import pytest
 from django.contrib.auth import get_user_model
-from courses.models import Course, Enrollment, Material
+from django.utils import timezone
+from courses.analytics import rollup_activity
+from courses.models import Course, CourseFeedback, Enrollment, Material
+from courses.rankings import refresh_rankings
 
 User = get_user_model()
 
@@ -181,3 +186,135 @@ def test_my_courses_returns_teaching_and_enrolled(api, create_user, course_facto
 
     assert {"C1", "C2"} <= teaching_titles
     assert {"C3"} <= enrolled_titles
+
+
+# ---------- Tests: material reordering ----------
+
+@pytest.mark.django_db
+def test_teacher_can_batch_reorder_materials(api, create_user, course_factory):
+    teacher = create_user("t8", public_name="T8")
+    course = course_factory("Operating Systems", creator=teacher)
+    mats = [Material.objects.create(course=course, title=f"L{i}", order=i + 1)
+            for i in range(3)]
+
+    api.force_authenticate(user=teacher)
+    resp = api.post(f"/api/courses/{course.id}/materials/reorder/",
+                    {"order": [mats[2].id, mats[0].id, mats[1].id]}, format="json")
+    assert resp.status_code == 200
+    assert [m["title"] for m in resp.json()] == ["L2", "L0", "L1"]
+
+    student = create_user("stu3", public_name="Stu Three")
+    api.force_authenticate(user=student)
+    resp = api.post(f"/api/courses/{course.id}/materials/reorder/",
+                    {"order": [mats[0].id]}, format="json")
+    assert resp.status_code == 403
+
+
+@pytest.mark.django_db
+def test_reorder_with_non_object_body_is_400(api, create_user, course_factory):
+    teacher = create_user("t11", public_name="T11")
+    course = course_factory("Compilers", creator=teacher)
+    Material.objects.create(course=course, title="L0", order=1)
+
+    api.force_authenticate(user=teacher)
+    resp = api.post(f"/api/courses/{course.id}/materials/reorder/",
+                    [1, 2], format="json")
+    assert resp.status_code == 400
+
+
+# ---------- Tests: catalog search ----------
+
+@pytest.mark.django_db
+def test_course_search_is_ranked_and_cursor_paged(api, create_user, course_factory):
+    user = create_user("searcher", public_name="Searcher")
+    api.force_authenticate(user=user)
+    course_factory("Compilers", description="Parsing with grammars")
+    for i in range(3):
+        course_factory(f"Parsing {i}", description="Parsing parsing")
+    course_factory("Networks", description="Routing")
+
+    resp = api.get("/api/courses/", {"q": "parsing", "limit": 2})
+    assert resp.status_code == 200
+    first = resp.json()
+    assert len(first["results"]) == 2
+    assert first["results"][0]["title"].startswith("Parsing")
+
+    second = api.get(first["next"]).json()
+    assert second["next"] is None
+    titles = [c["title"] for c in first["results"] + second["results"]]
+    assert len(titles) == len(set(titles)) == 4
+    assert titles[-1] == "Compilers"
+
+    resp = api.get("/api/courses/", {"q": "parsing", "cursor": "nonsense"})
+    assert resp.status_code == 400
+
+
+# ---------- Tests: bulk enrollment import ----------
+
+@pytest.mark.django_db
+def test_teacher_can_import_enrollments(api, create_user, course_factory):
+    teacher = create_user("t9", public_name="T9")
+    course = course_factory("Databases", creator=teacher)
+    alice = create_user("alice9", public_name="Alice")
+    alice.email = "alice9@example.com"
+    alice.save()
+    create_user("bob9", public_name="Bob")
+
+    api.force_authenticate(user=teacher)
+    resp = api.post(f"/api/courses/{course.id}/enrollments/import/",
+                    {"users": ["alice9@example.com", "bob9", "nobody"]}, format="json")
+
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["enrolled"] == 2
+    assert [e["row"] for e in data["errors"]] == [3]
+    assert Enrollment.objects.filter(course=course).count() == 2
+
+    api.force_authenticate(user=alice)
+    resp = api.post(f"/api/courses/{course.id}/enrollments/import/",
+                    {"users": ["bob9"]}, format="json")
+    assert resp.status_code == 403
+
+
+# ---------- Tests: top rated courses ----------
+
+@pytest.mark.django_db
+def test_top_courses_come_from_the_ranking_table(api, create_user, course_factory,
+                                                 django_assert_max_num_queries):
+    reviewer = create_user("reviewer", public_name="Reviewer")
+    good = course_factory("Good")
+    okay = course_factory("Okay")
+    CourseFeedback.objects.create(course=good, user=reviewer, rating=9)
+    CourseFeedback.objects.create(course=okay, user=reviewer, rating=5)
+    refresh_rankings()
+
+    api.force_authenticate(user=reviewer)
+    # rankings + prefetched collaborators/profiles/buckets; no feedback aggregation
+    with django_assert_max_num_queries(8):
+        resp = api.get("/api/courses/top/")
+    assert resp.status_code == 200
+    data = resp.json()
+    assert [r["course"]["title"] for r in data] == ["Good", "Okay"]
+    assert data[0]["position"] == 1
+    assert data[0]["histogram"][9] == 1 and sum(data[0]["histogram"]) == 1
+
+
+# ---------- Tests: teacher analytics ----------
+
+@pytest.mark.django_db
+def test_course_analytics_for_teachers(api, create_user, course_factory):
+    teacher = create_user("t10", public_name="T10")
+    course = course_factory("Statistics", creator=teacher)
+    student = create_user("s10", public_name="S10")
+    Enrollment.objects.create(course=course, user=student)
+    rollup_activity(now=timezone.now() + timedelta(minutes=5))
+
+    api.force_authenticate(user=student)
+    assert api.get(f"/api/courses/{course.id}/analytics/").status_code == 403
+
+    api.force_authenticate(user=teacher)
+    resp = api.get(f"/api/courses/{course.id}/analytics/", {"days": 7})
+    assert resp.status_code == 200
+    [today] = resp.json()
+    assert today["enrollments"] == 1
+    assert today["rating_avg"] is None
@@ -1,5 +1,6 @@
 from rest_framework.routers import DefaultRouter
-from .views import UserViewSet, CourseViewSet, EnrollmentViewSet
+from .views import (UserViewSet, CourseViewSet, EnrollmentViewSet,
+                    MaterialSearchViewSet)
 
 from django.urls import path
 from django.views.generic import TemplateView
@@ -10,6 +11,8 @@ router = DefaultRouter()
 router.register(r"users", UserViewSet, basename="user")
 router.register(r"courses", CourseViewSet, basename="course")
 router.register(r"enrollments", EnrollmentViewSet, basename="enrollment")
+router.register(r"materials/search", MaterialSearchViewSet,
+                basename="material-search")
 
 urlpatterns = router.urls + [
     path("about/", TemplateView.as_view(template_name="api/api-about.html"),
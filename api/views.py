@@ -6,19 +6,34 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from courses.models import Course, Enrollment, Material
-from .serializers import (CoursePublicSerializer,
+from courses.analytics import (ANALYTICS_DAYS, MAX_ANALYTICS_DAYS,
+                               course_daily_stats)
+from courses.enrollments import (EnrollmentImportError, bulk_enroll,
+                                 read_identifiers)
+from courses.models import Course, CourseRanking, Enrollment, Material
+from courses.ordering import reorder_materials
+from courses.permissions import course_access, is_course_teacher
+from courses.rankings import MAX_TOP_LIMIT, TOP_LIMIT
+from courses.search import SEARCH_LIMIT, search_courses, search_materials
+from courses.tasks import notify_teacher_of_bulk_enrollment
+from .serializers import (CourseDailyStatsSerializer,
+                          CoursePublicSerializer,
+                          CourseRankingSerializer,
                           EnrollmentSerializer,
+                          MaterialSearchSerializer,
                           MaterialSerializer,
                           UserPublicSerializer,
                           UserMeSerializer)
-from .utils import is_course_teacher
 
 
 class CourseViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Public: list/retrieve courses.
+    Search: /api/courses/?q=<words>&cursor=<next cursor>, ranked by relevance
+    and paged by cursor ({"next": ..., "results": [...]}).
+    Top rated: /api/courses/top/?limit=<n>, from the precomputed ranking.
     Extra (teachers only): /api/courses/{id}/students/?include_blocked=true|false
+                           /api/courses/{id}/analytics/?days=<n> (daily rollups)
     Materials: visible to course teachers, or enrolled (non-blocked) users.
     """
     queryset = (
@@ -29,6 +44,45 @@ class CourseViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = CoursePublicSerializer
     permission_classes = [IsAuthenticated]
 
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return super().list(request, *args, **kwargs)
+        try:
+            limit = int(request.query_params.get("limit", SEARCH_LIMIT))
+            courses, next_cursor = search_courses(
+                query, limit, cursor=request.query_params.get("cursor"),
+                queryset=self.get_queryset())
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
+
+        next_url = None
+        if next_cursor:
+            params = request.query_params.copy()
+            params["cursor"] = next_cursor
+            next_url = request.build_absolute_uri(
+                f"{request.path}?{params.urlencode()}")
+        return Response({
+            "next": next_url,
+            "results": self.get_serializer(courses, many=True).data,
+        })
+
+    @action(detail=False, methods=["get"], url_path="top")
+    def top(self, request):
+        try:
+            limit = int(request.query_params.get("limit", TOP_LIMIT))
+        except ValueError:
+            return Response({"detail": "limit must be an integer"}, status=400)
+        limit = max(1, min(limit, MAX_TOP_LIMIT))
+        rankings = (
+            CourseRanking.objects
+            .select_related("course__creator__profile")
+            .prefetch_related("course__collaborators__profile",
+                              "course__rating_buckets")
+            .order_by("position")[:limit]
+        )
+        return Response(CourseRankingSerializer(rankings, many=True).data)
+
     @action(detail=True, methods=["get"], url_path="students")
     def students(self, request, pk=None):
         course = self.get_object()
@@ -45,18 +99,82 @@ class CourseViewSet(viewsets.ReadOnlyModelViewSet):
         users = User.objects.filter(id__in=user_ids).select_related("profile")
         return Response(UserPublicSerializer(users, many=True).data)
 
+    @action(detail=True, methods=["get"], url_path="analytics")
+    def analytics(self, request, pk=None):
+        course = self.get_object()
+        if not is_course_teacher(request.user, course):
+            return Response({"detail": "Forbidden"}, status=403)
+        try:
+            days = int(request.query_params.get("days", ANALYTICS_DAYS))
+        except ValueError:
+            return Response({"detail": "days must be an integer"}, status=400)
+        days = max(1, min(days, MAX_ANALYTICS_DAYS))
+        stats = course_daily_stats(course.id, days=days)
+        return Response(CourseDailyStatsSerializer(stats, many=True).data)
+
     @action(detail=True, methods=["get"], url_path="materials")
     def materials(self, request, pk=None):
         course = self.get_object()
-        teacher_ok = is_course_teacher(request.user, course)
-        enrolled_ok = Enrollment.objects.filter(
-            course=course, user=request.user, blocked=False
-        ).exists()
-        if not (teacher_ok or enrolled_ok):
+        if not course_access(request.user, course).can_view_materials:
             return Response({"detail": "Forbidden"}, status=403)
 
         mats = course.materials.all().order_by("order", "id")
-        return Response(MaterialSerializer(mats, many=True).data)
+        return Response(MaterialSerializer(
+            mats, many=True, context={"request": request}).data)
+
+    @action(detail=True, methods=["post"], url_path="materials/reorder")
+    def reorder(self, request, pk=None):
+        """
+        Body: {"order": [material ids], "after": material id | null}
+        Full ordering lists every material; partial moves the listed ones
+        as a block to just after `after` (or the top).
+        """
+        course = self.get_object()
+        if not is_course_teacher(request.user, course):
+            return Response({"detail": "Forbidden"}, status=403)
+        try:
+            reorder_materials(course, request.data.get("order", []),
+                              after=request.data.get("after"))
+        except (ValueError, TypeError, AttributeError) as e:
+            return Response({"detail": str(e)}, status=400)
+
+        mats = course.materials.all().order_by("order", "id")
+        return Response(MaterialSerializer(
+            mats, many=True, context={"request": request}).data)
+
+    @action(detail=True, methods=["post"], url_path="enrollments/import")
+    def import_enrollments(self, request, pk=None):
+        """
+        Teachers only. Body: {"users": [username or email, ...]} or a
+        multipart CSV upload in "file" (first column).
+        Returns {"enrolled", "already_enrolled", "errors": [{row, value, error}]}.
+        """
+        course = self.get_object()
+        if not is_course_teacher(request.user, course):
+            return Response({"detail": "Forbidden"}, status=403)
+        try:
+            if "file" in request.FILES:
+                rows = read_identifiers(request.FILES["file"])
+            else:
+                users = request.data.get("users")
+                if not isinstance(users, list):
+                    return Response(
+                        {"detail": "Provide a 'users' list or a CSV 'file'."},
+                        status=400)
+                rows = [(number, str(value).strip())
+                        for number, value in enumerate(users, start=1)
+                        if str(value).strip()]
+            result = bulk_enroll(course, rows)
+        except EnrollmentImportError as e:
+            return Response({"detail": str(e)}, status=400)
+
+        if result["enrolled"]:
+            notify_teacher_of_bulk_enrollment.delay(
+                teacher_id=course.creator_id,
+                course_title=course.title,
+                enrolled_count=result["enrolled"],
+            )
+        return Response(result)
 
 
 class EnrollmentViewSet(viewsets.ModelViewSet):
@@ -91,7 +209,7 @@ class EnrollmentViewSet(viewsets.ModelViewSet):
         # Allow teachers to PATCH 'blocked' for enrollments on their course.
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
-        if not is_course_teacher(request.user, instance.course):
+        if not is_course_teacher(request.user, instance.course_id):
             # Students can’t update an enrollment (only delete their own)
             return Response({"detail": "Forbidden"}, status=403)
 
@@ -112,11 +230,30 @@ class EnrollmentViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         # Student can drop own enrollment; teacher can remove anyone from their course
-        if instance.user_id != request.user.id and not is_course_teacher(request.user, instance.course):
+        if instance.user_id != request.user.id and not is_course_teacher(request.user, instance.course_id):
             return Response({"detail": "Forbidden"}, status=403)
         return super().destroy(request, *args, **kwargs)
 
 
+class MaterialSearchViewSet(viewsets.ViewSet):
+    """
+    /api/materials/search/?q=<words>&limit=<n>
+    Ranked full-text hits inside material files, limited to courses the
+    user teaches or is enrolled in (and not blocked from).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        query = request.query_params.get("q", "")
+        try:
+            limit = int(request.query_params.get("limit", SEARCH_LIMIT))
+        except ValueError:
+            return Response({"detail": "limit must be an integer"}, status=400)
+        hits = search_materials(request.user, query, limit=limit)
+        return Response(MaterialSearchSerializer(
+            hits, many=True, context={"request": request}).data)
+
+
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
     """
     - /api/users/             -> public profile list
@@ -0,0 +1,137 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ChatArchiveSegment, ChatMessage, ChatRoom
+
+# Tiered chat history. Messages older than CHAT_ARCHIVE_AFTER_DAYS are
+# moved out of ChatMessage by the periodic archive_chat_messages task into
+# per-room segments: gzipped JSON lines of [id, sender id, content,
+# timestamp], SEGMENT_SIZE messages each, with a ChatArchiveSegment row
+# recording the (timestamp, id) range. chat.history reads the hot table
+# first and carries on into the segments, so clients page through the
+# whole history with one cursor.
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 90
+SEGMENT_SIZE = 1000
+ARCHIVE_DIR = "chat/archive"
+
+
+def archive_after():
+    return timedelta(days=getattr(
+        settings, "CHAT_ARCHIVE_AFTER_DAYS", DEFAULT_ARCHIVE_AFTER_DAYS))
+
+
+def encode_segment(rows):
+    lines = "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in rows)
+    return gzip.compress(lines.encode(), mtime=0)
+
+
+def decode_segment(data):
+    return [json.loads(line) for line in gzip.decompress(data).splitlines()]
+
+
+def archive_room(room_id, cutoff, storage=None):
+    """
+    Move the room's messages older than `cutoff` into archive segments.
+    Returns the number of messages archived.
+
+    Each segment is written under a lock on the room, so a second run
+    (an overrunning periodic task, or one started by hand) skips a room
+    that is already being archived instead of archiving it twice.
+    """
+    storage = storage or default_storage
+    archived = 0
+    while True:
+        path = None
+        try:
+            with transaction.atomic():
+                locked = (ChatRoom.objects.select_for_update(skip_locked=True)
+                          .filter(id=room_id).exists())
+                if not locked:
+                    return archived
+                rows = [
+                    [pk, sender_id, content, timestamp.isoformat()]
+                    for pk, sender_id, content, timestamp in
+                    ChatMessage.objects
+                    .select_for_update()
+                    .filter(room_id=room_id, timestamp__lt=cutoff)
+                    .order_by("timestamp", "id")
+                    .values_list("id", "sender_id", "content", "timestamp")
+                    [:SEGMENT_SIZE]
+                ]
+                if not rows:
+                    return archived
+                first, last = rows[0], rows[-1]
+                path = storage.save(
+                    f"{ARCHIVE_DIR}/{room_id}/{first[0]}-{last[0]}.jsonl.gz",
+                    ContentFile(encode_segment(rows)))
+                ChatArchiveSegment.objects.create(
+                    room_id=room_id, path=path, message_count=len(rows),
+                    first_id=first[0],
+                    first_timestamp=datetime.fromisoformat(first[3]),
+                    last_id=last[0],
+                    last_timestamp=datetime.fromisoformat(last[3]))
+                _, deleted = ChatMessage.objects.filter(
+                    id__in=[row[0] for row in rows]).delete()
+                if deleted.get(ChatMessage._meta.label, 0) != len(rows):
+                    # some were deleted or archived under us; the segment
+                    # would duplicate or resurrect them
+                    raise RuntimeError(
+                        f"chat room {room_id} changed while being archived")
+        except Exception:
+            if path:
+                storage.delete(path)
+            raise
+        archived += len(rows)
+
+
+def archive_messages(now=None, storage=None):
+    """Archive every room's messages past the cutoff. Returns the count."""
+    cutoff = (now or timezone.now()) - archive_after()
+    room_ids = (ChatMessage.objects.filter(timestamp__lt=cutoff)
+                .values_list("room_id", flat=True).distinct())
+    return sum(archive_room(room_id, cutoff, storage)
+               for room_id in list(room_ids))
+
+
+@lru_cache(maxsize=32)
+def _segment_rows(path):
+    # segments never change once written, so they can be kept around
+    with default_storage.open(path, "rb") as fileobj:
+        return decode_segment(fileobj.read())
+
+
+def archived_messages(room_id, before=None, limit=SEGMENT_SIZE):
+    """
+    Up to `limit` archived messages of the room older than the
+    (timestamp, id) `before`, newest first, as unsaved ChatMessage
+    instances without their sender.
+    """
+    segments = ChatArchiveSegment.objects.filter(room_id=room_id)
+    if before:
+        timestamp, pk = before
+        segments = segments.filter(
+            Q(first_timestamp__lt=timestamp)
+            | Q(first_timestamp=timestamp, first_id__lt=pk))
+    messages = []
+    for segment in segments.order_by("-first_timestamp", "-first_id"):
+        for pk, sender_id, content, timestamp in reversed(
+                _segment_rows(segment.path)):
+            timestamp = datetime.fromisoformat(timestamp)
+            if before and (timestamp, pk) >= before:
+                continue
+            messages.append(ChatMessage(
+                id=pk, room_id=room_id, sender_id=sender_id,
+                content=content, timestamp=timestamp))
+            if len(messages) == limit:
+                return messages
+    return messages
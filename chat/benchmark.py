@@ -0,0 +1,102 @@
+import asyncio
+import math
+import time
+
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.urls import re_path
+
+from .consumers import ChatConsumer
+from .models import ChatMessage
+
+# Receive-to-broadcast latency of ChatConsumer, measured in process: one
+# client sends, another in the same room times how long each message takes
+# to come back, one message in flight at a time. Used by the
+# chat_benchmark command to compare consumer variants.
+
+# local stand-in for Redis, and rates that keep chat.throttle out of the way
+IN_MEMORY_LAYER = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+UNLIMITED = (1e9, 10**9)
+
+
+class ThreadPoolChatConsumer(ChatConsumer):
+    """
+    The consumer's write path as it was before the async ORM: the insert
+    goes through database_sync_to_async, which runs connection
+    housekeeping around every call.
+    """
+
+    @database_sync_to_async
+    def save_message(self, user, message):
+        return ChatMessage.objects.create(
+            sender=user, room=self.room, content=message)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(samples_ms):
+    return {
+        "count": len(samples_ms),
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 3) if samples_ms else 0.0,
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+    }
+
+
+def chat_application(consumer_class):
+    # no auth middleware: the benchmark puts its users in the scope itself
+    return URLRouter([
+        re_path(r"ws/chat/(?P<room_id>\d+)/$", consumer_class.as_asgi()),
+    ])
+
+
+async def _connect(application, room_id, user):
+    comm = WebsocketCommunicator(application, f"/ws/chat/{room_id}/")
+    comm.scope["user"] = user
+    connected, _ = await comm.connect()
+    if not connected:
+        raise RuntimeError(f"could not connect to room {room_id}")
+    return comm
+
+
+async def measure_receive_latency(consumer_class, room_id, sender, listener,
+                                  messages, warmup=20, timeout=5):
+    """Latencies in milliseconds of `messages` sends through the consumer."""
+    application = chat_application(consumer_class)
+    sending = await _connect(application, room_id, sender)
+    listening = await _connect(application, room_id, listener)
+    samples = []
+    try:
+        for i in range(warmup + messages):
+            started = time.perf_counter()
+            await sending.send_json_to({"message": f"benchmark {i}"})
+            await listening.receive_json_from(timeout=timeout)
+            elapsed = (time.perf_counter() - started) * 1000
+            # the sender's own echo isn't timed, just drained
+            await sending.receive_json_from(timeout=timeout)
+            if i >= warmup:
+                samples.append(elapsed)
+    finally:
+        await sending.disconnect()
+        await listening.disconnect()
+    return samples
+
+
+def run_benchmark(room_id, sender, listener, messages, warmup=20):
+    """{variant: latency summary} for the old and the current consumer."""
+    results = {}
+    for name, consumer_class in (("thread_pool", ThreadPoolChatConsumer),
+                                 ("async_orm", ChatConsumer)):
+        samples = asyncio.run(measure_receive_latency(
+            consumer_class, room_id, sender, listener, messages, warmup))
+        results[name] = summarize(samples)
+    return results
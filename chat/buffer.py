@@ -0,0 +1,182 @@
+import asyncio
+import atexit
+import logging
+import time
+
+from django.conf import settings
+from django.db import DataError, IntegrityError
+
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# Write-behind persistence for chat messages (CHAT_WRITE_BEHIND). Instead
+# of an insert per message in the receive path, ChatConsumer broadcasts
+# straight away and queues the message here; the queue is written with one
+# bulk_create every CHAT_FLUSH_INTERVAL_MS or as soon as CHAT_FLUSH_BATCH
+# messages are waiting. Whatever is left is written when the process
+# exits. The buffer is per process, so a crash loses at most one
+# interval's worth of messages.
+#
+# A batch the database rejects (a room or sender deleted since the message
+# was queued) is written row by row and the bad rows are dropped. A batch
+# that fails for any other reason (database unavailable) is queued again,
+# up to MAX_ATTEMPTS times per message, and the queue never holds more
+# than CHAT_BUFFER_MAX messages; anything beyond that is dropped and
+# logged.
+
+DEFAULT_FLUSH_INTERVAL_MS = 200
+DEFAULT_FLUSH_BATCH = 100
+DEFAULT_BUFFER_MAX = 10000
+MAX_ATTEMPTS = 5
+
+
+def write_behind_enabled():
+    return getattr(settings, "CHAT_WRITE_BEHIND", False)
+
+
+def flush_interval():
+    return getattr(
+        settings, "CHAT_FLUSH_INTERVAL_MS", DEFAULT_FLUSH_INTERVAL_MS) / 1000
+
+
+def flush_batch():
+    return getattr(settings, "CHAT_FLUSH_BATCH", DEFAULT_FLUSH_BATCH)
+
+
+def buffer_max():
+    return getattr(settings, "CHAT_BUFFER_MAX", DEFAULT_BUFFER_MAX)
+
+
+class MessageBuffer:
+    def __init__(self):
+        self.pending = []
+        self._timer = None
+        self._timer_loop = None
+        self.flushes = 0
+        self.flushed = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    async def add(self, message):
+        self.pending.append(message)
+        self._trim()
+        if len(self.pending) >= flush_batch():
+            await self.flush()
+        else:
+            self._schedule()
+
+    def _schedule(self):
+        loop = asyncio.get_running_loop()
+        # a timer left over from another (closed) loop will never fire
+        if self._timer and not self._timer.done() and self._timer_loop is loop:
+            return
+        self._timer_loop = loop
+        self._timer = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(flush_interval())
+        # messages queued while this flush runs need a timer of their own
+        self._timer = None
+        await self.flush()
+
+    def _take(self):
+        batch, self.pending = self.pending, []
+        return batch
+
+    def _drop(self, messages, reason):
+        self.dropped += len(messages)
+        logger.error("Dropped %d chat message(s): %s", len(messages), reason)
+
+    def _trim(self):
+        excess = len(self.pending) - buffer_max()
+        if excess > 0:
+            self._drop(self.pending[:excess], "write-behind buffer full")
+            del self.pending[:excess]
+
+    def _failed(self, batch):
+        self.failures += 1
+        logger.exception("Flushing %d chat messages failed", len(batch))
+        retry, given_up = [], []
+        for message in batch:
+            message._flush_attempts = getattr(message, "_flush_attempts", 0) + 1
+            if message._flush_attempts < MAX_ATTEMPTS:
+                retry.append(message)
+            else:
+                given_up.append(message)
+        if given_up:
+            self._drop(given_up, f"not written after {MAX_ATTEMPTS} attempts")
+        # keep the rest for the next attempt, ahead of newer messages
+        self.pending[:0] = retry
+        self._trim()
+        return 0
+
+    def _flushed(self, written, started):
+        elapsed = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.flushed += written
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        return written
+
+    async def flush(self):
+        """Write everything queued so far. Returns the number written."""
+        written = 0
+        batch = self._take()
+        if batch:
+            started = time.perf_counter()
+            try:
+                await ChatMessage.objects.abulk_create(
+                    batch, batch_size=flush_batch())
+                written = self._flushed(len(batch), started)
+            except (IntegrityError, DataError):
+                for message in batch:
+                    try:
+                        await ChatMessage.objects.abulk_create([message])
+                        written += 1
+                    except (IntegrityError, DataError) as e:
+                        self._drop([message], e)
+                self._flushed(written, started)
+            except Exception:
+                self._failed(batch)
+        if self.pending:
+            self._schedule()
+        return written
+
+    def flush_sync(self):
+        batch = self._take()
+        if not batch:
+            return 0
+        started = time.perf_counter()
+        try:
+            ChatMessage.objects.bulk_create(batch, batch_size=flush_batch())
+        except (IntegrityError, DataError):
+            written = 0
+            for message in batch:
+                try:
+                    ChatMessage.objects.bulk_create([message])
+                    written += 1
+                except (IntegrityError, DataError) as e:
+                    self._drop([message], e)
+            return self._flushed(written, started)
+        except Exception:
+            return self._failed(batch)
+        return self._flushed(len(batch), started)
+
+    def metrics(self):
+        return {
+            "depth": len(self.pending),
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+        }
+
+
+message_buffer = MessageBuffer()
+# daphne has no lifespan shutdown hook; write the tail on interpreter exit
+atexit.register(message_buffer.flush_sync)
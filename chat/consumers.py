@@ -1,17 +1,27 @@
-import json
+from datetime import datetime
+from urllib.parse import parse_qs
+from django.utils import timezone
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from accounts.profiles import aget_display_name
+from . import protocol
+from .buffer import message_buffer, write_behind_enabled
+from .history import (REPLAY_LIMIT, archived_since, decode_cursor,
+                      message_data, message_payload, missed_messages)
 from .models import ChatMessage, ChatRoom
-import json
+from .throttle import TokenBucket, backlog, limit, user_buckets
 import logging
 
 logger = logging.getLogger(__name__)
 
+MAX_MESSAGE_LENGTH = ChatMessage._meta.get_field('content').max_length
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
-    @database_sync_to_async
-    def get_display_name(self, user):
-        return user.profile.public_name
+    # the room and the sender's display name don't change while the socket
+    # is open, so both are looked up once in connect() and every message
+    # costs a single insert. Lookups and writes use the async ORM directly
+    # rather than database_sync_to_async, which adds connection
+    # housekeeping around every call (see the chat_benchmark command).
 
     async def connect(self):
         self.room_id = self.scope['url_route']['kwargs']['room_id']
@@ -23,12 +33,55 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
+        self.room = await ChatRoom.objects.filter(id=self.room_id).afirst()
+        self.display_name = await aget_display_name(user.id)
+        if self.room is None:
+            await self.close()
+            return
+
+        # flood control, see chat.throttle
+        self.bucket = TokenBucket(*limit('CHAT_RATE'))
+        self.strikes = TokenBucket(*limit('CHAT_STRIKES'))
+        self.shed = False
+
         # Join room group
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
-        await self.accept()
+        subprotocol = protocol.negotiate(self.scope.get('subprotocols', []))
+        self.binary = subprotocol == protocol.MSGPACK
+        await self.accept(subprotocol=subprotocol)
+
+        # a reconnecting client passes the cursor of the last message it
+        # saw; it's sent what it missed before any live message (room
+        # events queue up until connect() returns)
+        self.replayed_until = None
+        since = self.since_cursor()
+        if since:
+            await self.replay(since)
+
+    def since_cursor(self):
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            return decode_cursor(query['since'][0])
+        except (KeyError, ValueError):
+            return None
+
+    async def replay(self, since):
+        if await archived_since(self.room.id, since):
+            # part of what was missed is archived; the page has to be
+            # reloaded
+            await self.send(**protocol.frame({'resync': True}, self.binary))
+            return
+        missed = await missed_messages(self.room.id, since)
+        if len(missed) > REPLAY_LIMIT:
+            await self.send(**protocol.frame({'resync': True}, self.binary))
+            return
+        for message in missed:
+            await self.send(**protocol.frame(message_data(message), self.binary))
+        if missed:
+            self.replayed_until = (missed[-1].timestamp, missed[-1].pk)
 
     async def disconnect(self, close_code):
         try:
@@ -39,7 +92,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error during disconnect: {e}")
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         # new chat message has been sent to the socket
         try:
             # Get user from scope and verify authenticated
@@ -48,41 +101,99 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 logger.info("Unauthenticated user, ignoring message")
                 return
 
-            # Parse JSON data and extract message
-            data = json.loads(text_data)
-            message = data.get('message', '').strip()
+            if not await self.allow(user):
+                return
+
+            # Parse the frame (JSON, or msgpack if negotiated) and extract message
+            data = protocol.decode_frame(text_data, bytes_data)
+            message = str(data.get('message', '')).strip()
             if not message:
                 logger.info("Ignoring empty message")
                 return
+            if len(message) > MAX_MESSAGE_LENGTH:
+                # rejected here, before it's broadcast, rather than by the
+                # database after
+                await self.send(**protocol.frame({
+                    'error': 'too_long',
+                    'max_length': MAX_MESSAGE_LENGTH,
+                }, self.binary))
+                return
 
-            # Save message in DB using room_id (set on connect)
-            await self.save_message(user, self.room_id, message)
-
-            # Get display name from user profile
-            display_name = await self.get_display_name(user)
+            write_behind = write_behind_enabled()
+            if write_behind:
+                # written by the next buffer flush (chat.buffer), so it
+                # has no id yet
+                saved = ChatMessage(sender=user, room=self.room,
+                                    content=message, timestamp=timezone.now())
+            else:
+                # Save message in DB using the room loaded on connect
+                saved = await self.save_message(user, message)
 
-            # Broadcast message to the group
+            # Broadcast message to the group, encoded once here rather
+            # than in every member's consumer
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     'type': 'chat_message',      # Calls chat_message method
-                    'message': message,
-                    'display_name': display_name,
+                    'key': [saved.timestamp.isoformat(), saved.pk or 0],
+                    **protocol.encode_frames(message_payload(
+                        saved.pk, message, self.display_name, saved.timestamp)),
                 }
             )
+
+            if write_behind:
+                await message_buffer.add(saved)
         except Exception as e:
             logger.error(f"Error in receive: {e}", exc_info=True)
 
+    async def allow(self, user):
+        """
+        Whether the frame is within the connection's and the user's rate.
+        Over-limit frames get a throttle notice; a connection out of
+        strikes is closed.
+        """
+        if self.bucket.take() and await user_buckets().take(user.id):
+            return True
+        if not self.strikes.take():
+            logger.info(f"Closing flooding chat connection of user {user.id}")
+            await self.close(code=1008)  # policy violation
+            return False
+        await self.send(**protocol.frame({
+            'error': 'throttled',
+            'retry_after': round(self.bucket.retry_after(), 2),
+        }, self.binary))
+        return False
+
     async def chat_message(self, event):
+        if self.shed:
+            return
         try:
-            await self.send(text_data=json.dumps({
-                'message': event['message'],
-                'display_name': event['display_name'],
-            }))
+            queued = backlog(self.channel_layer, self.channel_name)
+            if queued is not None and queued > limit('CHAT_MAX_BACKLOG'):
+                # too far behind the room to catch up: drop the socket
+                # rather than let its queue grow (the client can reconnect)
+                logger.info(f"Shedding chat consumer {queued} events behind")
+                self.shed = True
+                await self.close(code=1013)  # try again later
+                return
+            if self.replayed_until and 'key' in event:
+                timestamp, pk = event['key']
+                if (datetime.fromisoformat(timestamp), pk) <= self.replayed_until:
+                    return  # already sent by replay()
+                self.replayed_until = None
+            if 'text' not in event:
+                # sent by a consumer from before frames were pre-encoded
+                event = protocol.encode_frames({
+                    'message': event['message'],
+                    'display_name': event['display_name'],
+                })
+            if self.binary:
+                await self.send(bytes_data=event['bytes'])
+            else:
+                await self.send(text_data=event['text'])
         except Exception as e:
             logger.error(f"Error sending message: {e}", exc_info=True)
 
-    @database_sync_to_async
-    def save_message(self, user, room_id, message):
-        room = ChatRoom.objects.get(id=room_id)
-        return ChatMessage.objects.create(sender=user, room=room, content=message)
+    async def save_message(self, user, message):
+        return await ChatMessage.objects.acreate(
+            sender=user, room=self.room, content=message)
@@ -0,0 +1,141 @@
+import base64
+import json
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from .archive import archived_messages
+from .models import ChatArchiveSegment, ChatMessage
+
+# Room history is read newest-first a page at a time, keyset-paginated on
+# (timestamp, id): the room page renders the newest page and the client
+# fetches older pages from ChatHistoryView as the user scrolls up, so the
+# cost of a page doesn't depend on how much history the room has. Pages
+# that run past the live table continue into the room's archive segments
+# (chat.archive).
+
+HISTORY_PAGE = 50
+MAX_HISTORY_PAGE = 200
+# most messages replayed to a reconnecting socket; further behind than
+# this, the client is told to reload instead
+REPLAY_LIMIT = 500
+
+
+def encode_cursor(timestamp, pk):
+    raw = json.dumps([timestamp.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from a cursor; ValueError if it was tampered with."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, pk = json.loads(raw)
+        timestamp = datetime.fromisoformat(timestamp)
+        pk = int(pk)
+    except (TypeError, ValueError) as e:
+        raise ValueError("invalid cursor") from e
+    if timestamp.tzinfo is None:
+        # encode_cursor only writes aware timestamps
+        raise ValueError("invalid cursor")
+    return timestamp, pk
+
+
+def message_page(room_id, before=None, limit=HISTORY_PAGE):
+    """
+    The `limit` messages of the room older than the `before` cursor (the
+    newest ones without it), oldest first, and the cursor of the next
+    older page, or None at the start of the room.
+    """
+    messages = (ChatMessage.objects
+                .filter(room_id=room_id)
+                .select_related("sender__profile")
+                .order_by("-timestamp", "-id"))
+    if before:
+        before = decode_cursor(before)
+        timestamp, pk = before
+        messages = messages.filter(
+            Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+    live = list(messages[:limit + 1])
+    archived = []
+    if len(live) <= limit:
+        # archived messages are all older than the live ones
+        if live:
+            before = (live[-1].timestamp, live[-1].pk)
+        archived = archived_messages(room_id, before, limit + 1 - len(live))
+    page = live + archived
+    cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        cursor = encode_cursor(page[-1].timestamp, page[-1].pk)
+    page = live[:limit] + with_senders(page[len(live):])
+    page.reverse()
+    return page, cursor
+
+
+def with_senders(messages):
+    """
+    Attach senders (with profiles) to archived messages, in one query.
+    Messages of since-deleted users are dropped, as their live messages
+    would have been.
+    """
+    if not messages:
+        return []
+    users = (get_user_model().objects.select_related("profile")
+             .in_bulk({message.sender_id for message in messages}))
+    kept = []
+    for message in messages:
+        if message.sender_id in users:
+            message.sender = users[message.sender_id]
+            kept.append(message)
+    return kept
+
+
+async def archived_since(room_id, since):
+    """
+    Whether any of the room's messages after the (timestamp, id) `since`
+    have been moved to the archive, so can't be replayed from the live
+    table.
+    """
+    timestamp, pk = since
+    return await (ChatArchiveSegment.objects
+                  .filter(room_id=room_id)
+                  .filter(Q(last_timestamp__gt=timestamp)
+                          | Q(last_timestamp=timestamp, last_id__gt=pk))
+                  .aexists())
+
+
+async def missed_messages(room_id, since, limit=REPLAY_LIMIT):
+    """
+    Up to limit + 1 live messages of the room after the (timestamp, id)
+    `since`, oldest first, for a reconnecting socket to catch up on.
+    """
+    timestamp, pk = since
+    messages = (ChatMessage.objects
+                .filter(room_id=room_id)
+                .filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk))
+                .select_related("sender__profile")
+                .order_by("timestamp", "id"))
+    return [message async for message in messages[:limit + 1]]
+
+
+def message_payload(pk, content, display_name, timestamp):
+    """
+    A message as sent to clients. `cursor` is what a client passes back as
+    `since` when it reconnects; `id` is None for messages still in the
+    write-behind buffer.
+    """
+    return {
+        "id": pk,
+        "message": content,
+        "display_name": display_name,
+        "timestamp": timestamp.isoformat(),
+        "cursor": encode_cursor(timestamp, pk or 0),
+    }
+
+
+def message_data(message):
+    return message_payload(message.pk, message.content,
+                           message.sender.profile.public_name,
+                           message.timestamp)
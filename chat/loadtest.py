@@ -0,0 +1,271 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import Counter
+
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+
+from accounts.models import UserProfile
+from . import buffer
+from .benchmark import summarize
+from .models import ChatRoom
+
+# Load test of the chat websocket stack in one process: simulated clients
+# connect to elearn.asgi.application across a number of rooms, each sends
+# its messages at a steady pace, and every client records when each
+# message of its room arrives. Messages carry their send time, so the
+# latency is the end-to-end time from a client's send to every member's
+# receive. Used by the chat_loadtest command.
+#
+# A room's clients wait for its members' messages until the --timeout
+# deadline (and are reported as timed out if they're still waiting then),
+# but not for those of members the server disconnected.
+#
+# The clients share the process (and its CPU) with the server, and the
+# in-memory channel layer sweeps every channel for expiry on each send, so
+# absolute figures at high client counts are pessimistic; they're meant
+# for comparing runs. --configured-layer runs against Redis instead.
+
+
+def create_fixtures(rooms, clients_per_room):
+    """Throwaway rooms and users, tagged so they can be removed after."""
+    tag = uuid.uuid4().hex[:12]
+    User = get_user_model()
+    users = User.objects.bulk_create([
+        User(username=f"load-{tag}-{i}")
+        for i in range(rooms * clients_per_room)
+    ])
+    # bulk_create skips the signal that creates profiles
+    UserProfile.objects.bulk_create([
+        UserProfile(user=user, public_name=user.username) for user in users
+    ])
+    chat_rooms = ChatRoom.objects.bulk_create([
+        ChatRoom(name=f"load-{tag}-{i}", description="load test")
+        for i in range(rooms)
+    ])
+    groups = [
+        (room, users[i * clients_per_room:(i + 1) * clients_per_room])
+        for i, room in enumerate(chat_rooms)
+    ]
+    return tag, groups
+
+
+def delete_fixtures(tag):
+    ChatRoom.objects.filter(name__startswith=f"load-{tag}-").delete()
+    get_user_model().objects.filter(username__startswith=f"load-{tag}-").delete()
+
+
+class Room:
+    """The clients of a room, and a wake-up for whoever waits on them."""
+
+    def __init__(self, clients):
+        self.clients = clients
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self, deadline):
+        """
+        Until every connected client has all the messages it waits for,
+        or the deadline; clients still waiting then are timed out.
+        """
+        live = [client for client in self.clients if client.connected]
+        while not all(client.caught_up(self) for client in live):
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait(), deadline - time.perf_counter())
+            except asyncio.TimeoutError:
+                for client in live:
+                    client.timed_out = not client.caught_up(self)
+                return
+
+
+class Client:
+    def __init__(self, application, room, user, index):
+        self.comm = WebsocketCommunicator(application, f"/ws/chat/{room.id}/")
+        self.comm.scope["user"] = user
+        self.index = index
+        self.connected = False
+        self.closed_by_server = False
+        self.sending = False
+        self.sent = 0
+        self.timed_out = False
+        self.latencies = []
+        self.received = 0
+        self.received_from = Counter()
+        self.errors = 0
+
+    async def connect(self, timeout):
+        try:
+            self.connected, _ = await self.comm.connect(timeout=timeout)
+        except asyncio.TimeoutError:
+            self.connected = False
+        self.sending = self.connected
+        return self.connected
+
+    async def send(self, room, count, interval):
+        try:
+            for _ in range(count):
+                if self.closed_by_server:
+                    return
+                await self.comm.send_to(text_data=json.dumps(
+                    {"message": f"{self.index} {time.perf_counter():.9f}"}))
+                self.sent += 1
+                await asyncio.sleep(interval)
+        finally:
+            self.sending = False
+            room.notify()
+
+    def awaited(self, room):
+        """
+        {sender index: messages} this client waits for: everything its
+        room's members sent and weren't throttled for, except from members
+        the server disconnected, whose last messages may never go out.
+        """
+        if self.closed_by_server:
+            return {}
+        return {
+            sender.index: sender.sent - sender.errors
+            for sender in room.clients
+            if sender.connected and not sender.closed_by_server
+        }
+
+    def caught_up(self, room):
+        if self.closed_by_server:
+            return True
+        if any(sender.sending and not sender.closed_by_server
+               for sender in room.clients):
+            return False
+        return all(self.received_from[index] >= count
+                   for index, count in self.awaited(room).items())
+
+    async def read(self, room):
+        # runs until cancelled by drive(): a receive_output timeout would
+        # cancel the application, and a later disconnect() with it
+        while True:
+            output = await self.comm.receive_output(timeout=None)
+            arrived = time.perf_counter()
+            if output["type"] == "websocket.close":
+                # throttled out or shed for lagging (chat.throttle)
+                self.closed_by_server = True
+                room.notify()
+                return
+            data = json.loads(output["text"])
+            if "message" not in data:
+                self.errors += 1
+                room.notify()
+                continue
+            sender, sent_at = data["message"].split()
+            self.received += 1
+            self.received_from[int(sender)] += 1
+            self.latencies.append((arrived - float(sent_at)) * 1000)
+            if not self.sending and self.caught_up(room):
+                room.notify()
+
+    async def close(self):
+        if self.connected and not self.closed_by_server:
+            try:
+                await self.comm.disconnect()
+            except asyncio.CancelledError:
+                # the application is already gone; nothing to close
+                pass
+
+
+async def _gather_limited(coros, limit):
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+    return await asyncio.gather(*(run(coro) for coro in coros))
+
+
+async def drive(application, groups, messages, interval, concurrency, timeout):
+    rooms = []
+    index = 0
+    for room, users in groups:
+        clients = []
+        for user in users:
+            clients.append(Client(application, room, user, index))
+            index += 1
+        rooms.append(Room(clients))
+    clients = [client for room in rooms for client in room.clients]
+
+    started = time.perf_counter()
+    await _gather_limited(
+        (client.connect(timeout) for client in clients), concurrency)
+    connect_seconds = time.perf_counter() - started
+    connected = [client for client in clients if client.connected]
+
+    started = time.perf_counter()
+    deadline = started + timeout
+    readers, tasks = [], []
+    for room in rooms:
+        for client in room.clients:
+            if client.connected:
+                readers.append(asyncio.ensure_future(client.read(room)))
+                tasks.append(client.send(room, messages, interval))
+        tasks.append(room.wait(deadline))
+    await asyncio.gather(*tasks)
+    for reader in readers:
+        reader.cancel()
+    for result in await asyncio.gather(*readers, return_exceptions=True):
+        if isinstance(result, Exception):
+            raise result
+    message_seconds = time.perf_counter() - started
+
+    await asyncio.gather(*(client.close() for client in clients))
+    # write-behind messages must land before their rooms are deleted
+    await buffer.message_buffer.flush()
+
+    sent = sum(client.sent for client in clients)
+    delivered = sum(client.received for client in clients)
+    expected = sum(
+        sum(client.awaited(room).values())
+        for room in rooms for client in room.clients if client.connected)
+    latencies = [ms for client in clients for ms in client.latencies]
+    return {
+        "connect": {
+            "clients": len(clients),
+            "connected": len(connected),
+            "seconds": round(connect_seconds, 3),
+            "per_second": round(len(connected) / connect_seconds, 1)
+            if connect_seconds else 0.0,
+        },
+        "messages": {
+            "sent": sent,
+            "expected": expected,
+            "delivered": delivered,
+            "throttled": sum(client.errors for client in clients),
+            "disconnected": sum(client.closed_by_server for client in clients),
+            "timed_out": sum(client.timed_out for client in clients),
+            "seconds": round(message_seconds, 3),
+            "sent_per_second": round(sent / message_seconds, 1)
+            if message_seconds else 0.0,
+            "delivered_per_second": round(delivered / message_seconds, 1)
+            if message_seconds else 0.0,
+        },
+        "latency_ms": summarize(latencies),
+    }
+
+
+def run_load_test(application, rooms, clients_per_room, messages,
+                  interval=0.1, concurrency=200, timeout=60):
+    """Create the fixtures, drive the clients and report the results."""
+    tag, groups = create_fixtures(rooms, clients_per_room)
+    try:
+        results = asyncio.run(drive(
+            application, groups, messages, interval, concurrency, timeout))
+    finally:
+        delete_fixtures(tag)
+    results["config"] = {
+        "rooms": rooms,
+        "clients_per_room": clients_per_room,
+        "messages_per_client": messages,
+        "interval": interval,
+    }
+    return results
@@ -0,0 +1,53 @@
+import json
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from chat.benchmark import IN_MEMORY_LAYER, UNLIMITED, run_benchmark
+from chat.models import ChatRoom
+
+
+class Command(BaseCommand):
+    help = ('Compare receive-to-broadcast latency of the chat consumer with '
+            'thread-pool and async ORM writes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500,
+                            help='Timed messages per variant')
+        parser.add_argument('--warmup', type=int, default=20,
+                            help='Untimed messages sent first')
+        parser.add_argument('--configured-layer', action='store_true',
+                            help='Use CHANNEL_LAYERS instead of an in-memory layer')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        # a throwaway room and users; deleting them takes the messages too
+        tag = uuid.uuid4().hex[:12]
+        User = get_user_model()
+        sender = User.objects.create_user(f'bench-sender-{tag}')
+        listener = User.objects.create_user(f'bench-listener-{tag}')
+        room = ChatRoom.objects.create(name=f'benchmark-{tag}')
+        # measure the write path, not the flood control
+        overrides = {'CHAT_WRITE_BEHIND': False, 'CHAT_RATE': UNLIMITED,
+                     'CHAT_USER_RATE': UNLIMITED, 'CHAT_MAX_BACKLOG': float('inf')}
+        if not options['configured_layer']:
+            overrides['CHANNEL_LAYERS'] = IN_MEMORY_LAYER
+        try:
+            with override_settings(**overrides):
+                results = run_benchmark(room.id, sender, listener,
+                                        options['messages'], options['warmup'])
+        finally:
+            room.delete()
+            User.objects.filter(pk__in=[sender.pk, listener.pk]).delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:12} p50 {stats['p50_ms']:8.3f} ms  "
+                f"p99 {stats['p99_ms']:8.3f} ms  "
+                f"mean {stats['mean_ms']:8.3f} ms  ({stats['count']} messages)")
@@ -0,0 +1,56 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from chat.benchmark import IN_MEMORY_LAYER, UNLIMITED
+from chat.loadtest import run_load_test
+
+
+class Command(BaseCommand):
+    help = ('Drive simulated websocket clients across chat rooms and report '
+            'connect rate, throughput and end-to-end latency as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=50)
+        parser.add_argument('--clients', type=int, default=20,
+                            help='Clients per room')
+        parser.add_argument('--messages', type=int, default=5,
+                            help='Messages sent by each client')
+        parser.add_argument('--interval', type=float, default=0.1,
+                            help='Seconds between a client\'s messages')
+        parser.add_argument('--concurrency', type=int, default=200,
+                            help='Connections opened at once')
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='Seconds to wait for connects and deliveries')
+        parser.add_argument('--write-behind', action='store_true',
+                            help='Persist through the write-behind buffer')
+        parser.add_argument('--throttle', action='store_true',
+                            help='Keep the configured rate limits')
+        parser.add_argument('--configured-layer', action='store_true',
+                            help='Use CHANNEL_LAYERS instead of an in-memory layer')
+        parser.add_argument('--output', help='Also write the JSON report here')
+
+    def handle(self, *args, **options):
+        # imported here so the ASGI stack is only built when the test runs
+        from elearn.asgi import application
+
+        overrides = {'CHAT_WRITE_BEHIND': options['write_behind']}
+        if not options['throttle']:
+            overrides.update(CHAT_RATE=UNLIMITED, CHAT_USER_RATE=UNLIMITED)
+        if not options['configured_layer']:
+            overrides['CHANNEL_LAYERS'] = IN_MEMORY_LAYER
+        with override_settings(**overrides):
+            results = run_load_test(
+                application, options['rooms'], options['clients'],
+                options['messages'], interval=options['interval'],
+                concurrency=options['concurrency'], timeout=options['timeout'])
+        results['config'].update(
+            write_behind=options['write_behind'], throttle=options['throttle'],
+            channel_layer='configured' if options['configured_layer'] else 'memory')
+
+        report = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report + '\n')
+        self.stdout.write(report)
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 
 class ChatRoom(models.Model):
@@ -27,11 +28,42 @@ class ChatMessage(models.Model):
         related_name="chat_messages",
     )
     content = models.CharField(max_length=512)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # set when the message arrives, which may be before it's written
+    # (chat.buffer)
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ["timestamp"]  # optional: oldest→newest
-        indexes = [models.Index(fields=["timestamp"])]  # optional performance
+        indexes = [
+            models.Index(fields=["timestamp"]),  # archival sweeps
+            models.Index(fields=["room", "timestamp"]),  # room history
+        ]
 
     def __str__(self):
         return f"{self.sender} @ {self.room}: {self.content[:30]}"
+
+
+class ChatArchiveSegment(models.Model):
+    """
+    A run of a room's messages moved out of ChatMessage by chat.archive,
+    stored as one gzipped JSON-lines file. first/last bound the
+    (timestamp, id) range it covers.
+    """
+    room = models.ForeignKey(
+        ChatRoom,
+        on_delete=models.CASCADE,
+        related_name="archive_segments",
+    )
+    path = models.CharField(max_length=255)
+    message_count = models.PositiveIntegerField()
+    first_id = models.BigIntegerField()
+    first_timestamp = models.DateTimeField()
+    last_id = models.BigIntegerField()
+    last_timestamp = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["room", "first_timestamp"])]
+
+    def __str__(self):
+        return f"{self.room} archive {self.first_id}-{self.last_id}"
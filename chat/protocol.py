@@ -0,0 +1,49 @@
+import json
+
+import msgpack
+
+# Wire format of the chat socket. A message is encoded once, by the
+# consumer that receives it, in both formats; the group event carries the
+# encoded frames and every member's consumer writes its format straight
+# to the socket. Clients get JSON text frames unless they offer the
+# MSGPACK subprotocol when connecting, in which case frames both ways are
+# binary msgpack.
+
+JSON = "chat.json"
+MSGPACK = "chat.msgpack"
+
+
+def negotiate(offered):
+    """The subprotocol to accept from those the client offered, or None."""
+    for protocol in offered:
+        if protocol in (MSGPACK, JSON):
+            return protocol
+    return None
+
+
+def encode_frames(payload):
+    return {
+        "text": json.dumps(payload),
+        "bytes": msgpack.packb(payload),
+    }
+
+
+def frame(payload, binary):
+    """send() arguments for a frame to one client."""
+    if binary:
+        return {"bytes_data": msgpack.packb(payload)}
+    return {"text_data": json.dumps(payload)}
+
+
+def decode_frame(text_data=None, bytes_data=None):
+    """The client's message dict; ValueError if the frame isn't one."""
+    try:
+        if bytes_data is not None:
+            data = msgpack.unpackb(bytes_data)
+        else:
+            data = json.loads(text_data)
+    except (TypeError, ValueError, msgpack.UnpackException) as e:
+        raise ValueError("malformed frame") from e
+    if not isinstance(data, dict):
+        raise ValueError("malformed frame")
+    return data
@@ -0,0 +1,12 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import ChatArchiveSegment
+
+
+@receiver(post_delete, sender=ChatArchiveSegment)
+def archive_segment_deleted(sender, instance, **kwargs):
+    # a deleted room takes its archive files with it
+    transaction.on_commit(lambda: default_storage.delete(instance.path))
@@ -0,0 +1,7 @@
+from celery import shared_task
+from .archive import archive_messages
+
+
+@shared_task
+def archive_chat_messages():
+    return archive_messages()
@@ -0,0 +1,113 @@
+from datetime import timedelta
+
+import factory
+import pytest
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from accounts.factories import UserFactory
+from chat import archive
+from chat.archive import archive_messages
+from chat.factories import ChatMessageFactory, ChatRoomFactory
+from chat.history import message_page
+from chat.models import ChatArchiveSegment, ChatMessage
+
+
+@pytest.fixture(autouse=True)
+def media(settings, tmp_path, monkeypatch):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.CHAT_ARCHIVE_AFTER_DAYS = 30
+    monkeypatch.setattr(archive, "SEGMENT_SIZE", 4)
+    archive._segment_rows.cache_clear()
+
+
+def _messages(room, count, age_days):
+    senders = UserFactory.create_batch(2)
+    messages = ChatMessageFactory.create_batch(
+        count, room=room, sender=factory.Iterator(senders))
+    ChatMessage.objects.filter(pk__in=[m.pk for m in messages]).update(
+        timestamp=timezone.now() - timedelta(days=age_days))
+    return messages
+
+
+@pytest.mark.django_db
+def test_archive_moves_old_messages_into_segments():
+    room, other = ChatRoomFactory(), ChatRoomFactory()
+    old = _messages(room, 10, age_days=40)
+    recent = _messages(room, 3, age_days=1)
+    _messages(other, 2, age_days=40)
+
+    assert archive_messages() == 12
+
+    live = set(ChatMessage.objects.values_list("id", flat=True))
+    assert live == {m.id for m in recent}
+    segments = ChatArchiveSegment.objects.filter(room=room).order_by("first_id")
+    assert [s.message_count for s in segments] == [4, 4, 2]
+    assert segments[0].first_id == old[0].id
+    assert segments[2].last_id == old[-1].id
+    assert all(default_storage.exists(s.path) for s in segments)
+    # a second run has nothing left to do
+    assert archive_messages() == 0
+
+
+@pytest.mark.django_db
+def test_archive_rolls_back_when_rows_change_underneath(monkeypatch):
+    room = ChatRoomFactory()
+    old = _messages(room, 3, age_days=40)
+    encode = archive.encode_segment
+
+    def racing_encode(rows):
+        # another run (or a user deletion) takes one of the rows meanwhile
+        ChatMessage.objects.filter(pk=old[0].pk).delete()
+        return encode(rows)
+    monkeypatch.setattr(archive, "encode_segment", racing_encode)
+
+    with pytest.raises(RuntimeError):
+        archive_messages()
+    assert not ChatArchiveSegment.objects.exists()
+    assert ChatMessage.objects.count() == 3
+    # the segment file was removed again
+    assert default_storage.listdir(f"{archive.ARCHIVE_DIR}/{room.id}")[1] == []
+
+
+@pytest.mark.django_db
+def test_history_reads_through_archived_segments():
+    room = ChatRoomFactory()
+    old = _messages(room, 10, age_days=40)
+    recent = _messages(room, 3, age_days=1)
+    archive_messages()
+
+    seen, cursor = message_page(room.id, limit=5)
+    while cursor:
+        page, cursor = message_page(room.id, before=cursor, limit=5)
+        seen = page + seen
+
+    assert [m.id for m in seen] == [m.id for m in old + recent]
+    assert [m.content for m in seen] == [m.content for m in old + recent]
+    assert seen[0].sender.profile.public_name == old[0].sender.profile.public_name
+
+
+@pytest.mark.django_db
+def test_archived_messages_of_deleted_users_are_dropped():
+    room = ChatRoomFactory()
+    old = _messages(room, 4, age_days=40)
+    archive_messages()
+    old[0].sender.delete()
+
+    page, cursor = message_page(room.id)
+
+    assert [m.id for m in page] == [m.id for m in old if m.sender_id != old[0].sender_id]
+    assert cursor is None
+
+
+@pytest.mark.django_db
+def test_deleting_room_removes_archive_files(django_capture_on_commit_callbacks):
+    room = ChatRoomFactory()
+    _messages(room, 5, age_days=40)
+    archive_messages()
+    paths = list(ChatArchiveSegment.objects.values_list("path", flat=True))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        room.delete()
+
+    assert paths and not any(default_storage.exists(p) for p in paths)
@@ -0,0 +1,30 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from chat.benchmark import percentile
+from chat.models import ChatMessage, ChatRoom
+
+
+def test_percentile_is_nearest_rank():
+    samples = list(range(1, 101))
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 99) == 99
+    assert percentile([7], 99) == 7
+    assert percentile([], 50) == 0.0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_chat_benchmark_reports_both_variants_and_cleans_up():
+    out = StringIO()
+    call_command("chat_benchmark", messages=5, warmup=1, json=True, stdout=out)
+
+    results = json.loads(out.getvalue())
+    assert set(results) == {"thread_pool", "async_orm"}
+    for stats in results.values():
+        assert stats["count"] == 5
+        assert 0 < stats["p50_ms"] <= stats["p99_ms"]
+    assert not ChatRoom.objects.exists()
+    assert not ChatMessage.objects.exists()
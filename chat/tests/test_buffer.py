@@ -0,0 +1,178 @@
+import asyncio
+
+import pytest
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.urls import reverse
+
+from accounts.factories import UserFactory
+from chat import buffer, consumers
+from chat.buffer import MessageBuffer
+from chat.factories import ChatRoomFactory
+from chat.models import ChatMessage
+from elearn.asgi import application
+
+
+@pytest.fixture
+def message_buffer(monkeypatch, settings):
+    settings.CHAT_WRITE_BEHIND = True
+    settings.CHAT_FLUSH_BATCH = 3
+    settings.CHAT_FLUSH_INTERVAL_MS = 50
+    fresh = MessageBuffer()
+    monkeypatch.setattr(buffer, "message_buffer", fresh)
+    monkeypatch.setattr(consumers, "message_buffer", fresh)
+    return fresh
+
+
+def _count(room):
+    return sync_to_async(ChatMessage.objects.filter(room=room).count)()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_write_behind_broadcasts_then_flushes(message_buffer):
+    user = await sync_to_async(UserFactory.create)()
+    room = await sync_to_async(ChatRoomFactory.create)()
+
+    comm = WebsocketCommunicator(application, f"/ws/chat/{room.id}/")
+    try:
+        comm.scope["user"] = user
+        ok, _ = await comm.connect()
+        assert ok
+
+        for text in ("one", "two"):
+            await comm.send_json_to({"message": text})
+            resp = await comm.receive_json_from(timeout=1.0)
+            assert resp["message"] == text
+        # broadcast, but not written until the interval passes
+        assert await _count(room) == 0
+        assert message_buffer.metrics()["depth"] == 2
+
+        await asyncio.sleep(0.2)
+        assert await _count(room) == 2
+
+        # a full batch is written without waiting
+        for text in ("3", "4", "5"):
+            await comm.send_json_to({"message": text})
+            await comm.receive_json_from(timeout=1.0)
+        assert await _count(room) == 5
+        contents = await sync_to_async(list)(
+            ChatMessage.objects.filter(room=room)
+            .order_by("timestamp", "id").values_list("content", flat=True))
+        assert contents == ["one", "two", "3", "4", "5"]
+        assert message_buffer.metrics()["flushes"] == 2
+    finally:
+        await comm.disconnect()
+
+
+@pytest.mark.django_db
+def test_flush_sync_writes_pending_messages(message_buffer):
+    user = UserFactory()
+    room = ChatRoomFactory()
+    message_buffer.pending = [
+        ChatMessage(sender=user, room=room, content=str(i)) for i in range(2)]
+
+    assert message_buffer.flush_sync() == 2
+
+    assert ChatMessage.objects.filter(room=room).count() == 2
+    metrics = message_buffer.metrics()
+    assert metrics["depth"] == 0 and metrics["flushed"] == 2
+
+
+@pytest.mark.django_db
+def test_failed_flush_keeps_messages(message_buffer, monkeypatch):
+    user = UserFactory()
+    room = ChatRoomFactory()
+    message_buffer.pending = [ChatMessage(sender=user, room=room, content="x")]
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("db down")
+    monkeypatch.setattr(ChatMessage.objects, "bulk_create", fail)
+
+    assert message_buffer.flush_sync() == 0
+    assert message_buffer.metrics()["depth"] == 1
+    assert message_buffer.failures == 1
+
+
+@pytest.mark.django_db
+def test_failed_messages_are_dropped_after_max_attempts(message_buffer, monkeypatch):
+    user = UserFactory()
+    room = ChatRoomFactory()
+    message_buffer.pending = [ChatMessage(sender=user, room=room, content="x")]
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("db down")
+    monkeypatch.setattr(ChatMessage.objects, "bulk_create", fail)
+
+    for _ in range(buffer.MAX_ATTEMPTS):
+        message_buffer.flush_sync()
+    assert message_buffer.metrics()["depth"] == 0
+    assert message_buffer.dropped == 1
+
+
+@pytest.mark.django_db
+def test_requeued_messages_are_capped(message_buffer, monkeypatch, settings):
+    settings.CHAT_BUFFER_MAX = 2
+    user = UserFactory()
+    room = ChatRoomFactory()
+    message_buffer.pending = [
+        ChatMessage(sender=user, room=room, content=str(i)) for i in range(3)]
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("db down")
+    monkeypatch.setattr(ChatMessage.objects, "bulk_create", fail)
+
+    message_buffer.flush_sync()
+    # the oldest is dropped
+    assert [m.content for m in message_buffer.pending] == ["1", "2"]
+    assert message_buffer.dropped == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_rejected_rows_are_dropped_and_the_rest_written(message_buffer):
+    user = UserFactory()
+    room = ChatRoomFactory()
+    gone = ChatRoomFactory()
+    gone_id = gone.id
+    gone.delete()
+    message_buffer.pending = [
+        ChatMessage(sender=user, room_id=gone_id, content="lost"),
+        ChatMessage(sender=user, room=room, content="kept"),
+    ]
+
+    assert message_buffer.flush_sync() == 1
+    assert message_buffer.dropped == 1
+    assert message_buffer.metrics()["depth"] == 0
+    assert list(ChatMessage.objects.values_list("content", flat=True)) == ["kept"]
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_message_queued_during_a_flush_is_flushed(message_buffer, monkeypatch):
+    user = await sync_to_async(UserFactory.create)()
+    room = await sync_to_async(ChatRoomFactory.create)()
+    bulk_create = ChatMessage.objects.abulk_create
+
+    async def slow_bulk_create(*args, **kwargs):
+        await asyncio.sleep(0.1)
+        return await bulk_create(*args, **kwargs)
+    monkeypatch.setattr(ChatMessage.objects, "abulk_create", slow_bulk_create)
+
+    await message_buffer.add(ChatMessage(sender=user, room=room, content="1"))
+    # the timed flush is now waiting on the database
+    await asyncio.sleep(0.08)
+    await message_buffer.add(ChatMessage(sender=user, room=room, content="2"))
+
+    await asyncio.sleep(0.5)
+    assert await _count(room) == 2
+    assert message_buffer.metrics()["depth"] == 0
+
+
+@pytest.mark.django_db
+def test_buffer_metrics_are_staff_only(client, message_buffer):
+    url = reverse("chat:buffer_metrics")
+    client.force_login(UserFactory())
+    assert client.get(url).status_code == 403
+
+    client.force_login(UserFactory(is_staff=True))
+    assert client.get(url).json()["depth"] == 0
@@ -1,7 +1,11 @@
+import factory
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from accounts.factories import UserFactory
-from chat.factories import ChatRoomFactory
+from chat.factories import ChatMessageFactory, ChatRoomFactory
+from chat.history import HISTORY_PAGE, message_page
 
 
 @pytest.mark.django_db
@@ -19,3 +23,67 @@ def test_user_subscription_post(client):
     resp = client.post(url, {"action": "subscribe"})
     assert resp.status_code == 302
     assert user in room.members.all()
+
+
+def _fill(room, count):
+    senders = UserFactory.create_batch(3)
+    return ChatMessageFactory.create_batch(
+        count, room=room, sender=factory.Iterator(senders))
+
+
+@pytest.mark.django_db
+def test_room_page_renders_newest_page_only(client):
+    user = UserFactory()
+    room = ChatRoomFactory()
+    messages = _fill(room, HISTORY_PAGE + 10)
+    client.force_login(user)
+
+    resp = client.get(reverse("chat:chat_room", kwargs={"room_id": room.id}))
+
+    shown = resp.context["messages"]
+    assert [m.id for m in shown] == [m.id for m in messages[-HISTORY_PAGE:]]
+    assert resp.context["history_cursor"]
+
+
+@pytest.mark.django_db
+def test_room_page_queries_do_not_grow_with_history(client):
+    user = UserFactory()
+    small, large = ChatRoomFactory(), ChatRoomFactory()
+    _fill(small, HISTORY_PAGE + 1)
+    _fill(large, HISTORY_PAGE * 3)
+    client.force_login(user)
+
+    counts = []
+    for room in (small, large):
+        with CaptureQueriesContext(connection) as ctx:
+            client.get(reverse("chat:chat_room", kwargs={"room_id": room.id}))
+        counts.append(len(ctx))
+    assert counts[0] == counts[1]
+
+
+@pytest.mark.django_db
+def test_history_pages_back_to_the_first_message(client):
+    user = UserFactory()
+    room = ChatRoomFactory()
+    messages = _fill(room, 25)
+    client.force_login(user)
+    url = reverse("chat:chat_history", kwargs={"room_id": room.id})
+
+    _, cursor = message_page(room.id, limit=10)
+    seen = []
+    while cursor:
+        data = client.get(url, {"before": cursor, "limit": 10}).json()
+        seen = [m["id"] for m in data["messages"]] + seen
+        cursor = data["next"]
+
+    assert seen == [m.id for m in messages[:15]]
+
+
+@pytest.mark.django_db
+def test_history_rejects_bad_cursor(client):
+    client.force_login(UserFactory())
+    room = ChatRoomFactory()
+    url = reverse("chat:chat_history", kwargs={"room_id": room.id})
+
+    assert client.get(url, {"before": "garbage"}).status_code == 400
+    assert client.get(url, {"limit": "0"}).status_code == 400
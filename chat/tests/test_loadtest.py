@@ -0,0 +1,59 @@
+import json
+from io import StringIO
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+
+from chat.models import ChatMessage, ChatRoom
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize("write_behind", [False, True])
+def test_chat_loadtest_reports_json_and_cleans_up(tmp_path, write_behind):
+    out = StringIO()
+    report = tmp_path / "report.json"
+    call_command("chat_loadtest", rooms=2, clients=3, messages=2,
+                 interval=0.01, timeout=10, write_behind=write_behind,
+                 output=str(report), stdout=out)
+
+    results = json.loads(out.getvalue())
+    assert json.loads(report.read_text()) == results
+    assert results["connect"]["connected"] == 6
+    # every client gets every message of its room, its own included
+    assert results["messages"]["sent"] == 12
+    assert results["messages"]["delivered"] == results["messages"]["expected"] == 36
+    latency = results["latency_ms"]
+    assert latency["count"] == 36
+    assert 0 < latency["p50_ms"] <= latency["p95_ms"] <= latency["p99_ms"]
+    assert results["config"]["write_behind"] is write_behind
+
+    assert not ChatRoom.objects.exists()
+    assert not ChatMessage.objects.exists()
+    assert not get_user_model().objects.filter(username__startswith="load-").exists()
+
+
+def _run(**options):
+    out = StringIO()
+    call_command("chat_loadtest", stdout=out, **options)
+    return json.loads(out.getvalue())["messages"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_chat_loadtest_reports_clients_that_time_out():
+    # still sending at the deadline
+    messages = _run(rooms=1, clients=2, messages=2, interval=0.5, timeout=0.3)
+    assert messages["timed_out"] == 2
+    assert messages["disconnected"] == 0
+    assert not ChatRoom.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_chat_loadtest_stops_waiting_for_disconnected_clients(settings):
+    # every consumer is shed on its first message
+    settings.CHAT_MAX_BACKLOG = -1
+    messages = _run(rooms=1, clients=3, messages=5, interval=0.01, timeout=10)
+    assert messages["disconnected"] == 3
+    assert messages["timed_out"] == 0
+    assert messages["expected"] == 0
+    assert messages["seconds"] < 5
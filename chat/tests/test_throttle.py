@@ -0,0 +1,128 @@
+
+import pytest
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+
+from accounts.factories import UserFactory
+from chat import throttle
+from chat.factories import ChatRoomFactory
+from chat.models import ChatMessage
+from chat.throttle import LocalUserBuckets, SharedUserBuckets, TokenBucket
+from elearn.asgi import application
+
+
+@pytest.fixture(autouse=True)
+def fresh_buckets(monkeypatch):
+    monkeypatch.setattr(throttle, "local_user_buckets", LocalUserBuckets())
+    cache.clear()
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(rate=2, burst=3, now=0)
+
+    assert [bucket.take(now=0) for _ in range(4)] == [True, True, True, False]
+    assert bucket.retry_after() == pytest.approx(0.5)
+    assert bucket.take(now=0.5)
+    assert not bucket.take(now=0.5)
+    # never refills past the burst
+    assert [bucket.take(now=100) for _ in range(4)] == [True, True, True, False]
+
+
+@pytest.mark.asyncio
+async def test_local_user_buckets_are_per_user(settings):
+    settings.CHAT_USER_RATE = (1, 2)
+    buckets = LocalUserBuckets()
+
+    assert [await buckets.take(1, now=0) for _ in range(3)] == [True, True, False]
+    assert await buckets.take(2, now=0)
+
+
+@pytest.mark.asyncio
+async def test_shared_user_buckets_count_per_window(settings):
+    settings.CHAT_USER_RATE = (1, 2)
+    buckets = SharedUserBuckets()
+
+    assert [await buckets.take(1, now=10) for _ in range(3)] == [True, True, False]
+    assert await buckets.take(2, now=10)
+    # the next window starts afresh
+    assert await buckets.take(1, now=12)
+
+
+async def _connect(room, user):
+    comm = WebsocketCommunicator(application, f"/ws/chat/{room.id}/")
+    comm.scope["user"] = user
+    ok, _ = await comm.connect()
+    assert ok
+    return comm
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_flooding_connection_is_throttled_then_closed(settings):
+    settings.CHAT_RATE = (0.001, 2)
+    settings.CHAT_STRIKES = (0.001, 2)
+    user = await sync_to_async(UserFactory.create)()
+    room = await sync_to_async(ChatRoomFactory.create)()
+    comm = await _connect(room, user)
+    try:
+        for text in ("one", "two"):
+            await comm.send_json_to({"message": text})
+            assert (await comm.receive_json_from(timeout=1.0))["message"] == text
+
+        for _ in range(2):
+            await comm.send_json_to({"message": "spam"})
+            reply = await comm.receive_json_from(timeout=1.0)
+            assert reply["error"] == "throttled" and reply["retry_after"] > 0
+
+        await comm.send_json_to({"message": "spam"})
+        assert await comm.receive_output(timeout=1.0) == {
+            "type": "websocket.close", "code": 1008}
+
+        saved = await sync_to_async(list)(
+            ChatMessage.objects.filter(room=room).values_list("content", flat=True))
+        assert sorted(saved) == ["one", "two"]
+    finally:
+        await comm.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_user_limit_spans_connections(settings):
+    settings.CHAT_USER_RATE = (0.001, 1)
+    user = await sync_to_async(UserFactory.create)()
+    room = await sync_to_async(ChatRoomFactory.create)()
+    first, second = await _connect(room, user), await _connect(room, user)
+    try:
+        await first.send_json_to({"message": "hello"})
+        assert (await first.receive_json_from(timeout=1.0))["message"] == "hello"
+        assert (await second.receive_json_from(timeout=1.0))["message"] == "hello"
+
+        await second.send_json_to({"message": "again"})
+        assert (await second.receive_json_from(timeout=1.0))["error"] == "throttled"
+    finally:
+        await first.disconnect()
+        await second.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_consumer_with_a_backlog_is_shed(settings):
+    settings.CHAT_MAX_BACKLOG = 2
+    user = await sync_to_async(UserFactory.create)()
+    room = await sync_to_async(ChatRoomFactory.create)()
+    comm = await _connect(room, user)
+    try:
+        # queued faster than the consumer takes them
+        for _ in range(10):
+            await get_channel_layer().group_send(f"chat_{room.id}", {
+                "type": "chat_message",
+                "text": '{"message": "burst"}', "bytes": b""})
+
+        output = await comm.receive_output(timeout=1.0)
+        while output["type"] == "websocket.send":
+            output = await comm.receive_output(timeout=1.0)
+        assert output == {"type": "websocket.close", "code": 1013}
+    finally:
+        await comm.disconnect()
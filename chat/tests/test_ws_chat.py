@@ -1,12 +1,21 @@
 
 import asyncio
+import json
+from datetime import datetime, timedelta
+
+import msgpack
 import pytest
 from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
 from channels.testing import WebsocketCommunicator
+from django.utils import timezone
 from elearn.asgi import application
 from accounts.factories import UserFactory
+from accounts.models import UserProfile
+from chat import consumers, protocol
 from chat.factories import ChatRoomFactory
-from chat.models import ChatMessage
+from chat.history import encode_cursor
+from chat.models import ChatArchiveSegment, ChatMessage
 
 
 @pytest.mark.django_db(transaction=True)
@@ -78,3 +87,283 @@ async def test_empty_message_is_ignored():
         except asyncio.CancelledError:
             # App already closed (fine)
             pass
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_too_long_message_is_rejected_before_broadcast():
+    user = await sync_to_async(UserFactory.create)()
+    room = await sync_to_async(ChatRoomFactory.create)()
+
+    comm = WebsocketCommunicator(application, f"/ws/chat/{room.id}/")
+    try:
+        comm.scope["user"] = user
+        ok, _ = await comm.connect()
+        assert ok
+
+        await comm.send_json_to({"message": "x" * 513})
+        resp = await comm.receive_json_from(timeout=1.0)
+        assert resp == {"error": "too_long", "max_length": 512}
+
+        # the next frame is the next message, not a broadcast of the long one
+        await comm.send_json_to({"message": "x" * 512})
+        resp = await comm.receive_json_from(timeout=1.0)
+        assert resp["message"] == "x" * 512
+        count = await sync_to_async(
+            ChatMessage.objects.filter(room=room).count)()
+        assert count == 1
+    finally:
+        await comm.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_connect_to_unknown_room_is_rejected():
+    user = await sync_to_async(UserFactory.create)()
+
+    comm = WebsocketCommunicator(application, "/ws/chat/999999/")
+    comm.scope["user"] = user
+    ok, _ = await comm.connect()
+    assert not ok
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_each_message_is_one_insert_using_connect_time_lookups():
+    user = await sync_to_async(UserFactory.create)()
+    room = await sync_to_async(ChatRoomFactory.create)()
+
+    comm = WebsocketCommunicator(application, f"/ws/chat/{room.id}/")
+    try:
+        comm.scope["user"] = user
+        ok, _ = await comm.connect()
+        assert ok
+        name = await sync_to_async(lambda: user.profile.public_name)()
+
+        # a rename that bypasses the profile signal isn't seen: the name
+        # was resolved on connect, not per message
+        await sync_to_async(
+            UserProfile.objects.filter(user=user).update)(public_name="Changed")
+
+        for text in ("one", "two"):
+            await comm.send_json_to({"message": text})
+            resp = await comm.receive_json_from(timeout=1.0)
+            assert resp["display_name"] == name
+
+        count = await sync_to_async(
+            ChatMessage.objects.filter(room=room, sender=user).count)()
+        assert count == 2
+    finally:
+        await comm.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_msgpack_and_json_clients_share_a_room(monkeypatch):
+    encoded = []
+    encode = protocol.encode_frames
+    monkeypatch.setattr(protocol, "encode_frames",
+                        lambda payload: encoded.append(payload) or encode(payload))
+
+    users = [await sync_to_async(UserFactory.create)() for _ in range(3)]
+    room = await sync_to_async(ChatRoomFactory.create)()
+    path = f"/ws/chat/{room.id}/"
+
+    sender = WebsocketCommunicator(application, path)
+    binary = WebsocketCommunicator(
+        application, path, subprotocols=["chat.msgpack", "chat.json"])
+    text = WebsocketCommunicator(application, path)
+    comms = [sender, binary, text]
+    try:
+        for comm, user in zip(comms, users):
+            comm.scope["user"] = user
+        assert (await sender.connect())[0]
+        assert await binary.connect() == (True, "chat.msgpack")
+        assert (await text.connect())[0]
+
+        await binary.send_to(bytes_data=msgpack.packb({"message": "packed"}))
+
+        frame = await binary.receive_from(timeout=1.0)
+        assert isinstance(frame, bytes)
+        assert msgpack.unpackb(frame)["message"] == "packed"
+        assert (await text.receive_json_from(timeout=1.0))["message"] == "packed"
+        assert (await sender.receive_json_from(timeout=1.0))["message"] == "packed"
+        # encoded by the receiving consumer only, not once per member
+        assert len(encoded) == 1
+    finally:
+        for comm in comms:
+            await comm.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_events_without_encoded_frames_are_still_delivered():
+    user = await sync_to_async(UserFactory.create)()
+    room = await sync_to_async(ChatRoomFactory.create)()
+
+    comm = WebsocketCommunicator(application, f"/ws/chat/{room.id}/")
+    try:
+        comm.scope["user"] = user
+        assert (await comm.connect())[0]
+
+        await get_channel_layer().group_send(f"chat_{room.id}", {
+            "type": "chat_message", "message": "old", "display_name": "Old"})
+
+        assert await comm.receive_json_from(timeout=1.0) == {
+            "message": "old", "display_name": "Old"}
+    finally:
+        await comm.disconnect()
+
+
+async def _send_and_collect(comm, texts):
+    frames = []
+    for text in texts:
+        await comm.send_json_to({"message": text})
+        frames.append(await comm.receive_json_from(timeout=1.0))
+    return frames
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_reconnect_replays_only_missed_messages():
+    user = await sync_to_async(UserFactory.create)()
+    room = await sync_to_async(ChatRoomFactory.create)()
+    path = f"/ws/chat/{room.id}/"
+
+    first = WebsocketCommunicator(application, path)
+    first.scope["user"] = user
+    assert (await first.connect())[0]
+    try:
+        frames = await _send_and_collect(first, ["one", "two", "three"])
+    finally:
+        await first.disconnect()
+    assert all(frame["id"] for frame in frames)
+
+    # the client last saw "one"
+    resumed = WebsocketCommunicator(
+        application, f"{path}?since={frames[0]['cursor']}")
+    resumed.scope["user"] = user
+    assert (await resumed.connect())[0]
+    try:
+        replayed = [await resumed.receive_json_from(timeout=1.0) for _ in range(2)]
+        assert replayed == frames[1:]
+
+        # then live delivery carries on, with nothing replayed twice
+        live = await _send_and_collect(resumed, ["four"])
+        assert live[0]["message"] == "four"
+    finally:
+        await resumed.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_live_events_already_replayed_are_skipped(monkeypatch):
+    user = await sync_to_async(UserFactory.create)()
+    room = await sync_to_async(ChatRoomFactory.create)()
+    path = f"/ws/chat/{room.id}/"
+
+    first = WebsocketCommunicator(application, path)
+    first.scope["user"] = user
+    assert (await first.connect())[0]
+    try:
+        frames = await _send_and_collect(first, ["one", "two"])
+    finally:
+        await first.disconnect()
+
+    missed = consumers.missed_messages
+
+    async def racing_missed_messages(room_id, since):
+        # "two" is still queued as a live event while it's replayed
+        messages = await missed(room_id, since)
+        await get_channel_layer().group_send(f"chat_{room.id}", {
+            "type": "chat_message",
+            "key": [messages[-1].timestamp.isoformat(), messages[-1].pk],
+            "text": json.dumps(frames[1]), "bytes": msgpack.packb(frames[1])})
+        return messages
+    monkeypatch.setattr(consumers, "missed_messages", racing_missed_messages)
+
+    resumed = WebsocketCommunicator(
+        application, f"{path}?since={frames[0]['cursor']}")
+    resumed.scope["user"] = user
+    assert (await resumed.connect())[0]
+    try:
+        assert await resumed.receive_json_from(timeout=1.0) == frames[1]
+        # the queued duplicate was dropped: next comes the next message
+        live = await _send_and_collect(resumed, ["three"])
+        assert live[0]["message"] == "three"
+    finally:
+        await resumed.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_reconnect_too_far_behind_asks_for_resync(monkeypatch):
+    monkeypatch.setattr(consumers, "REPLAY_LIMIT", 1)
+    user = await sync_to_async(UserFactory.create)()
+    room = await sync_to_async(ChatRoomFactory.create)()
+    path = f"/ws/chat/{room.id}/"
+
+    first = WebsocketCommunicator(application, path)
+    first.scope["user"] = user
+    assert (await first.connect())[0]
+    try:
+        frames = await _send_and_collect(first, ["one", "two", "three"])
+    finally:
+        await first.disconnect()
+
+    # messages after this one have been archived
+    year_ago = timezone.now() - timedelta(days=365)
+    await ChatArchiveSegment.objects.acreate(
+        room=room, path="chat/archive/x.jsonl.gz", message_count=1,
+        first_id=1, first_timestamp=year_ago + timedelta(days=1),
+        last_id=1, last_timestamp=year_ago + timedelta(days=1))
+    ancient = encode_cursor(year_ago, 0)
+    for since in (frames[0]["cursor"], ancient):
+        comm = WebsocketCommunicator(application, f"{path}?since={since}")
+        comm.scope["user"] = user
+        assert (await comm.connect())[0]
+        try:
+            assert await comm.receive_json_from(timeout=1.0) == {"resync": True}
+        finally:
+            await comm.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_reconnect_with_naive_cursor_is_not_replayed():
+    user = await sync_to_async(UserFactory.create)()
+    room = await sync_to_async(ChatRoomFactory.create)()
+
+    naive = encode_cursor(datetime(2020, 1, 1), 0)
+    comm = WebsocketCommunicator(
+        application, f"/ws/chat/{room.id}/?since={naive}")
+    comm.scope["user"] = user
+    assert (await comm.connect())[0]
+    try:
+        # treated as no cursor: the first frame is the next live message
+        live = await _send_and_collect(comm, ["hello"])
+        assert live[0]["message"] == "hello"
+    finally:
+        await comm.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_reconnect_to_a_quiet_room_is_replayed_not_resynced():
+    user = await sync_to_async(UserFactory.create)()
+    room = await sync_to_async(ChatRoomFactory.create)()
+    # older than CHAT_ARCHIVE_AFTER_DAYS, but not archived
+    old = await ChatMessage.objects.acreate(
+        sender=user, room=room, content="old",
+        timestamp=timezone.now() - timedelta(days=100))
+
+    since = encode_cursor(old.timestamp, old.pk)
+    comm = WebsocketCommunicator(
+        application, f"/ws/chat/{room.id}/?since={since}")
+    comm.scope["user"] = user
+    assert (await comm.connect())[0]
+    try:
+        live = await _send_and_collect(comm, ["new"])
+        assert live[0]["message"] == "new"
+    finally:
+        await comm.disconnect()
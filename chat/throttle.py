@@ -0,0 +1,127 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Flood control for the chat receive path. Every connection has a token
+# bucket, and so does every user across their connections: in process
+# memory by default, or in the shared cache (CHAT_THROTTLE_SHARED) so the
+# limit holds across daphne processes. Frames over either limit are
+# answered with a throttle notice instead of being saved and broadcast;
+# a connection that keeps going over runs out of strikes and is closed.
+#
+# On the sending side, a consumer with more than CHAT_MAX_BACKLOG room
+# events queued in its channel-layer inbox is too slow to keep up with its
+# room, and is shed rather than left to queue. The depth is read from
+# this process's side of the layer, so it needs no clock agreement between
+# daphne nodes. It covers a consumer that can't hand events to daphne fast
+# enough; a client that reads slowly isn't seen, since ASGI gives the
+# consumer no view of daphne's socket write buffer and send() returns
+# as soon as the frame is queued there.
+
+DEFAULTS = {
+    # messages per second, burst
+    "CHAT_RATE": (5, 10),
+    "CHAT_USER_RATE": (10, 20),
+    # throttled frames allowed per second, burst, before disconnecting
+    "CHAT_STRIKES": (1, 20),
+    # room events queued for one consumer before it's shed
+    "CHAT_MAX_BACKLOG": 100,
+}
+MAX_TRACKED_USERS = 10000
+
+
+def limit(name):
+    return getattr(settings, name, DEFAULTS[name])
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, now=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now):
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now=None):
+        """Spend a token if one is left. Returns whether it was."""
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def retry_after(self):
+        """Seconds until the next token."""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def idle(self, now):
+        # full again, so forgetting it changes nothing
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class LocalUserBuckets:
+    def __init__(self):
+        self.buckets = {}
+
+    async def take(self, user_id, now=None):
+        now = time.monotonic() if now is None else now
+        bucket = self.buckets.get(user_id)
+        if bucket is None:
+            if len(self.buckets) >= MAX_TRACKED_USERS:
+                self.buckets = {uid: b for uid, b in self.buckets.items()
+                                if not b.idle(now)}
+            bucket = self.buckets[user_id] = TokenBucket(
+                *limit("CHAT_USER_RATE"), now=now)
+        return bucket.take(now)
+
+
+class SharedUserBuckets:
+    """
+    The per-user limit kept in the cache, so all processes share it. A
+    counter per window of burst / rate seconds stands in for the bucket:
+    cache.incr is atomic where a read-modify-write of the bucket isn't.
+    """
+
+    async def take(self, user_id, now=None):
+        rate, burst = limit("CHAT_USER_RATE")
+        window = burst / rate
+        now = time.time() if now is None else now
+        key = f"chat:throttle:{user_id}:{math.floor(now / window)}"
+        timeout = math.ceil(window) + 1
+        await cache.aadd(key, 0, timeout)
+        try:
+            return await cache.aincr(key) <= burst
+        except ValueError:
+            # expired between add and incr; count this frame as the first
+            await cache.aadd(key, 1, timeout)
+            return True
+
+
+local_user_buckets = LocalUserBuckets()
+shared_user_buckets = SharedUserBuckets()
+
+
+def backlog(layer, channel):
+    """
+    Events waiting in this process for `channel`, or None if the layer
+    doesn't say: channels_redis keeps them in receive_buffer, the
+    in-memory layer in channels.
+    """
+    for attr in ("receive_buffer", "channels"):
+        queues = getattr(layer, attr, None)
+        if isinstance(queues, dict):
+            queue = queues.get(channel)
+            return queue.qsize() if queue is not None else 0
+    return None
+
+
+def user_buckets():
+    if getattr(settings, "CHAT_THROTTLE_SHARED", False):
+        return shared_user_buckets
+    return local_user_buckets
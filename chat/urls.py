@@ -1,5 +1,7 @@
 from django.urls import path
 from .views import (ChatRoomDetailView,
+                    ChatHistoryView,
+                    ChatBufferMetricsView,
                     ChatRoomListView,
                     ChatCreateOrRedirectView,
                     ChatCreateConfirmView)
@@ -9,6 +11,10 @@ app_name = 'chat'
 urlpatterns = [
     path('', ChatRoomListView.as_view(), name='chat_index'),
     path('<int:room_id>/', ChatRoomDetailView.as_view(), name='chat_room'),
+    path('<int:room_id>/history/', ChatHistoryView.as_view(),
+         name='chat_history'),
+    path('buffer-metrics/', ChatBufferMetricsView.as_view(),
+         name='buffer_metrics'),
     path('create-or-redirect/', ChatCreateOrRedirectView.as_view(),
          name='create_or_redirect'),
     path('create-confirm/',
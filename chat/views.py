@@ -7,6 +7,10 @@ from .models import ChatRoom
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, DetailView, View
 from django.shortcuts import redirect, render
+from django.http import HttpResponseForbidden, JsonResponse
+from .buffer import message_buffer
+from .history import (HISTORY_PAGE, MAX_HISTORY_PAGE, encode_cursor,
+                      message_data, message_page)
 
 
 class ChatRoomListView(LoginRequiredMixin, ListView):
@@ -33,10 +37,15 @@ class ChatRoomDetailView(LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.request.user
-        context['is_member'] = user in self.object.members.all()
-        # Pass all messages for this room, ordered by timestamp
-        context['messages'] = ChatMessage.objects.filter(
-            room=self.object).order_by('timestamp')
+        context['is_member'] = self.object.members.filter(pk=user.pk).exists()
+        # Only the newest page; older history is fetched from
+        # ChatHistoryView as the user scrolls up
+        messages, cursor = message_page(self.object.id)
+        context['messages'] = messages
+        context['history_cursor'] = cursor
+        # where the socket resumes from if it drops (ChatConsumer.replay)
+        context['latest_cursor'] = encode_cursor(
+            messages[-1].timestamp, messages[-1].pk) if messages else ''
         # Pass room_id explicitly for use in template
         context['room_id'] = self.object.id
         return context
@@ -54,6 +63,38 @@ class ChatRoomDetailView(LoginRequiredMixin, DetailView):
         return redirect('chat:chat_room', room_id=self.object.id)
 
 
+class ChatHistoryView(LoginRequiredMixin, View):
+    """
+    One page of older messages as JSON. `before` is the cursor handed out
+    with the previous page; `next` is null once the start of the room is
+    reached.
+    """
+
+    def get(self, request, room_id):
+        room = get_object_or_404(ChatRoom, pk=room_id)
+        try:
+            limit = min(int(request.GET.get('limit', HISTORY_PAGE)),
+                        MAX_HISTORY_PAGE)
+            if limit < 1:
+                raise ValueError(limit)
+            messages, cursor = message_page(
+                room.id, before=request.GET.get('before'), limit=limit)
+        except ValueError:
+            return JsonResponse({'detail': 'Invalid cursor or limit.'}, status=400)
+        return JsonResponse({
+            'messages': [message_data(message) for message in messages],
+            'next': cursor,
+        })
+
+
+class ChatBufferMetricsView(LoginRequiredMixin, View):
+    # write-behind buffer of the process serving the request (chat.buffer)
+    def get(self, request):
+        if not request.user.is_staff:
+            return HttpResponseForbidden()
+        return JsonResponse(message_buffer.metrics())
+
+
 class ChatCreateOrRedirectView(LoginRequiredMixin, View):
     def get(self, request, *args, **kwargs):
         room_name = request.GET.get('room_name', '').strip()
@@ -0,0 +1,125 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Course, CourseActivity, CourseDailyStats, RollupWatermark
+
+# Teacher analytics. Enrollment and feedback events are appended to
+# CourseActivity as they happen (courses.signals) and the periodic
+# rollup_course_activity task folds everything past its watermark into
+# per-course daily totals. Analytics pages read CourseDailyStats only.
+
+ROLLUP_NAME = "course_daily_stats"
+ROLLUP_BATCH = 10000
+# events younger than this are left for the next run: ids are handed out
+# before commit, so a slow transaction could still commit one below the
+# watermark
+SETTLE_SECONDS = 60
+# processed events older than this are deleted from the log
+ACTIVITY_RETENTION = timedelta(days=90)
+ANALYTICS_DAYS = 30
+MAX_ANALYTICS_DAYS = 365
+
+COUNTERS = {
+    CourseActivity.ENROLLED: "enrollments",
+    CourseActivity.UNENROLLED: "unenrollments",
+    CourseActivity.BLOCKED: "blocks",
+    CourseActivity.UNBLOCKED: "unblocks",
+    CourseActivity.FEEDBACK: "feedback_count",
+}
+STAT_FIELDS = list(COUNTERS.values()) + ["rating_sum"]
+
+
+def record_activity(course_id, kind, rating=None):
+    CourseActivity.objects.create(course_id=course_id, kind=kind, rating=rating)
+
+
+def record_activities(course_ids, kind):
+    CourseActivity.objects.bulk_create(
+        [CourseActivity(course_id=course_id, kind=kind) for course_id in course_ids],
+        batch_size=1000)
+
+
+def _fold(events):
+    """{(course id, date): {field: delta}} for a batch of events."""
+    deltas = {}
+    for course_id, kind, rating, created_at in events:
+        key = (course_id, timezone.localtime(created_at).date())
+        row = deltas.setdefault(key, dict.fromkeys(STAT_FIELDS, 0))
+        row[COUNTERS[kind]] += 1
+        if kind == CourseActivity.FEEDBACK and rating is not None:
+            row["rating_sum"] += rating
+    return deltas
+
+
+def _apply(deltas):
+    # events of since-deleted courses (CourseActivity isn't constrained
+    # to existing courses) have nothing left to count towards
+    course_ids = set(Course.objects.filter(
+        id__in={course_id for course_id, _ in deltas}).values_list("id", flat=True))
+    deltas = {key: row for key, row in deltas.items() if key[0] in course_ids}
+    dates = {day for _, day in deltas}
+    existing = {
+        (stats.course_id, stats.date): stats
+        for stats in CourseDailyStats.objects.filter(
+            course_id__in=course_ids, date__in=dates)
+    }
+    created, updated = [], []
+    for (course_id, day), row in deltas.items():
+        stats = existing.get((course_id, day))
+        if stats is None:
+            created.append(CourseDailyStats(course_id=course_id, date=day, **row))
+            continue
+        for field, delta in row.items():
+            setattr(stats, field, getattr(stats, field) + delta)
+        updated.append(stats)
+    CourseDailyStats.objects.bulk_create(created, batch_size=1000)
+    CourseDailyStats.objects.bulk_update(updated, STAT_FIELDS, batch_size=1000)
+
+
+def rollup_activity(now=None, batch_size=ROLLUP_BATCH):
+    """
+    Fold settled events past the watermark into CourseDailyStats, a batch
+    per transaction. Returns the number of events processed.
+    """
+    now = now or timezone.now()
+    settled = now - timedelta(seconds=SETTLE_SECONDS)
+    processed = 0
+    while True:
+        with transaction.atomic():
+            RollupWatermark.objects.get_or_create(name=ROLLUP_NAME)
+            # the row lock keeps overlapping runs from counting twice
+            mark = RollupWatermark.objects.select_for_update().get(name=ROLLUP_NAME)
+            batch = list(
+                CourseActivity.objects
+                .filter(id__gt=mark.last_id)
+                .order_by("id")
+                .values_list("id", "course_id", "kind", "rating", "created_at")
+                [:batch_size])
+            # stop at the first unsettled event so the watermark never
+            # passes one that is still in flight
+            events = []
+            for event in batch:
+                if event[4] >= settled:
+                    break
+                events.append(event)
+            if not events:
+                break
+            _apply(_fold(event[1:] for event in events))
+            mark.last_id = events[-1][0]
+            mark.save(update_fields=["last_id", "updated_at"])
+        processed += len(events)
+        if len(events) < len(batch) or len(batch) < batch_size:
+            break
+
+    CourseActivity.objects.filter(
+        id__lte=mark.last_id, created_at__lt=now - ACTIVITY_RETENTION).delete()
+    return processed
+
+
+def course_daily_stats(course_id, days=ANALYTICS_DAYS, today=None):
+    """The course's rollup rows for the last `days` days, oldest first."""
+    today = today or timezone.localdate()
+    return CourseDailyStats.objects.filter(
+        course_id=course_id, date__gt=today - timedelta(days=days))
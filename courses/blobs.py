@@ -0,0 +1,103 @@
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+
+from .models import Material, MaterialBlob
+
+# Content-addressed storage for material files. Identical bytes are stored
+# once under course_materials/blobs/<aa>/<sha256><ext> and every Material
+# with that content points at the same MaterialBlob. store_blob() hands the
+# caller one reference, release_blob() gives one back, and the file is
+# deleted with the last reference. Both lock the blob row, so a release
+# and a store of the same content cannot interleave.
+
+BLOB_DIR = "course_materials/blobs"
+HASH_CHUNK = 64 * 1024
+
+
+def blob_path(digest, filename):
+    ext = os.path.splitext(filename or "")[1].lower()[:16]
+    return f"{BLOB_DIR}/{digest[:2]}/{digest}{ext}"
+
+
+def hash_file(fileobj):
+    """(sha256 hex digest, size) of a seekable file, leaving it rewound."""
+    digest = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    while True:
+        data = fileobj.read(HASH_CHUNK)
+        if not data:
+            break
+        digest.update(data)
+        size += len(data)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+
+def store_blob(fileobj, filename, storage=None):
+    """
+    Store `fileobj` by content hash unless the same bytes are already
+    stored, and take one reference on the blob. Returns the MaterialBlob.
+    """
+    storage = storage or default_storage
+    digest, size = hash_file(fileobj)
+    with transaction.atomic():
+        MaterialBlob.objects.get_or_create(
+            sha256=digest,
+            defaults={"path": blob_path(digest, filename), "size": size},
+        )
+        blob = MaterialBlob.objects.select_for_update().get(sha256=digest)
+        if not storage.exists(blob.path):
+            stored = storage.save(blob.path, fileobj)
+            if stored != blob.path:
+                blob.path = stored
+        blob.ref_count = F("ref_count") + 1
+        blob.save(update_fields=["path", "ref_count"])
+    blob.refresh_from_db()
+    return blob
+
+
+def release_blob(blob_id, storage=None):
+    """Drop one reference; delete the blob and its file when none remain."""
+    if blob_id is None:
+        return False
+    storage = storage or default_storage
+    with transaction.atomic():
+        blob = (MaterialBlob.objects.select_for_update()
+                .filter(pk=blob_id).first())
+        if blob is None:
+            return False
+        if blob.ref_count > 1 or blob.materials.exists():
+            MaterialBlob.objects.filter(pk=blob_id, ref_count__gt=0).update(
+                ref_count=F("ref_count") - 1)
+            return False
+        blob.delete()
+        # only once the row is gone for good: if an enclosing transaction
+        # rolls back, the blob (and every material sharing it) keeps its file
+        path = blob.path
+        transaction.on_commit(lambda: storage.delete(path))
+    return True
+
+
+def adopt_stored_file(name, storage=None, exclude_material=None):
+    """
+    Move a file stored under its upload name into blob storage, taking one
+    reference. The original is deleted unless another material still
+    points at it. Returns the MaterialBlob, or None if the file is missing.
+    """
+    storage = storage or default_storage
+    if not storage.exists(name):
+        return None
+    with storage.open(name, "rb") as fh:
+        blob = store_blob(fh, name, storage=storage)
+    if name != blob.path:
+        others = Material.objects.filter(content=name)
+        if exclude_material is not None:
+            others = others.exclude(pk=exclude_material.pk)
+        if not others.exists():
+            storage.delete(name)
+    return blob
@@ -0,0 +1,92 @@
+import time
+
+from django.core.cache import cache
+
+from .models import Course
+
+# Per-user course dashboard (enrolled / created / collaborating lists).
+# Entries are dropped by courses.signals whenever the user's enrollments
+# or collaborator memberships change; the timeout only bounds staleness
+# of things nobody signals about (e.g. a course being renamed).
+DASHBOARD_TIMEOUT = 60 * 60
+
+
+def dashboard_key(user_id):
+    return f"courses:dashboard:{user_id}"
+
+
+def build_dashboard(user):
+    fields = ("id", "title")
+    enrolled = list(user.courses_enrolled.order_by("title").values(*fields))
+    return {
+        "enrolled_ids": [c["id"] for c in enrolled],
+        "enrolled_courses": enrolled,
+        "created_courses": list(
+            Course.objects.filter(creator=user)
+            .order_by("title").values(*fields)),
+        "collaborating_courses": list(
+            Course.objects.filter(collaborators=user).exclude(creator=user)
+            .order_by("title").values(*fields)),
+    }
+
+
+def get_dashboard(user):
+    key = dashboard_key(user.id)
+    data = cache.get(key)
+    if data is None:
+        data = build_dashboard(user)
+        cache.set(key, data, DASHBOARD_TIMEOUT)
+    return data
+
+
+def access_key(user_id):
+    # per-user course access map, see courses.permissions
+    return f"courses:access:{user_id}"
+
+
+def invalidate_user_courses(user_ids):
+    """
+    Drop the dashboards and course access maps of `user_ids`. Both are
+    derived from the same enrollments and memberships, so every signal
+    that invalidates one invalidates the other.
+    """
+    keys = []
+    for uid in user_ids:
+        keys += [dashboard_key(uid), access_key(uid)]
+    cache.delete_many(keys)
+
+
+# Rendered course detail fragments are shared by every viewer and keyed
+# on a per-course version, which courses.signals bumps whenever the data
+# behind them changes. Old fragments are never deleted, they just stop
+# being addressed and age out.
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+
+def course_version_key(course_id):
+    return f"courses:version:{course_id}"
+
+
+def _fresh_version():
+    # seeded from the clock so a version lost to eviction never comes
+    # back with a value an old fragment was stored under
+    return time.time_ns() // 1000
+
+
+def get_course_version(course_id):
+    key = course_version_key(course_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_course_version(course_id):
+    key = course_version_key(course_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _fresh_version()
+        cache.set(key, version, None)
+        return version
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from accounts.models import Notification
+from .models import Course, EnrollmentEvent
+
+# Enrollment notifications are coalesced: each enrollment is buffered as an
+# EnrollmentEvent and a teacher gets one notification per course per
+# digest window ("37 students enrolled in X") instead of one per student.
+# The first event of a window schedules its flush; the periodic
+# flush_due_digests() picks up any group whose flush went missing, so no
+# event waits much longer than the window.
+
+DEFAULT_WINDOW = 5 * 60
+NAMES_SHOWN = 3
+
+
+def digest_window():
+    return timedelta(seconds=getattr(
+        settings, "ENROLLMENT_DIGEST_WINDOW", DEFAULT_WINDOW))
+
+
+def record_enrollment(teacher_id, course_id, student_name):
+    """
+    Buffer one enrollment. Returns True if it opened a new window for
+    (teacher, course), i.e. the caller should schedule a flush.
+    """
+    pending = EnrollmentEvent.objects.filter(
+        teacher_id=teacher_id, course_id=course_id).exists()
+    EnrollmentEvent.objects.create(
+        teacher_id=teacher_id, course_id=course_id, student_name=student_name)
+    return not pending
+
+
+def digest_message(names, course_title):
+    if len(names) == 1:
+        return f"{names[0]} has enrolled in your course {course_title}."
+    shown = ", ".join(names[:NAMES_SHOWN])
+    others = len(names) - NAMES_SHOWN
+    if others > 0:
+        shown += f" and {others} other{'s' if others > 1 else ''}"
+    return (f"{len(names)} students enrolled in your course "
+            f"{course_title}: {shown}.")
+
+
+def flush_digest(teacher_id, course_id):
+    """
+    Turn the buffered events for (teacher, course) into one notification.
+    Returns the notification, or None if nothing was pending.
+    """
+    with transaction.atomic():
+        # skip_locked: a concurrent flush of the same group already owns
+        # these rows and will report them
+        events = list(
+            EnrollmentEvent.objects
+            .select_for_update(skip_locked=True)
+            .filter(teacher_id=teacher_id, course_id=course_id)
+            .order_by("created_at", "id")
+            .values_list("id", "student_name"))
+        if not events:
+            return None
+        title = (Course.objects.filter(pk=course_id)
+                 .values_list("title", flat=True).first())
+        EnrollmentEvent.objects.filter(
+            id__in=[pk for pk, _ in events]).delete()
+        if title is None:
+            return None
+        return Notification.objects.create(
+            user_id=teacher_id,
+            message=digest_message([name for _, name in events], title))
+
+
+def flush_due_digests(now=None):
+    """Flush every group whose oldest event has waited a full window."""
+    cutoff = (now or timezone.now()) - digest_window()
+    due = (EnrollmentEvent.objects
+           .values("teacher_id", "course_id")
+           .annotate(first=Min("created_at"))
+           .filter(first__lte=cutoff))
+    return sum(
+        1 for group in list(due)
+        if flush_digest(group["teacher_id"], group["course_id"]))
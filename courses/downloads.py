@@ -0,0 +1,130 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseRedirect, StreamingHttpResponse)
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+# Serving material files once access has been checked. Local files are
+# handed to the front proxy (X-Accel-Redirect / X-Sendfile) when one is
+# configured, otherwise streamed by Django with Range and ETag support.
+# Remote storages (S3) redirect to their own signed URL, which already
+# supports both.
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+STREAM_CHUNK = 64 * 1024
+DOWNLOAD_MAX_AGE = 60 * 60
+
+
+def _local_path(fieldfile):
+    try:
+        return fieldfile.storage.path(fieldfile.name)
+    except NotImplementedError:
+        return None
+
+
+def _parse_range(header, size):
+    """
+    (start, end) for a single satisfiable byte range, None when the header
+    should be ignored (absent, malformed or multi-range), or "invalid" when
+    it cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return "invalid"
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return "invalid"
+    return start, end
+
+
+def _stream_range(path, start, length):
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(STREAM_CHUNK, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _validator_headers(response, etag, mtime, filename):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(mtime)
+    response["Accept-Ranges"] = "bytes"
+    # access-controlled content: browsers may cache it, shared caches not
+    response["Cache-Control"] = f"private, max-age={DOWNLOAD_MAX_AGE}"
+    response["Content-Disposition"] = (
+        f"inline; filename*=UTF-8''{quote(filename)}")
+    return response
+
+
+def serve_material_file(request, fieldfile, filename=None):
+    path = _local_path(fieldfile)
+    if path is None:
+        # remote storage: its (signed) URL handles ranges and caching
+        return HttpResponseRedirect(fieldfile.url)
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        # the row outlived its file (removed or not yet synced to this host)
+        raise Http404("Material file not found")
+    size, mtime = stat.st_size, int(stat.st_mtime)
+    etag = quote_etag(f"{size:x}-{stat.st_mtime_ns:x}")
+    filename = filename or os.path.basename(fieldfile.name)
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=mtime)
+    if not_modified is not None:
+        return _validator_headers(not_modified, etag, mtime, filename)
+
+    backend = getattr(settings, "MATERIAL_SENDFILE", "")
+    if backend == "nginx":
+        prefix = settings.MATERIAL_SENDFILE_PREFIX.rstrip("/")
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = f"{prefix}/{quote(fieldfile.name)}"
+        return _validator_headers(response, etag, mtime, filename)
+    if backend == "xsendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = path
+        return _validator_headers(response, etag, mtime, filename)
+
+    byte_range = None
+    if_range = request.headers.get("If-Range")
+    if if_range is None or if_range == etag:
+        byte_range = _parse_range(request.headers.get("Range"), size)
+
+    if byte_range == "invalid":
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    if byte_range is not None:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _stream_range(path, start, length),
+            status=206, content_type=content_type)
+        response["Content-Length"] = str(length)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return _validator_headers(response, etag, mtime, filename)
+
+    # whole file: FileResponse lets the server use sendfile where it can
+    response = FileResponse(open(path, "rb"), content_type=content_type)
+    return _validator_headers(response, etag, mtime, filename)
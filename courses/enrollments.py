@@ -0,0 +1,136 @@
+import csv
+import io
+
+from django.contrib.auth import get_user_model
+from django.db.models.functions import Lower
+
+from .analytics import record_activities
+from .cache import bump_course_version, invalidate_user_courses
+from .models import CourseActivity, Enrollment
+
+# Bulk enrollment of a cohort from a list of usernames / emails. Users are
+# resolved and existing enrollments checked a batch at a time, new rows go
+# in with one bulk_create, and the per-row signal work (dashboard
+# invalidation, fragment version, activity log) is done once for the
+# whole import.
+
+BATCH_SIZE = 500
+MAX_IMPORT_ROWS = 20000
+HEADER_NAMES = {"username", "email", "user", "login"}
+
+
+class EnrollmentImportError(ValueError):
+    pass
+
+
+def read_identifiers(fileobj):
+    """
+    (row number, identifier) pairs from a CSV upload: the first column of
+    each row, skipping blank lines and a header row naming the column.
+    """
+    try:
+        text = fileobj.read().decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise EnrollmentImportError("The file is not UTF-8 encoded CSV.") from e
+    rows = []
+    for number, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+        value = row[0].strip() if row else ""
+        if not value or (number == 1 and value.lower() in HEADER_NAMES):
+            continue
+        rows.append((number, value))
+    return rows
+
+
+def _batches(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def resolve_users(identifiers):
+    """
+    ({identifier: user id}, {identifier: error message}). Values
+    containing "@" are matched to emails case-insensitively, anything else
+    to usernames exactly.
+    """
+    User = get_user_model()
+    emails = sorted({i.lower() for i in identifiers if "@" in i})
+    usernames = sorted({i for i in identifiers if "@" not in i})
+
+    by_username = {}
+    for batch in _batches(usernames):
+        by_username.update(
+            User.objects.filter(username__in=batch, is_active=True)
+            .values_list("username", "id"))
+
+    by_email = {}
+    for batch in _batches(emails):
+        rows = (User.objects.annotate(email_lower=Lower("email"))
+                .filter(email_lower__in=batch, is_active=True)
+                .values_list("email_lower", "id"))
+        for email, user_id in rows:
+            # several accounts sharing an email can't be told apart
+            by_email[email] = None if email in by_email else user_id
+
+    resolved, errors = {}, {}
+    for value in identifiers:
+        if "@" in value:
+            user_id = by_email.get(value.lower(), 0)
+        else:
+            user_id = by_username.get(value, 0)
+        if user_id:
+            resolved[value] = user_id
+        elif user_id is None:
+            errors[value] = "Several users have this email."
+        else:
+            errors[value] = "No user with this username or email."
+    return resolved, errors
+
+
+def bulk_enroll(course, rows):
+    """
+    Enroll the users named in `rows` ((row number, identifier) pairs) on
+    `course`. Returns a summary: counts of new and existing enrollments
+    and a list of per-row errors.
+    """
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise EnrollmentImportError(
+            f"At most {MAX_IMPORT_ROWS} rows can be imported at once.")
+
+    resolved, unresolved = resolve_users([value for _, value in rows])
+    errors = []
+    first_row = {}
+    user_ids = []
+    for number, value in rows:
+        user_id = resolved.get(value)
+        if user_id is None:
+            errors.append(
+                {"row": number, "value": value, "error": unresolved[value]})
+        elif user_id in first_row:
+            errors.append({"row": number, "value": value,
+                           "error": f"Duplicate of row {first_row[user_id]}."})
+        else:
+            first_row[user_id] = number
+            user_ids.append(user_id)
+
+    existing = set()
+    for batch in _batches(user_ids):
+        existing.update(
+            Enrollment.objects.filter(course=course, user_id__in=batch)
+            .values_list("user_id", flat=True))
+    new_ids = [user_id for user_id in user_ids if user_id not in existing]
+
+    if new_ids:
+        # ignore_conflicts covers enrollments made since the check above
+        Enrollment.objects.bulk_create(
+            [Enrollment(course=course, user_id=user_id) for user_id in new_ids],
+            batch_size=BATCH_SIZE, ignore_conflicts=True)
+        # bulk_create skips the signals that normally do this per row
+        invalidate_user_courses(new_ids)
+        bump_course_version(course.id)
+        record_activities([course.id] * len(new_ids), CourseActivity.ENROLLED)
+
+    return {
+        "enrolled": len(new_ids),
+        "already_enrolled": len(existing),
+        "errors": errors,
+    }
@@ -0,0 +1,69 @@
+import os
+import re
+
+from django.core.files.storage import default_storage
+
+from .models import MaterialBlob, MaterialText
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pragma: no cover - PDF text is skipped without pypdf
+    PdfReader = None
+
+# Text extraction for the material search index. Text is stored per blob
+# (see courses.blobs), so a file is extracted once for all the materials
+# that share it and a re-save of the same bytes never extracts again.
+
+MAX_TEXT_CHARS = 500_000
+TEXT_EXTENSIONS = {".txt", ".md", ".csv", ".html", ".htm", ".rst"}
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def extract_text(fileobj, filename):
+    """Plain text of a PDF or text-like file; '' for anything else."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext == ".pdf":
+        if PdfReader is None:
+            return ""
+        try:
+            reader = PdfReader(fileobj)
+            parts = []
+            size = 0
+            for page in reader.pages:
+                text = page.extract_text() or ""
+                parts.append(text)
+                size += len(text)
+                if size >= MAX_TEXT_CHARS:
+                    break
+        except Exception:
+            # broken or encrypted PDFs are left unindexed, not retried
+            return ""
+        text = "\n".join(parts)
+    elif ext in TEXT_EXTENSIONS:
+        text = fileobj.read(MAX_TEXT_CHARS * 4).decode("utf-8", "replace")
+        if ext in (".html", ".htm"):
+            text = TAG_RE.sub(" ", text)
+    else:
+        return ""
+    return text.replace("\x00", "")[:MAX_TEXT_CHARS]
+
+
+def index_blob_text(blob_id, storage=None):
+    """
+    Extract and store the text of one blob unless it is already indexed.
+    Returns True when text was extracted.
+    """
+    if MaterialText.objects.filter(blob_id=blob_id).exists():
+        return False
+    blob = MaterialBlob.objects.filter(pk=blob_id).first()
+    if blob is None:
+        # released before the task ran
+        return False
+    storage = storage or default_storage
+    if not storage.exists(blob.path):
+        return False
+    with storage.open(blob.path, "rb") as fileobj:
+        text = extract_text(fileobj, blob.path)
+    _, created = MaterialText.objects.get_or_create(
+        blob_id=blob_id, defaults={"text": text})
+    return created
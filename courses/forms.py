@@ -6,6 +6,7 @@ from crispy_forms.layout import Submit
 from crispy_forms.layout import Layout, Field, HTML
 
 from .models import Course, Material, CourseFeedback
+from .ordering import order_taken
 
 
 class CourseForm(forms.ModelForm):
@@ -25,8 +26,11 @@ class MaterialForm(forms.ModelForm):
         model = Material
         fields = ['title', 'content', 'order']
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, course=None, **kwargs):
         super().__init__(*args, **kwargs)
+        self.course = course
+        # left blank, the material is appended after the last one
+        self.fields['order'].required = False
         self.helper = FormHelper()
         self.helper.form_tag = False  # no inner <form>
         self.helper.layout = Layout(
@@ -35,6 +39,14 @@ class MaterialForm(forms.ModelForm):
             Field('order'),
         )
 
+    def clean_order(self):
+        order = self.cleaned_data.get('order')
+        course_id = self.course.id if self.course else self.instance.course_id
+        if order is not None and order_taken(course_id, order, exclude=self.instance.pk):
+            raise forms.ValidationError(
+                "Another material of this course already has this position.")
+        return order
+
 
 class CourseFeedbackForm(forms.ModelForm):
     class Meta:
@@ -70,3 +82,14 @@ class CourseFeedbackForm(forms.ModelForm):
         if commit:
             obj.save()
         return obj
+
+
+class EnrollmentImportForm(forms.Form):
+    file = forms.FileField(
+        label="CSV file",
+        help_text="One username or email per row, in the first column.")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_tag = False  # template has the <form> tag
@@ -0,0 +1,107 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from courses.blobs import BLOB_DIR, adopt_stored_file, hash_file, release_blob
+from courses.models import Material, MaterialBlob
+
+
+class Command(BaseCommand):
+    help = ('Move existing material files into content-addressed blob storage, '
+            'merging duplicates in place and recounting blob references')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report duplicates, change nothing')
+        parser.add_argument('--delete-orphans', action='store_true',
+                            help='Also delete files under course_materials/ '
+                                 'that no material refers to')
+
+    def handle(self, *args, **options):
+        storage = Material._meta.get_field('content').storage
+        legacy = (Material.objects.filter(blob__isnull=True)
+                  .exclude(content='').exclude(content__isnull=True)
+                  .order_by('id'))
+
+        if options['dry_run']:
+            self.report_duplicates(storage, legacy)
+        else:
+            self.adopt_legacy_files(storage, legacy)
+            self.recount_references(storage)
+
+        orphans = self.find_orphans(storage)
+        for name in orphans:
+            if options['delete_orphans'] and not options['dry_run']:
+                storage.delete(name)
+                self.stdout.write(f'Deleted orphan {name}')
+            else:
+                self.stdout.write(f'Orphan (unreferenced) file: {name}')
+
+    def report_duplicates(self, storage, legacy):
+        by_hash = defaultdict(set)
+        for name in legacy.values_list('content', flat=True).distinct():
+            if storage.exists(name):
+                with storage.open(name, 'rb') as fh:
+                    by_hash[hash_file(fh)].add(name)
+        for (digest, size), names in by_hash.items():
+            if len(names) > 1:
+                self.stdout.write(
+                    f'{digest[:12]} ({size} bytes): {", ".join(sorted(names))}')
+        spare = sum((len(n) - 1) * size for (_, size), n in by_hash.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(by_hash)} distinct file(s); {spare} bytes reclaimable'))
+
+    def adopt_legacy_files(self, storage, legacy):
+        adopted = missing = 0
+        for material in legacy.iterator():
+            blob = adopt_stored_file(material.content.name, storage=storage,
+                                     exclude_material=material)
+            if blob is None:
+                missing += 1
+                self.stderr.write(
+                    f'Material {material.id}: file {material.content.name} is missing')
+                continue
+            # queryset update: only the pointer moves, no signals needed
+            Material.objects.filter(pk=material.pk).update(
+                blob=blob, content=blob.path)
+            adopted += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {adopted} material file(s) into blob storage '
+            f'({MaterialBlob.objects.count()} distinct blob(s), {missing} missing)'))
+
+    def recount_references(self, storage):
+        fixed = 0
+        for blob in MaterialBlob.objects.annotate(n=Count('materials')):
+            if blob.n == 0:
+                # unreferenced: drop it (release deletes the file too)
+                MaterialBlob.objects.filter(pk=blob.pk).update(ref_count=1)
+                release_blob(blob.pk, storage=storage)
+                fixed += 1
+            elif blob.ref_count != blob.n:
+                MaterialBlob.objects.filter(pk=blob.pk).update(ref_count=blob.n)
+                fixed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Recounted blob references ({fixed} corrected)'))
+
+    def find_orphans(self, storage):
+        referenced = set(Material.objects.exclude(content='')
+                         .exclude(content__isnull=True)
+                         .values_list('content', flat=True))
+        orphans = []
+        pending = ['course_materials']
+        while pending:
+            directory = pending.pop()
+            try:
+                dirs, files = storage.listdir(directory)
+            except (FileNotFoundError, NotImplementedError):
+                continue
+            for name in dirs:
+                path = f'{directory}/{name}'
+                if path != BLOB_DIR:
+                    pending.append(path)
+            for name in files:
+                path = f'{directory}/{name}'
+                if path not in referenced:
+                    orphans.append(path)
+        return sorted(orphans)
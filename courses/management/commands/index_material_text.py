@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from courses.extraction import index_blob_text
+from courses.models import MaterialBlob, MaterialText
+
+
+class Command(BaseCommand):
+    help = 'Extract searchable text for stored material files that have none yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reindex', action='store_true',
+                            help='Drop the existing text and extract everything again')
+
+    def handle(self, *args, **options):
+        if options['reindex']:
+            MaterialText.objects.all().delete()
+
+        pending = (MaterialBlob.objects
+                   .filter(text__isnull=True)
+                   .values_list('id', flat=True))
+        indexed = sum(1 for blob_id in list(pending) if index_blob_text(blob_id))
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed text for {indexed} material file(s)'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+
+from courses.models import Course, CourseFeedback
+from courses.rankings import rebuild_rating_buckets, refresh_rankings
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the stored rating aggregates and histograms on every course '
+            'from its feedback, then the top-rated ranking')
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int,
+                            help='Only rebuild these courses (default: all)')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.all()
+        if options['course_ids']:
+            courses = courses.filter(id__in=options['course_ids'])
+
+        # one grouped aggregate for all courses instead of one per course
+        totals = {
+            row['course_id']: row
+            for row in CourseFeedback.objects
+            .filter(course__in=courses)
+            .values('course_id')
+            .annotate(total=Sum('rating'), c=Count('id'))
+        }
+
+        drifted = []
+        for course in courses.only('id', 'rating_sum', 'rating_count', 'rating_avg'):
+            row = totals.get(course.id, {'total': 0, 'c': 0})
+            total, count = row['total'] or 0, row['c']
+            fresh = (total, count, total / count if count else None)
+            if (course.rating_sum, course.rating_count, course.rating_avg) != fresh:
+                course.rating_sum, course.rating_count, course.rating_avg = fresh
+                drifted.append(course)
+
+        Course.objects.bulk_update(
+            drifted, ['rating_sum', 'rating_count', 'rating_avg'], batch_size=500)
+        rebuild_rating_buckets(courses.values('id'))
+        ranked = refresh_rankings()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt rating aggregates ({len(drifted)} course(s) corrected), '
+            f'ranked {ranked} course(s)'))
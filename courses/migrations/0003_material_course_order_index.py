@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+ORDER_GAP = 1024
+
+
+def space_material_orders(apps, schema_editor):
+    # re-space existing orders ORDER_GAP apart and drop duplicates
+    Material = apps.get_model('courses', 'Material')
+    changed = []
+    course_id, position = None, 0
+    for material in Material.objects.order_by('course_id', 'order', 'id'):
+        if material.course_id != course_id:
+            course_id, position = material.course_id, 0
+        position += 1
+        if material.order != position * ORDER_GAP:
+            material.order = position * ORDER_GAP
+            changed.append(material)
+    Material.objects.bulk_update(changed, ['order'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0002_course_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['course', 'order'], name='courses_mat_course__852a91_idx'),
+        ),
+        migrations.RunPython(space_material_orders, migrations.RunPython.noop),
+    ]
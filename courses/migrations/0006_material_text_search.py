@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# The text index lives outside the ORM: an expression GIN index on
+# Postgres, an external-content FTS5 table kept in step by triggers on
+# SQLite. courses.search queries whichever one exists.
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE courses_materialtext_fts USING fts5("
+    "text, content='courses_materialtext', content_rowid='id')",
+    "CREATE TRIGGER courses_materialtext_ai AFTER INSERT ON courses_materialtext "
+    "BEGIN INSERT INTO courses_materialtext_fts(rowid, text) "
+    "VALUES (new.id, new.text); END",
+    "CREATE TRIGGER courses_materialtext_ad AFTER DELETE ON courses_materialtext "
+    "BEGIN INSERT INTO courses_materialtext_fts(courses_materialtext_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER courses_materialtext_au AFTER UPDATE ON courses_materialtext "
+    "BEGIN INSERT INTO courses_materialtext_fts(courses_materialtext_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "INSERT INTO courses_materialtext_fts(rowid, text) "
+    "VALUES (new.id, new.text); END",
+]
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS courses_materialtext_au",
+    "DROP TRIGGER IF EXISTS courses_materialtext_ad",
+    "DROP TRIGGER IF EXISTS courses_materialtext_ai",
+    "DROP TABLE IF EXISTS courses_materialtext_fts",
+]
+POSTGRES_FORWARD = [
+    "CREATE INDEX courses_materialtext_fts ON courses_materialtext "
+    "USING GIN (to_tsvector('english', text))",
+]
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS courses_materialtext_fts",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0005_material_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(blank=True)),
+                ('extracted_at', models.DateTimeField(auto_now=True)),
+                ('blob', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='text', to='courses.materialblob')),
+            ],
+        ),
+        migrations.RunPython(
+            _run({"sqlite": SQLITE_FORWARD, "postgresql": POSTGRES_FORWARD}),
+            _run({"sqlite": SQLITE_REVERSE, "postgresql": POSTGRES_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:49
+
+from django.db import migrations
+
+# Catalog search index over Course.title and description, queried by
+# courses.search. SQLite gets an external-content FTS5 table (porter
+# stemmed, to match Postgres' english config) kept in step by triggers;
+# the update trigger only fires for the indexed columns, so the frequent
+# rating aggregate updates don't touch the index. Postgres gets a GIN
+# expression index over a title-weighted tsvector.
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE courses_course_fts USING fts5("
+    "title, description, content='courses_course', content_rowid='id', "
+    "tokenize='porter unicode61')",
+    "CREATE TRIGGER courses_course_fts_ai AFTER INSERT ON courses_course "
+    "BEGIN INSERT INTO courses_course_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER courses_course_fts_ad AFTER DELETE ON courses_course "
+    "BEGIN INSERT INTO courses_course_fts(courses_course_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER courses_course_fts_au AFTER UPDATE OF title, description "
+    "ON courses_course "
+    "BEGIN INSERT INTO courses_course_fts(courses_course_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO courses_course_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "INSERT INTO courses_course_fts(courses_course_fts) VALUES ('rebuild')",
+]
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS courses_course_fts_au",
+    "DROP TRIGGER IF EXISTS courses_course_fts_ad",
+    "DROP TRIGGER IF EXISTS courses_course_fts_ai",
+    "DROP TABLE IF EXISTS courses_course_fts",
+]
+# must stay identical to COURSE_VECTOR in courses.search for the index
+# to be used
+POSTGRES_FORWARD = [
+    "CREATE INDEX courses_course_fts ON courses_course USING GIN (("
+    "setweight(to_tsvector('english', title), 'A') || "
+    "setweight(to_tsvector('english', description), 'B')))",
+]
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS courses_course_fts",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_material_text_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({"sqlite": SQLITE_FORWARD, "postgresql": POSTGRES_FORWARD}),
+            _run({"sqlite": SQLITE_REVERSE, "postgresql": POSTGRES_REVERSE}),
+        ),
+    ]
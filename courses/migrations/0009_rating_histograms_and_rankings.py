@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_buckets(apps, schema_editor):
+    CourseFeedback = apps.get_model('courses', 'CourseFeedback')
+    CourseRatingBucket = apps.get_model('courses', 'CourseRatingBucket')
+    rows = (CourseFeedback.objects.values('course_id', 'rating')
+            .annotate(c=Count('id')))
+    CourseRatingBucket.objects.bulk_create(
+        [CourseRatingBucket(course_id=row['course_id'], rating=row['rating'],
+                            count=row['c']) for row in rows],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_enrollment_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseRanking',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='courses.course')),
+                ('position', models.PositiveIntegerField(db_index=True)),
+                ('score', models.FloatField()),
+                ('rating_count', models.PositiveIntegerField()),
+                ('rating_avg', models.FloatField()),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CourseRatingBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_buckets', to='courses.course')),
+            ],
+            options={
+                'unique_together': {('course', 'rating')},
+            },
+        ),
+        migrations.RunPython(backfill_rating_buckets, migrations.RunPython.noop),
+    ]
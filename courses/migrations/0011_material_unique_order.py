@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:02
+
+from django.db import migrations, models
+from django.db.models import Count
+
+ORDER_GAP = 1024
+
+
+def respace_duplicate_orders(apps, schema_editor):
+    # re-space the courses that still have two materials in one position
+    Material = apps.get_model('courses', 'Material')
+    course_ids = (Material.objects.values('course_id', 'order')
+                  .annotate(n=Count('id')).filter(n__gt=1)
+                  .values_list('course_id', flat=True).distinct())
+    changed = []
+    for course_id in set(course_ids):
+        materials = Material.objects.filter(
+            course_id=course_id).order_by('order', 'id')
+        for position, material in enumerate(materials, start=1):
+            if material.order != position * ORDER_GAP:
+                material.order = position * ORDER_GAP
+                changed.append(material)
+    Material.objects.bulk_update(changed, ['order'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_course_activity_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(respace_duplicate_orders, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='material',
+            constraint=models.UniqueConstraint(fields=('course', 'order'), name='unique_material_order'),
+        ),
+        migrations.RemoveIndex(
+            model_name='material',
+            name='courses_mat_course__852a91_idx',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_material_unique_order'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='courseactivity',
+            name='course',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='courses.course'),
+        ),
+    ]
@@ -1,5 +1,8 @@
+import uuid
+
 from django.db import models
-from django.db.models import Avg, Count
+from django.db.models import Avg, Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast
 from django.conf import settings
 
 
@@ -19,6 +22,11 @@ class Course(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # denormalised feedback aggregates, kept in step by courses.signals
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(null=True, blank=True, editable=False)
+
     enrolled_users = models.ManyToManyField(
         settings.AUTH_USER_MODEL,
         through="Enrollment",
@@ -37,10 +45,73 @@ class Course(models.Model):
         return self.title
 
     def average_rating(self):
-        return self.feedbacks.aggregate(avg=Avg("rating"))["avg"]
+        return self.rating_avg
 
     def feedback_count(self):
-        return self.feedbacks.aggregate(c=Count("id"))["c"]
+        return self.rating_count
+
+    @classmethod
+    def apply_rating_delta(cls, course_id, rating_delta, count_delta):
+        """
+        Shift the stored aggregates by a delta in a single UPDATE, so
+        concurrent feedback writes never lose each other's changes.
+        """
+        new_sum = F("rating_sum") + rating_delta
+        new_count = F("rating_count") + count_delta
+        return cls.objects.filter(pk=course_id).update(
+            rating_sum=new_sum,
+            rating_count=new_count,
+            rating_avg=Case(
+                When(rating_count=-count_delta, then=Value(None)),
+                default=Cast(new_sum, FloatField()) / new_count,
+                output_field=FloatField(),
+            ),
+        )
+
+    def rebuild_rating_aggregates(self):
+        """Recompute the stored aggregates from the feedback rows."""
+        agg = self.feedbacks.aggregate(
+            total=Sum("rating"), c=Count("id"), avg=Avg("rating"))
+        self.rating_sum = agg["total"] or 0
+        self.rating_count = agg["c"]
+        self.rating_avg = agg["avg"]
+        Course.objects.filter(pk=self.pk).update(
+            rating_sum=self.rating_sum,
+            rating_count=self.rating_count,
+            rating_avg=self.rating_avg,
+        )
+
+
+class MaterialBlob(models.Model):
+    """
+    One stored file, addressed by the SHA-256 of its bytes and shared by
+    every material with identical content. ref_count is the number of
+    materials pointing at it; the file goes when it drops to zero.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    path = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} refs)"
+
+
+class MaterialText(models.Model):
+    """
+    Text extracted from a blob, indexed for full-text search (Postgres
+    tsvector or SQLite FTS5, see migration 0006). Keyed on the blob, so
+    each distinct file is extracted once however many materials use it.
+    """
+    blob = models.OneToOneField(
+        MaterialBlob, related_name="text", on_delete=models.CASCADE
+    )
+    text = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Text of {self.blob}"
 
 
 class Material(models.Model):
@@ -52,11 +123,87 @@ class Material(models.Model):
     content = models.FileField(
         upload_to="course_materials/", blank=True, null=True
     )
+    # content.name always equals blob.path; set by courses.signals
+    blob = models.ForeignKey(
+        MaterialBlob, related_name="materials", null=True, blank=True,
+        on_delete=models.PROTECT, editable=False,
+    )
+
+    class Meta:
+        # no two materials of a course share a position; the constraint's
+        # index also serves the course's materials list in order
+        constraints = [
+            models.UniqueConstraint(
+                fields=["course", "order"], name="unique_material_order"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored blob so a replaced file releases it
+        instance._loaded_blob_id = instance.__dict__.get("blob_id")
+        return instance
 
     def __str__(self):
         return self.title
 
 
+class MaterialUpload(models.Model):
+    """A chunked, resumable material upload; becomes a Material when complete."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    course = models.ForeignKey(
+        Course, related_name="material_uploads", on_delete=models.CASCADE
+    )
+    uploader = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="material_uploads",
+        on_delete=models.CASCADE,
+    )
+    title = models.CharField(max_length=255)
+    order = models.PositiveIntegerField(null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)
+    material = models.OneToOneField(
+        Material, null=True, blank=True, on_delete=models.SET_NULL,
+        related_name="upload",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def chunk_name(self, index):
+        return f"material_uploads/{self.id}/{index:06d}.part"
+
+    def expected_chunk_size(self, index):
+        if index < self.chunk_count - 1:
+            return self.chunk_size
+        return self.size - self.chunk_size * (self.chunk_count - 1)
+
+    def __str__(self):
+        return f"Upload of {self.filename} to {self.course}"
+
+
+class MaterialUploadChunk(models.Model):
+    upload = models.ForeignKey(
+        MaterialUpload, related_name="chunks", on_delete=models.CASCADE
+    )
+    index = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ("upload", "index")
+        ordering = ["index"]
+
+    def __str__(self):
+        return f"Chunk {self.index} of {self.upload_id}"
+
+
 class CourseFeedback(models.Model):
     course = models.ForeignKey(
         Course, on_delete=models.CASCADE, related_name="feedbacks"
@@ -78,10 +225,69 @@ class CourseFeedback(models.Model):
         unique_together = ("course", "user")
         ordering = ["-created_at"]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored rating so updates can apply a delta
+        instance._loaded_rating = instance.__dict__.get("rating")
+        return instance
+
     def __str__(self):
         return f"{self.user} feedback for {self.course}"
 
 
+class CourseRatingBucket(models.Model):
+    """
+    How many reviews of a course gave one rating (0-10). Kept in step
+    with feedback by courses.signals; absent rows mean a count of 0.
+    """
+    course = models.ForeignKey(
+        Course, related_name="rating_buckets", on_delete=models.CASCADE)
+    rating = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("course", "rating")
+
+    @classmethod
+    def apply_delta(cls, course_id, rating, delta):
+        # a single UPDATE, so concurrent reviews never lose counts
+        updated = cls.objects.filter(course_id=course_id, rating=rating).update(
+            count=F("count") + delta)
+        if not updated and delta > 0:
+            bucket, created = cls.objects.get_or_create(
+                course_id=course_id, rating=rating,
+                defaults={"count": delta})
+            if not created:
+                # another review created the row first
+                cls.objects.filter(pk=bucket.pk).update(
+                    count=F("count") + delta)
+
+    def __str__(self):
+        return f"{self.course_id}: {self.count} x {self.rating}"
+
+
+class CourseRanking(models.Model):
+    """
+    Bayesian-average ranking of rated courses, rebuilt from the rating
+    buckets by courses.rankings.refresh_rankings() on a schedule.
+    """
+    course = models.OneToOneField(
+        Course, primary_key=True, related_name="ranking",
+        on_delete=models.CASCADE)
+    position = models.PositiveIntegerField(db_index=True)
+    score = models.FloatField()
+    rating_count = models.PositiveIntegerField()
+    rating_avg = models.FloatField()
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ["position"]
+
+    def __str__(self):
+        return f"#{self.position} {self.course_id} ({self.score:.2f})"
+
+
 class Enrollment(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE)
@@ -92,5 +298,101 @@ class Enrollment(models.Model):
     class Meta:
         unique_together = ("user", "course")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored flag so block/unblock can be told apart
+        instance._loaded_blocked = instance.__dict__.get("blocked")
+        return instance
+
     def __str__(self):
         return f"{self.user} enrolled in {self.course.title}"
+
+
+class EnrollmentEvent(models.Model):
+    """
+    An enrollment the course teacher has not been told about yet. Events
+    are buffered here, durable across worker restarts, and flushed per
+    (teacher, course) as one digest notification (courses.digests).
+    """
+    teacher = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name="+", on_delete=models.CASCADE)
+    course = models.ForeignKey(
+        Course, related_name="+", on_delete=models.CASCADE)
+    student_name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # flush scans find due groups and read them back in order
+        indexes = [models.Index(fields=["teacher", "course", "created_at"])]
+
+    def __str__(self):
+        return f"{self.student_name} enrolled in course {self.course_id}"
+
+
+class CourseActivity(models.Model):
+    """
+    Append-only log of enrollment and feedback events, written by
+    courses.signals and rolled up into CourseDailyStats by
+    courses.analytics. Rollups read this log, never the live tables.
+    """
+    ENROLLED = "enrolled"
+    UNENROLLED = "unenrolled"
+    BLOCKED = "blocked"
+    UNBLOCKED = "unblocked"
+    FEEDBACK = "feedback"
+    KIND_CHOICES = [
+        (ENROLLED, "Enrolled"),
+        (UNENROLLED, "Unenrolled"),
+        (BLOCKED, "Blocked"),
+        (UNBLOCKED, "Unblocked"),
+        (FEEDBACK, "Feedback"),
+    ]
+
+    # no database constraint: events are logged while a course's rows are
+    # being cascaded away (its enrollments' unenrollments), so the log
+    # can't depend on the course still existing. A deleted course's
+    # events are purged by courses.signals.
+    course = models.ForeignKey(
+        Course, related_name="+", on_delete=models.DO_NOTHING,
+        db_constraint=False)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    rating = models.PositiveSmallIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} on course {self.course_id}"
+
+
+class CourseDailyStats(models.Model):
+    """One course's activity on one day, summed from CourseActivity."""
+    course = models.ForeignKey(
+        Course, related_name="daily_stats", on_delete=models.CASCADE)
+    date = models.DateField()
+    enrollments = models.PositiveIntegerField(default=0)
+    unenrollments = models.PositiveIntegerField(default=0)
+    blocks = models.PositiveIntegerField(default=0)
+    unblocks = models.PositiveIntegerField(default=0)
+    feedback_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("course", "date")
+        ordering = ["date"]
+
+    @property
+    def rating_avg(self):
+        return self.rating_sum / self.feedback_count if self.feedback_count else None
+
+    def __str__(self):
+        return f"{self.course_id} on {self.date}"
+
+
+class RollupWatermark(models.Model):
+    """Last CourseActivity id a named rollup has processed."""
+    name = models.CharField(max_length=64, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
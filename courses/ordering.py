@@ -0,0 +1,133 @@
+from django.db import transaction
+from django.db.models import Max
+
+from .cache import bump_course_version
+from .models import Course, Material
+
+# Material.order values are spaced ORDER_GAP apart, so items can be placed
+# between two neighbours by taking values inside the gap, and a reorder
+# only has to rewrite the rows that actually moved. (course, order) is
+# unique; everything that assigns orders holds the course's row lock
+# (lock_course_order), so concurrent appends and reorders can't collide.
+ORDER_GAP = 1024
+
+
+class ReorderError(ValueError):
+    pass
+
+
+def lock_course_order(course_id):
+    """
+    Serialise order changes of the course's materials until the current
+    transaction ends.
+    """
+    Course.objects.select_for_update().filter(pk=course_id).exists()
+
+
+def order_taken(course_id, order, exclude=None):
+    taken = Material.objects.filter(course_id=course_id, order=order)
+    if exclude is not None:
+        taken = taken.exclude(pk=exclude)
+    return taken.exists()
+
+
+def next_order(course_id):
+    """
+    Order value that appends a new material after the current last one.
+    Call it in the transaction that saves the material: it takes the
+    course's order lock, so two appends can't be given the same value.
+    """
+    lock_course_order(course_id)
+    last = Material.objects.filter(
+        course_id=course_id).aggregate(m=Max('order'))['m']
+    return ORDER_GAP if last is None else last + ORDER_GAP
+
+
+def spaced_orders(low, high, count):
+    """
+    `count` evenly spaced values strictly between `low` and `high`
+    (`high` may be None at the end of the list), or None if the gap is
+    too small to hold them.
+    """
+    if high is None:
+        high = low + (count + 1) * ORDER_GAP
+    step = (high - low) // (count + 1)
+    if step < 1:
+        return None
+    return [low + step * (i + 1) for i in range(count)]
+
+
+def reorder_materials(course, material_ids, after=None):
+    """
+    Apply a full or partial ordering of a course's materials in one
+    transaction with a single bulk update.
+
+    A full ordering lists every material of the course. A partial
+    ordering lists the materials to move; they are placed as a block, in
+    the given order, straight after the material `after` (or at the top
+    when `after` is None). Materials not listed keep their relative order.
+    Returns the materials in their new order.
+    """
+    material_ids = [int(pk) for pk in material_ids]
+    after = int(after) if after is not None else None
+    if len(set(material_ids)) != len(material_ids):
+        raise ReorderError("Duplicate material ids in ordering.")
+    if after in material_ids:
+        raise ReorderError("A material cannot be placed after itself.")
+
+    with transaction.atomic():
+        lock_course_order(course.pk)
+        materials = list(
+            Material.objects.filter(course=course)
+            .only('id', 'course_id', 'order').order_by('order', 'id'))
+        by_id = {m.id: m for m in materials}
+
+        unknown = set(material_ids) - by_id.keys()
+        if after is not None and after not in by_id:
+            unknown.add(after)
+        if unknown:
+            raise ReorderError(
+                f"Materials not in this course: {sorted(unknown)}")
+
+        moving = [by_id[pk] for pk in material_ids]
+        staying = [m for m in materials if m.id not in set(material_ids)]
+        cut = 0
+        if after is not None:
+            cut = next(i for i, m in enumerate(staying) if m.id == after) + 1
+        sequence = staying[:cut] + moving + staying[cut:]
+
+        targets = None
+        staying_orders = [m.order for m in staying]
+        if moving:
+            # drop the moved block into the gap between its new neighbours
+            low = staying[cut - 1].order if cut else 0
+            high = staying[cut].order if cut < len(staying) else None
+            block = spaced_orders(low, high, len(moving))
+            if block is not None:
+                targets = staying_orders[:cut] + block + staying_orders[cut:]
+        if targets is None:
+            # no room left: re-space the whole course
+            targets = [(i + 1) * ORDER_GAP for i in range(len(sequence))]
+
+        changed = []
+        for material, order in zip(sequence, targets):
+            if material.order != order:
+                changed.append((material, order))
+        vacated = {material.order for material, _ in changed}
+        if any(order in vacated for _, order in changed):
+            # rows trading places would collide on the unique (course,
+            # order) midway through the update: park them past the end first
+            parked = max(max(vacated), max(targets)) + 1
+            for i, (material, _) in enumerate(changed):
+                material.order = parked + i
+            Material.objects.bulk_update(
+                [material for material, _ in changed], ['order'], batch_size=500)
+        for material, order in changed:
+            material.order = order
+        changed = [material for material, _ in changed]
+        Material.objects.bulk_update(changed, ['order'], batch_size=500)
+
+    if changed:
+        # bulk_update sends no post_save, so refresh the detail fragments here
+        bump_course_version(course.pk)
+    return sequence
@@ -0,0 +1,76 @@
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import Case, Value, When
+
+from .cache import DASHBOARD_TIMEOUT, access_key
+from .models import Course, Enrollment
+
+# One place to answer "what is this user to course X". A user's relation
+# to every course they touch (creator, collaborator, enrolled, blocked) is
+# read with a single UNION query, memoised on the user object for the rest
+# of the request and cached across requests. courses.signals drops the
+# cached map whenever the user's enrollments or memberships change.
+
+CREATOR, COLLABORATOR, ENROLLED, BLOCKED = 1, 2, 4, 8
+ACCESS_TIMEOUT = DASHBOARD_TIMEOUT
+
+
+class CourseAccess(namedtuple(
+        "CourseAccess", "creator collaborator enrolled blocked")):
+    __slots__ = ()
+
+    @classmethod
+    def from_flags(cls, flags):
+        return cls(bool(flags & CREATOR), bool(flags & COLLABORATOR),
+                   bool(flags & ENROLLED), bool(flags & BLOCKED))
+
+    @property
+    def teacher(self):
+        return self.creator or self.collaborator
+
+    @property
+    def can_view_materials(self):
+        return self.teacher or (self.enrolled and not self.blocked)
+
+
+NO_ACCESS = CourseAccess.from_flags(0)
+
+
+def build_access_map(user_id):
+    """{course id: flags} for every course the user created, teaches or joined."""
+    created = Course.objects.filter(
+        creator_id=user_id).values_list("id", Value(CREATOR))
+    teaching = Course.collaborators.through.objects.filter(
+        user_id=user_id).values_list("course_id", Value(COLLABORATOR))
+    enrolled = Enrollment.objects.filter(user_id=user_id).values_list(
+        "course_id",
+        Case(When(blocked=True, then=Value(ENROLLED | BLOCKED)),
+             default=Value(ENROLLED)))
+    access = {}
+    for course_id, flags in created.union(teaching, enrolled, all=True):
+        access[course_id] = access.get(course_id, 0) | flags
+    return access
+
+
+def get_access_map(user):
+    if not hasattr(user, "_course_access"):
+        key = access_key(user.id)
+        access = cache.get(key)
+        if access is None:
+            access = build_access_map(user.id)
+            cache.set(key, access, ACCESS_TIMEOUT)
+        user._course_access = access
+    return user._course_access
+
+
+def course_access(user, course):
+    """CourseAccess of `user` for `course` (a Course or its id)."""
+    if not user.is_authenticated:
+        return NO_ACCESS
+    course_id = getattr(course, "pk", course)
+    return CourseAccess.from_flags(get_access_map(user).get(course_id, 0))
+
+
+def is_course_teacher(user, course):
+    return course_access(user, course).teacher
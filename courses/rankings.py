@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import CourseFeedback, CourseRanking, CourseRatingBucket
+
+# Rating histograms and the "top rated" ranking. The histogram buckets are
+# maintained incrementally by courses.signals; the ranking is rebuilt from
+# them by the periodic refresh_course_rankings task and only ever read at
+# request time.
+#
+# Courses are ranked by Bayesian average: each course's reviews are
+# blended with PRIOR_WEIGHT imaginary reviews at the site-wide mean, so a
+# single 10/10 doesn't outrank a hundred 9s.
+
+RATINGS = range(0, 11)
+PRIOR_WEIGHT = 5
+TOP_LIMIT = 20
+MAX_TOP_LIMIT = 100
+
+
+def rating_histogram(course_id):
+    """[(rating, count)] for every rating 0-10, in order."""
+    counts = dict(CourseRatingBucket.objects.filter(
+        course_id=course_id).values_list("rating", "count"))
+    return [(rating, counts.get(rating, 0)) for rating in RATINGS]
+
+
+def rebuild_rating_buckets(course_ids):
+    """Recount the buckets of `course_ids` from their feedback."""
+    rows = (CourseFeedback.objects.filter(course_id__in=course_ids)
+            .values("course_id", "rating").annotate(c=Count("id")))
+    with transaction.atomic():
+        CourseRatingBucket.objects.filter(course_id__in=course_ids).delete()
+        CourseRatingBucket.objects.bulk_create(
+            [CourseRatingBucket(course_id=row["course_id"], rating=row["rating"],
+                                count=row["c"]) for row in rows],
+            batch_size=1000)
+
+
+def bayesian_score(total, count, mean, weight=PRIOR_WEIGHT):
+    return (weight * mean + total) / (weight + count)
+
+
+def refresh_rankings(now=None):
+    """Rebuild CourseRanking from the buckets. Returns the ranked count."""
+    totals = list(
+        CourseRatingBucket.objects.filter(count__gt=0)
+        .values("course_id")
+        .annotate(n=Sum("count"), total=Sum(F("count") * F("rating"))))
+    all_reviews = sum(row["n"] for row in totals)
+    mean = sum(row["total"] for row in totals) / all_reviews if all_reviews else 0
+
+    for row in totals:
+        row["score"] = bayesian_score(row["total"], row["n"], mean)
+    # ties go to the course with more reviews, then the older course
+    totals.sort(key=lambda row: (-row["score"], -row["n"], row["course_id"]))
+
+    now = now or timezone.now()
+    rankings = [
+        CourseRanking(course_id=row["course_id"], position=position,
+                      score=row["score"], rating_count=row["n"],
+                      rating_avg=row["total"] / row["n"], refreshed_at=now)
+        for position, row in enumerate(totals, start=1)
+    ]
+    with transaction.atomic():
+        CourseRanking.objects.all().delete()
+        CourseRanking.objects.bulk_create(rankings, batch_size=1000)
+    return len(rankings)
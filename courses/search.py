@@ -0,0 +1,215 @@
+import base64
+import json
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+
+from .models import Course, Material
+
+# Ranked full-text search over extracted material text (courses.extraction)
+# and over the course catalog. The indexes are vendor specific (migrations
+# 0006 and 0007): FTS5 tables on SQLite, expression GIN indexes on Postgres.
+# Queries rank and limit in the database; material snippets are only built
+# for the rows that are returned.
+
+SEARCH_LIMIT = 20
+MAX_LIMIT = 50
+# snippet markers: control characters cannot occur in escaped text, so
+# the snippet can be HTML-escaped first and the markers swapped for <mark>
+START, STOP = "\x02", "\x03"
+TOKEN_RE = re.compile(r"\w+")
+
+SQLITE_SQL = """
+    SELECT m.id, bm25(courses_materialtext_fts) AS rank,
+           snippet(courses_materialtext_fts, 0, %s, %s, '…', 16)
+    FROM courses_materialtext_fts
+    JOIN courses_materialtext t ON t.id = courses_materialtext_fts.rowid
+    JOIN courses_material m ON m.blob_id = t.blob_id
+    WHERE courses_materialtext_fts MATCH %s AND m.course_id IN ({access})
+    ORDER BY rank, m.id
+    LIMIT %s
+"""
+
+POSTGRES_SQL = """
+    SELECT hit.id, hit.rank,
+           ts_headline('english', t.text, websearch_to_tsquery('english', %s),
+                       %s)
+    FROM (
+        SELECT m.id, t.id AS text_id,
+               ts_rank(to_tsvector('english', t.text), q) AS rank
+        FROM courses_materialtext t
+        JOIN courses_material m ON m.blob_id = t.blob_id,
+             websearch_to_tsquery('english', %s) q
+        WHERE to_tsvector('english', t.text) @@ q
+          AND m.course_id IN ({access})
+        ORDER BY rank DESC, m.id
+        LIMIT %s
+    ) hit
+    JOIN courses_materialtext t ON t.id = hit.text_id
+    ORDER BY hit.rank DESC, hit.id
+"""
+POSTGRES_HEADLINE = (
+    f"StartSel={START}, StopSel={STOP}, MaxWords=24, MinWords=8, "
+    "MaxFragments=2, FragmentDelimiter=\" … \""
+)
+
+
+def accessible_courses(user):
+    """Courses whose materials `user` may read: taught or enrolled, unblocked."""
+    return Course.objects.filter(
+        Q(creator=user)
+        | Q(collaborators=user)
+        | Q(enrollment__user=user, enrollment__blocked=False)
+    ).values("id")
+
+
+def fts5_query(query):
+    """User input as an FTS5 expression: every word, quoted, all required."""
+    return " ".join(f'"{token}"' for token in TOKEN_RE.findall(query))
+
+
+def render_snippet(snippet):
+    return escape(snippet or "").replace(START, "<mark>").replace(STOP, "</mark>")
+
+
+def search_materials(user, query, limit=SEARCH_LIMIT):
+    """
+    Materials readable by `user` whose text matches `query`, best first.
+    Each result carries `search_rank` and an HTML `search_snippet`.
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    access_sql, access_params = accessible_courses(
+        user).query.sql_with_params()
+
+    if connection.vendor == "postgresql":
+        if not query.strip():
+            return []
+        sql = POSTGRES_SQL.format(access=access_sql)
+        params = [query, POSTGRES_HEADLINE, query, *access_params, limit]
+    elif connection.vendor == "sqlite":
+        match = fts5_query(query)
+        if not match:
+            return []
+        sql = SQLITE_SQL.format(access=access_sql)
+        params = [START, STOP, match, *access_params, limit]
+    else:
+        raise NotImplementedError(
+            f"material search is not available on {connection.vendor}")
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    materials = Material.objects.select_related("course").in_bulk(
+        [material_id for material_id, _, _ in rows])
+    results = []
+    for material_id, rank, snippet in rows:
+        material = materials.get(material_id)
+        if material is None:
+            continue
+        # bm25 is lower-is-better; report higher-is-better on both vendors
+        material.search_rank = -rank if connection.vendor == "sqlite" else rank
+        material.search_snippet = render_snippet(snippet)
+        results.append(material)
+    return results
+
+
+# Catalog search pages by keyset on (score, id) rather than OFFSET, so a
+# deep page skips straight to its rows instead of ranking and discarding
+# everything before it. The cursor is the last row's (score, id).
+
+COURSE_VECTOR = (
+    "(setweight(to_tsvector('english', c.title), 'A') || "
+    "setweight(to_tsvector('english', c.description), 'B'))"
+)
+
+SQLITE_COURSE_SQL = """
+    SELECT id, score FROM (
+        SELECT rowid AS id, bm25(courses_course_fts, 10.0, 1.0) AS score
+        FROM courses_course_fts
+        WHERE courses_course_fts MATCH %s
+    ) hit
+    {keyset}
+    ORDER BY score, id
+    LIMIT %s
+"""
+SQLITE_COURSE_KEYSET = "WHERE score > %s OR (score = %s AND id > %s)"
+
+POSTGRES_COURSE_SQL = f"""
+    SELECT id, score FROM (
+        SELECT c.id, ts_rank({COURSE_VECTOR}, q)::float8 AS score
+        FROM courses_course c, websearch_to_tsquery('english', %s) q
+        WHERE {COURSE_VECTOR} @@ q
+    ) hit
+    {{keyset}}
+    ORDER BY score DESC, id
+    LIMIT %s
+"""
+POSTGRES_COURSE_KEYSET = "WHERE score < %s OR (score = %s AND id > %s)"
+
+
+def encode_cursor(score, pk):
+    raw = json.dumps([score, pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(score, id) from a cursor; ValueError if it was tampered with."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        score, pk = json.loads(raw)
+        return float(score), int(pk)
+    except (TypeError, ValueError) as e:
+        raise ValueError("invalid cursor") from e
+
+
+def search_courses(query, limit=SEARCH_LIMIT, cursor=None, queryset=None):
+    """
+    One page of courses whose title or description match `query`, best
+    first, as (courses, next_cursor). next_cursor is None on the last page.
+    Each course carries `search_rank`; `queryset` controls how the page's
+    rows are fetched (select_related etc.).
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    after = decode_cursor(cursor) if cursor else None
+
+    if connection.vendor == "postgresql":
+        if not query.strip():
+            return [], None
+        sql, keyset, match = POSTGRES_COURSE_SQL, POSTGRES_COURSE_KEYSET, query
+    elif connection.vendor == "sqlite":
+        match = fts5_query(query)
+        if not match:
+            return [], None
+        sql, keyset = SQLITE_COURSE_SQL, SQLITE_COURSE_KEYSET
+    else:
+        raise NotImplementedError(
+            f"course search is not available on {connection.vendor}")
+
+    params = [match]
+    if after is not None:
+        score, pk = after
+        params += [score, score, pk]
+    params.append(limit + 1)
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(
+            sql.format(keyset=keyset if after is not None else ""), params)
+        rows = db_cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_pk, last_score = rows[-1]
+        next_cursor = encode_cursor(last_score, last_pk)
+    queryset = Course.objects.all() if queryset is None else queryset
+    courses = queryset.in_bulk([pk for pk, _ in rows])
+    results = []
+    for pk, score in rows:
+        course = courses.get(pk)
+        if course is None:
+            continue
+        course.search_rank = -score if connection.vendor == "sqlite" else score
+        results.append(course)
+    return results, next_cursor
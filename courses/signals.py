@@ -0,0 +1,224 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from .analytics import record_activities, record_activity
+from .blobs import adopt_stored_file, release_blob, store_blob
+from .cache import bump_course_version, invalidate_user_courses
+from .models import (Course, CourseActivity, CourseFeedback,
+                     CourseRatingBucket, Enrollment, Material)
+from .rankings import rebuild_rating_buckets
+from .tasks import extract_material_text
+
+# keep the denormalised rating aggregates on Course and the rating
+# histogram (courses.rankings) in step with feedback
+
+
+@receiver(post_save, sender=CourseFeedback)
+def feedback_saved(sender, instance, created, **kwargs):
+    if created:
+        Course.apply_rating_delta(instance.course_id, instance.rating, 1)
+        CourseRatingBucket.apply_delta(instance.course_id, instance.rating, 1)
+    else:
+        previous = getattr(instance, "_loaded_rating", None)
+        if previous is None:
+            # instance was not loaded from the db, fall back to a rebuild
+            Course.objects.get(pk=instance.course_id).rebuild_rating_aggregates()
+            rebuild_rating_buckets([instance.course_id])
+        elif previous != instance.rating:
+            Course.apply_rating_delta(
+                instance.course_id, instance.rating - previous, 0)
+            CourseRatingBucket.apply_delta(instance.course_id, previous, -1)
+            CourseRatingBucket.apply_delta(instance.course_id, instance.rating, 1)
+    instance._loaded_rating = instance.rating
+
+
+@receiver(post_delete, sender=CourseFeedback)
+def feedback_deleted(sender, instance, **kwargs):
+    rating = getattr(instance, "_loaded_rating", None)
+    if rating is None:
+        rating = instance.rating
+    Course.apply_rating_delta(instance.course_id, -rating, -1)
+    CourseRatingBucket.apply_delta(instance.course_id, rating, -1)
+
+
+# drop cached course dashboards and access maps when a user's courses change
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def enrollment_changed(sender, instance, **kwargs):
+    invalidate_user_courses([instance.user_id])
+
+
+def _m2m_user_ids(instance, reverse, pk_set):
+    # forward: instance is a Course and pk_set holds users;
+    # reverse: instance is the User itself
+    if reverse:
+        return [instance.pk]
+    return list(pk_set or ())
+
+
+@receiver(m2m_changed, sender=Course.enrolled_users.through)
+def enrolled_users_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove"):
+        invalidate_user_courses(_m2m_user_ids(instance, reverse, pk_set))
+    elif action == "pre_clear":
+        if reverse:
+            invalidate_user_courses([instance.pk])
+        else:
+            invalidate_user_courses(
+                instance.enrolled_users.values_list("id", flat=True))
+
+
+@receiver(m2m_changed, sender=Course.collaborators.through)
+def collaborators_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove"):
+        invalidate_user_courses(_m2m_user_ids(instance, reverse, pk_set))
+    elif action == "pre_clear":
+        if reverse:
+            invalidate_user_courses([instance.pk])
+        else:
+            invalidate_user_courses(
+                instance.collaborators.values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, created, **kwargs):
+    # new courses reach the creator via the collaborators m2m signal
+    if not created:
+        invalidate_user_courses(
+            [instance.creator_id,
+             *instance.collaborators.values_list("id", flat=True)])
+
+
+@receiver(pre_delete, sender=Course)
+def course_deleting(sender, instance, **kwargs):
+    # collaborator rows are cascaded without m2m signals
+    invalidate_user_courses(instance.collaborators.values_list("id", flat=True))
+
+
+# log enrollment and feedback events for the analytics rollups
+# (courses.analytics)
+
+@receiver(post_save, sender=Enrollment)
+def log_enrollment_saved(sender, instance, created, **kwargs):
+    if created:
+        record_activity(instance.course_id, CourseActivity.ENROLLED)
+    else:
+        previous = getattr(instance, "_loaded_blocked", None)
+        if previous is not None and previous != instance.blocked:
+            record_activity(
+                instance.course_id,
+                CourseActivity.BLOCKED if instance.blocked
+                else CourseActivity.UNBLOCKED)
+    instance._loaded_blocked = instance.blocked
+
+
+@receiver(post_delete, sender=Enrollment)
+def log_enrollment_deleted(sender, instance, **kwargs):
+    # also fires for enrolled_users.remove(), which deletes through rows
+    record_activity(instance.course_id, CourseActivity.UNENROLLED)
+
+
+@receiver(m2m_changed, sender=Course.enrolled_users.through)
+def log_enrolled_users_added(sender, instance, action, reverse, pk_set, **kwargs):
+    # enrolled_users.add() bulk-creates through rows without post_save
+    if action != "post_add" or not pk_set:
+        return
+    if reverse:
+        record_activities(pk_set, CourseActivity.ENROLLED)
+    else:
+        record_activities([instance.pk] * len(pk_set), CourseActivity.ENROLLED)
+
+
+@receiver(post_save, sender=CourseFeedback)
+def log_feedback_created(sender, instance, created, **kwargs):
+    if created:
+        record_activity(
+            instance.course_id, CourseActivity.FEEDBACK, rating=instance.rating)
+
+
+@receiver(post_delete, sender=Course)
+def purge_course_activity(sender, instance, **kwargs):
+    # the log has no constraint on the course (see CourseActivity), so a
+    # deleted course's events, including the unenrollments its delete
+    # just logged, go here
+    CourseActivity.objects.filter(course_id=instance.pk).delete()
+
+
+# bump the course version so shared detail fragments are re-rendered
+
+
+@receiver(post_save, sender=Material)
+@receiver(post_delete, sender=Material)
+@receiver(post_save, sender=CourseFeedback)
+@receiver(post_delete, sender=CourseFeedback)
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def course_content_changed(sender, instance, **kwargs):
+    bump_course_version(instance.course_id)
+
+
+@receiver(m2m_changed, sender=Course.enrolled_users.through)
+@receiver(m2m_changed, sender=Course.collaborators.through)
+def course_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            bump_course_version(instance.pk)
+        return
+
+    # reverse side: instance is a User and pk_set holds courses
+    if action in ("post_add", "post_remove"):
+        course_ids = pk_set or ()
+    elif action == "pre_clear":
+        if sender is Course.collaborators.through:
+            course_ids = instance.courses_teaching.values_list("id", flat=True)
+        else:
+            course_ids = instance.courses_enrolled.values_list("id", flat=True)
+    else:
+        return
+    for course_id in course_ids:
+        bump_course_version(course_id)
+
+
+# material files are stored once per distinct content (courses.blobs)
+
+
+@receiver(pre_save, sender=Material)
+def material_store_blob(sender, instance, **kwargs):
+    content = instance.content
+    if not content:
+        instance.blob = None
+    elif not content._committed:
+        # new or replaced upload: store it by hash instead of by name
+        blob = store_blob(content, content.name, storage=content.storage)
+        instance.blob = blob
+        content.name = blob.path
+        content._committed = True
+    elif instance.blob_id is None:
+        # a file already written under its own name (legacy rows,
+        # FieldFile.save): move it into blob storage if it exists
+        blob = adopt_stored_file(
+            content.name, storage=content.storage, exclude_material=instance)
+        if blob is not None:
+            instance.blob = blob
+            content.name = blob.path
+
+
+@receiver(post_save, sender=Material)
+def material_blob_changed(sender, instance, **kwargs):
+    previous = getattr(instance, "_loaded_blob_id", None)
+    if previous is not None and previous != instance.blob_id:
+        release_blob(previous, storage=instance.content.storage)
+    if instance.blob_id is not None and previous != instance.blob_id:
+        # new content: index its text once the blob row is committed
+        blob_id = instance.blob_id
+        transaction.on_commit(lambda: extract_material_text.delay(blob_id))
+    instance._loaded_blob_id = instance.blob_id
+
+
+@receiver(post_delete, sender=Material)
+def material_release_blob(sender, instance, **kwargs):
+    release_blob(instance.blob_id, storage=instance.content.storage)
@@ -1,25 +1,127 @@
-from celery import shared_task
-from .models import Course
+from celery import group, shared_task
+from .analytics import rollup_activity
+from .digests import (digest_window, flush_digest, flush_due_digests,
+                      record_enrollment)
+from .extraction import index_blob_text
+from .models import Course, Enrollment
+from .rankings import refresh_rankings
+from .uploads import expire_uploads
 from accounts.models import Notification
 
 
 @shared_task
-def notify_teacher_of_enrollment(teacher_id, student_name, course_title):
-    message = f"{student_name} has enrolled in your course: {course_title}."
-    print(f"Notification to {teacher_id}: {message}")
+def notify_teacher_of_enrollment(teacher_id, student_name, course_title, course_id=None):
+    # buffered and sent as a digest, see courses.digests
+    if course_id is None:
+        # queued before course_id was passed; titles are unique
+        course_id = (Course.objects.filter(title=course_title)
+                     .values_list("id", flat=True).first())
+        if course_id is None:
+            return
+    opened = record_enrollment(teacher_id, course_id, student_name)
+    window = digest_window()
+    if not window:
+        flush_digest(teacher_id, course_id)
+    elif opened:
+        flush_enrollment_digest.apply_async(
+            (teacher_id, course_id), countdown=window.total_seconds())
+
+
+@shared_task
+def flush_enrollment_digest(teacher_id, course_id):
+    flush_digest(teacher_id, course_id)
+
+
+@shared_task
+def flush_enrollment_digests():
+    # periodic safety net for windows whose scheduled flush was lost
+    return flush_due_digests()
+
+
+# New-material notifications fan out as one subtask per range of
+# NOTIFY_CHUNK_SIZE enrolled students. The dispatcher only finds the range
+# boundaries and each subtask streams its own user ids, so no task holds
+# more than a batch in memory and chunks run in parallel across workers.
+NOTIFY_CHUNK_SIZE = 2000
+NOTIFY_BATCH_SIZE = 500
+
+
+def student_id_ranges(course_id, chunk_size=NOTIFY_CHUNK_SIZE):
+    """(after, upto) user id bounds covering the course's unblocked students."""
+    students = (Enrollment.objects
+                .filter(course_id=course_id, blocked=False)
+                .order_by("user_id")
+                .values_list("user_id", flat=True))
+    after = None
+    while True:
+        rest = students if after is None else students.filter(user_id__gt=after)
+        upto = rest[chunk_size - 1:chunk_size].first()
+        yield after, upto
+        if upto is None:
+            return
+        after = upto
+
+
+@shared_task
+def notify_students_new_material(course_id, material_title):
+    title = (Course.objects.filter(id=course_id)
+             .values_list("title", flat=True).first())
+    if title is None:
+        return
+    message = f"New material '{material_title}' has been added to your course '{title}'."
+    group(
+        notify_students_chunk.s(course_id, message, after, upto)
+        for after, upto in student_id_ranges(course_id)
+    ).apply_async()
+
+
+@shared_task
+def notify_students_chunk(course_id, message, after, upto):
+    students = (Enrollment.objects
+                .filter(course_id=course_id, blocked=False)
+                .order_by("user_id")
+                .values_list("user_id", flat=True))
+    if upto is not None:
+        students = students.filter(user_id__lte=upto)
+    while True:
+        # keyset batches: no open cursor while inserting, one short
+        # transaction per batch
+        page = students if after is None else students.filter(user_id__gt=after)
+        user_ids = list(page[:NOTIFY_BATCH_SIZE])
+        if not user_ids:
+            return
+        Notification.objects.bulk_create(
+            [Notification(user_id=user_id, message=message) for user_id in user_ids])
+        after = user_ids[-1]
+
+
+@shared_task
+def expire_material_uploads():
+    # drop chunked uploads that were abandoned part way through
+    return expire_uploads()
+
+
+@shared_task
+def extract_material_text(blob_id):
+    # no-op when this content has already been indexed
+    return index_blob_text(blob_id)
+
+
+@shared_task
+def notify_teacher_of_bulk_enrollment(teacher_id, course_title, enrolled_count):
+    # one summary for an imported cohort instead of one per student
     Notification.objects.create(
         user_id=teacher_id,
-        message=f"{student_name} has enrolled in your course {course_title}."
+        message=f"{enrolled_count} students were enrolled in your course {course_title}."
     )
 
 
 @shared_task
-def notify_students_new_material(course_id, material_title):
-    course = Course.objects.get(id=course_id)
-    enrolled_students = course.enrolled_users.all()
-    message = f"New material '{material_title}' has been added to your course '{course.title}'."
-    notifications = [
-        Notification(user=student, message=message)
-        for student in enrolled_students
-    ]
-    Notification.objects.bulk_create(notifications)
+def refresh_course_rankings():
+    return refresh_rankings()
+
+
+@shared_task
+def rollup_course_activity():
+    # folds new CourseActivity events into CourseDailyStats
+    return rollup_activity()
@@ -0,0 +1,37 @@
+import pytest
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.test import Client
+from courses.models import Course
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # cached course data must not leak between tests
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def teacher_user(django_user_model):
+    user = django_user_model.objects.create_user(
+        username='teacher', password='pass')
+    teacher_group, _ = Group.objects.get_or_create(name='teacher')
+    user.groups.add(teacher_group)
+    return user
+
+
+@pytest.fixture
+def student_user(django_user_model):
+    return django_user_model.objects.create_user(username='student', password='pass')
+
+
+@pytest.fixture
+def course(teacher_user):
+    return Course.objects.create(title="Test Course", creator=teacher_user)
+
+
+@pytest.fixture
+def client():
+    return Client()
@@ -0,0 +1,106 @@
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from courses.analytics import rollup_activity
+from courses.enrollments import bulk_enroll
+from courses.models import CourseActivity, CourseDailyStats, CourseFeedback, Enrollment
+
+
+def later():
+    return timezone.now() + timedelta(minutes=5)
+
+
+@pytest.mark.django_db
+def test_membership_and_feedback_changes_are_logged(course, student_user, django_user_model):
+    course.enrolled_users.add(student_user)
+    enrollment = Enrollment.objects.get(course=course, user=student_user)
+    enrollment.blocked = True
+    enrollment.save()
+    enrollment.blocked = False
+    enrollment.save()
+    CourseFeedback.objects.create(course=course, user=student_user, rating=6)
+    course.enrolled_users.remove(student_user)
+    django_user_model.objects.create_user(username='cohort1')
+    bulk_enroll(course, [(1, 'cohort1')])
+
+    kinds = list(CourseActivity.objects.order_by('id').values_list('kind', flat=True))
+    assert kinds == ['enrolled', 'blocked', 'unblocked', 'feedback', 'unenrolled', 'enrolled']
+
+
+@pytest.mark.django_db
+def test_rollup_only_processes_new_settled_events(course, student_user):
+    Enrollment.objects.create(course=course, user=student_user)
+    CourseFeedback.objects.create(course=course, user=student_user, rating=8)
+
+    # too fresh: left for the next run
+    assert rollup_activity() == 0
+    assert rollup_activity(now=later()) == 2
+    assert rollup_activity(now=later()) == 0
+
+    CourseActivity.objects.create(course=course, kind=CourseActivity.FEEDBACK, rating=4)
+    assert rollup_activity(now=later(), batch_size=1) == 1
+
+    stats = CourseDailyStats.objects.get(course=course)
+    assert (stats.enrollments, stats.feedback_count) == (1, 2)
+    assert stats.rating_avg == pytest.approx(6.0)
+
+
+@pytest.mark.django_db
+def test_analytics_reads_only_rollups(client, course, student_user, teacher_user,
+                                      django_assert_num_queries):
+    Enrollment.objects.create(course=course, user=student_user)
+    rollup_activity(now=later())
+    url = reverse('courses:course_detail_section',
+                  kwargs={'course_id': course.id, 'section': 'analytics'})
+
+    client.force_login(student_user)
+    assert client.get(url).status_code == 403
+
+    client.force_login(teacher_user)
+    client.get(url)
+    # session, user, course, daily stats, unread count
+    with django_assert_num_queries(5):
+        response = client.get(url)
+    assert response.status_code == 200
+    assert response.context['analytics_totals']['enrollments'] == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_deleting_course_with_enrollments(course, student_user):
+    Enrollment.objects.create(course=course, user=student_user)
+
+    course.delete()
+
+    assert not CourseActivity.objects.filter(course_id=course.pk).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_deleting_teacher_with_enrolled_course(course, student_user):
+    Enrollment.objects.create(course=course, user=student_user)
+
+    course.creator.delete()
+
+    assert not CourseActivity.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_deleting_student_logs_unenrollment(course, student_user):
+    Enrollment.objects.create(course=course, user=student_user)
+
+    student_user.delete()
+
+    kinds = list(CourseActivity.objects.order_by('id').values_list('kind', flat=True))
+    assert kinds == ['enrolled', 'unenrolled']
+
+
+@pytest.mark.django_db
+def test_rollup_skips_events_of_deleted_courses(course):
+    # left behind by a delete that purged before they were logged
+    CourseActivity.objects.create(course_id=course.pk + 1000, kind=CourseActivity.ENROLLED)
+    CourseActivity.objects.create(course=course, kind=CourseActivity.ENROLLED)
+
+    assert rollup_activity(now=later()) == 2
+    assert list(CourseDailyStats.objects.values_list('course_id', 'enrollments')) == [
+        (course.pk, 1)]
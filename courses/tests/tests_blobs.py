@@ -0,0 +1,96 @@
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from courses.models import Material, MaterialBlob
+from courses.ordering import next_order
+
+HANDOUT = b'%PDF-1.4 the same handout every term'
+
+
+@pytest.fixture(autouse=True)
+def media(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+
+def upload(course, title, data=HANDOUT, name='handout.pdf'):
+    return Material.objects.create(
+        course=course, title=title, order=next_order(course.id),
+        content=SimpleUploadedFile(name, data))
+
+
+@pytest.mark.django_db
+def test_identical_uploads_share_one_blob(course, django_capture_on_commit_callbacks):
+    first = upload(course, 'Week 1')
+    second = upload(course, 'Week 1 again', name='copy.pdf')
+
+    assert first.blob_id == second.blob_id
+    assert first.content.name == second.content.name == first.blob.path
+    blob = MaterialBlob.objects.get()
+    assert blob.ref_count == 2
+    assert default_storage.exists(blob.path)
+
+    first.delete()
+    blob.refresh_from_db()
+    assert blob.ref_count == 1
+    assert default_storage.exists(blob.path)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        second.delete()
+    assert not MaterialBlob.objects.exists()
+    assert not default_storage.exists(blob.path)
+
+
+@pytest.mark.django_db
+def test_replacing_a_file_releases_the_old_blob(course, django_capture_on_commit_callbacks):
+    material = upload(course, 'Slides')
+    old_path = material.blob.path
+
+    material = Material.objects.get(pk=material.pk)
+    material.content = SimpleUploadedFile('slides.pdf', b'revised slides')
+    with django_capture_on_commit_callbacks(execute=True):
+        material.save()
+
+    assert MaterialBlob.objects.count() == 1
+    assert not MaterialBlob.objects.filter(path=old_path).exists()
+    assert not default_storage.exists(old_path)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_rolled_back_delete_keeps_the_blob_file(course):
+    material = upload(course, 'Week 1')
+    pk, path = material.pk, material.blob.path
+
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            material.delete()
+            raise RuntimeError("view failed")
+
+    assert MaterialBlob.objects.filter(path=path).exists()
+    assert default_storage.exists(path)
+
+    Material.objects.get(pk=pk).delete()
+    assert not default_storage.exists(path)
+
+
+@pytest.mark.django_db
+def test_dedupe_materials_merges_legacy_files(course):
+    names = [default_storage.save(f'course_materials/7{suffix}.401.pdf', ContentFile(HANDOUT))
+             for suffix in ('', '_BT1Zoa8', '_VZWpjZM')]
+    orphan = default_storage.save('course_materials/stray.pdf', ContentFile(b'stray'))
+    # legacy rows written before blob storage existed (no signals)
+    Material.objects.bulk_create([
+        Material(course=course, title=f'Copy {i}', order=i, content=name)
+        for i, name in enumerate(names)
+    ])
+
+    call_command('dedupe_materials', '--delete-orphans')
+
+    blob = MaterialBlob.objects.get()
+    assert blob.ref_count == 3
+    assert set(Material.objects.values_list('content', flat=True)) == {blob.path}
+    assert not any(default_storage.exists(name) for name in names)
+    assert not default_storage.exists(orphan)
+    assert default_storage.exists(blob.path)
@@ -1,34 +1,8 @@
 import pytest
 from django.urls import reverse
-from django.contrib.auth.models import Group
-from django.test import Client
 from courses.models import Course, Enrollment, Material
 
 
-@pytest.fixture
-def teacher_user(django_user_model):
-    user = django_user_model.objects.create_user(
-        username='teacher', password='pass')
-    teacher_group, _ = Group.objects.get_or_create(name='teacher')
-    user.groups.add(teacher_group)
-    return user
-
-
-@pytest.fixture
-def student_user(django_user_model):
-    return django_user_model.objects.create_user(username='student', password='pass')
-
-
-@pytest.fixture
-def course(teacher_user):
-    return Course.objects.create(title="Test Course", creator=teacher_user)
-
-
-@pytest.fixture
-def client():
-    return Client()
-
-
 @pytest.mark.django_db
 def test_course_create_view_permission(client, teacher_user, student_user):
     # Teacher can access course creation page
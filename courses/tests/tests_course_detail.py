@@ -0,0 +1,130 @@
+import pytest
+from django.contrib.auth.models import Group
+from django.urls import reverse
+from courses.models import CourseFeedback, Enrollment, Material
+
+# Every section has a fixed query budget, independent of how many
+# materials, students or reviews the course has:
+#   session + user + course + context processors (roles, unread count)
+#   plus the section's own data.
+# SECTION_QUERIES is a cold fragment cache, WARM_SECTION_QUERIES a warm one,
+# where the roles and membership also come from the per-user caches.
+SECTION_QUERIES = {
+    # + membership + materials
+    'materials': 7,
+    # + membership + already-reviewed check + ranking + histogram + feedback list
+    'feedback': 10,
+    # + collaborators + roster (users joined)
+    'teacher_area': 7,
+    # + membership
+    'registration': 6,
+}
+WARM_SECTION_QUERIES = {
+    'materials': 4,
+    'feedback': 6,
+    'teacher_area': 5,
+    'registration': 4,
+}
+
+
+@pytest.fixture
+def populated_course(course, django_user_model):
+    student_group, _ = Group.objects.get_or_create(name='student')
+    for i in range(5):
+        Material.objects.create(course=course, title=f'Week {i}', order=i,
+                                content=f'course_materials/week{i}.pdf')
+        student = django_user_model.objects.create_user(
+            username=f'enrolled{i}', password='pass')
+        student.groups.add(student_group)
+        Enrollment.objects.create(course=course, user=student)
+        CourseFeedback.objects.create(course=course, user=student, rating=i)
+    return course
+
+
+@pytest.fixture
+def enrolled_student(populated_course, student_user):
+    student_user.groups.add(Group.objects.get(name='student'))
+    Enrollment.objects.create(course=populated_course, user=student_user)
+    return student_user
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('section', ['materials', 'feedback', 'registration'])
+def test_student_section_query_budget(client, populated_course, enrolled_student,
+                                      section, django_assert_num_queries):
+    client.force_login(enrolled_student)
+    url = reverse('courses:course_detail_section',
+                  kwargs={'course_id': populated_course.id, 'section': section})
+    with django_assert_num_queries(SECTION_QUERIES[section]):
+        response = client.get(url)
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_teacher_area_query_budget(client, populated_course, teacher_user,
+                                   django_assert_num_queries):
+    client.force_login(teacher_user)
+    url = reverse('courses:course_detail_section',
+                  kwargs={'course_id': populated_course.id, 'section': 'teacher_area'})
+    with django_assert_num_queries(SECTION_QUERIES['teacher_area']):
+        response = client.get(url)
+    assert response.status_code == 200
+    assert len(response.context['students']) == 5
+    # the materials section data is never built for the roster
+    assert 'materials' not in response.context
+    assert 'feedbacks' not in response.context
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('section', ['materials', 'feedback', 'registration'])
+def test_warm_fragment_cache_skips_section_tables(client, populated_course, enrolled_student,
+                                                  section, django_assert_num_queries):
+    client.force_login(enrolled_student)
+    url = reverse('courses:course_detail_section',
+                  kwargs={'course_id': populated_course.id, 'section': section})
+    client.get(url)
+    with django_assert_num_queries(WARM_SECTION_QUERIES[section]):
+        response = client.get(url)
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_material_change_refreshes_fragment(client, populated_course, enrolled_student):
+    client.force_login(enrolled_student)
+    url = reverse('courses:course_detail_section',
+                  kwargs={'course_id': populated_course.id, 'section': 'materials'})
+    client.get(url)
+
+    Material.objects.create(course=populated_course, title='Late addition', order=99,
+                            content='course_materials/late.pdf')
+    response = client.get(url)
+    assert b'Late addition' in response.content
+
+
+@pytest.mark.django_db
+def test_roster_fragment_shared_between_teachers(client, populated_course, teacher_user,
+                                                 django_user_model, django_assert_num_queries):
+    client.force_login(teacher_user)
+    url = reverse('courses:course_detail_section',
+                  kwargs={'course_id': populated_course.id, 'section': 'teacher_area'})
+    client.get(url)
+
+    other = django_user_model.objects.create_user(username='coteacher', password='pass')
+    other.groups.add(*teacher_user.groups.all())
+    client.force_login(other)
+    with django_assert_num_queries(WARM_SECTION_QUERIES['teacher_area']):
+        response = client.get(url)
+    # block/unblock buttons still post with this user's csrf token
+    assert b'formaction="/courses/block_student/' in response.content
+
+
+@pytest.mark.django_db
+def test_feedback_section_context(client, populated_course, enrolled_student):
+    client.force_login(enrolled_student)
+    url = reverse('courses:course_detail_section',
+                  kwargs={'course_id': populated_course.id, 'section': 'feedback'})
+    response = client.get(url)
+    assert response.context['can_review'] is True
+    assert response.context['feedback_count'] == 5
+    assert response.context['average_rating'] == pytest.approx(2.0)
+    assert 'students' not in response.context
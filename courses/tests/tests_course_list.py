@@ -0,0 +1,98 @@
+import pytest
+from django.urls import reverse
+from courses.cache import dashboard_key
+from courses.models import Course, Enrollment
+from django.core.cache import cache
+
+
+@pytest.mark.django_db
+def test_dashboard_is_cached_and_dropped_on_enrollment(client, student_user, course):
+    client.login(username='student', password='pass')
+    url = reverse('courses:course_list')
+
+    response = client.get(url)
+    assert [c['title'] for c in response.context['all_courses']] == ['Test Course']
+    assert cache.get(dashboard_key(student_user.id)) is not None
+
+    client.post(reverse('courses:enroll', kwargs={'course_id': course.id}))
+    assert cache.get(dashboard_key(student_user.id)) is None
+
+    response = client.get(url)
+    assert [c['title'] for c in response.context['enrolled_courses']] == ['Test Course']
+    assert list(response.context['all_courses']) == []
+
+    Enrollment.objects.filter(user=student_user).delete()
+    assert cache.get(dashboard_key(student_user.id)) is None
+
+
+@pytest.mark.django_db
+def test_dashboard_dropped_on_collaborator_change(client, teacher_user, student_user, course):
+    client.login(username='student', password='pass')
+    client.get(reverse('courses:course_list'))
+
+    course.collaborators.add(student_user)
+    assert cache.get(dashboard_key(student_user.id)) is None
+
+    response = client.get(reverse('courses:course_list'))
+    assert [c['title'] for c in response.context['collaborating_courses']] == ['Test Course']
+
+
+@pytest.mark.django_db
+def test_available_courses_are_paginated(client, student_user, teacher_user):
+    for i in range(30):
+        Course.objects.create(title=f'Course {i:02d}', creator=teacher_user)
+    client.login(username='student', password='pass')
+
+    response = client.get(reverse('courses:course_list'))
+    page = response.context['available_page']
+    assert len(page.object_list) == 25
+    assert page.paginator.num_pages == 2
+
+    response = client.get(reverse('courses:course_list') + '?page=2')
+    assert len(response.context['all_courses'].object_list) == 5
+
+
+@pytest.mark.django_db
+def test_catalog_search_ranks_title_matches_first(client, student_user, teacher_user):
+    in_description = Course.objects.create(
+        title='Cell Biology', description='Covers genetics basics', creator=teacher_user)
+    in_title = Course.objects.create(
+        title='Genetics', description='Inheritance and DNA', creator=teacher_user)
+    Course.objects.create(title='Poetry', description='Sonnets', creator=teacher_user)
+    client.login(username='student', password='pass')
+
+    response = client.get(reverse('courses:course_list'), {'q': 'genetic'})
+
+    assert [c.id for c in response.context['search_results']] == [in_title.id, in_description.id]
+    assert response.context['search_next_cursor'] is None
+
+    # edits reach the index
+    in_description.description = 'Organelles'
+    in_description.save()
+    response = client.get(reverse('courses:course_list'), {'q': 'genetics'})
+    assert [c.id for c in response.context['search_results']] == [in_title.id]
+
+
+@pytest.mark.django_db
+def test_catalog_search_pages_by_cursor(client, student_user, teacher_user):
+    for i in range(45):
+        Course.objects.create(title=f'Algebra {i:02d}', creator=teacher_user)
+    client.login(username='student', password='pass')
+    url = reverse('courses:course_list')
+
+    seen = []
+    params = {'q': 'algebra'}
+    while True:
+        response = client.get(url, params)
+        seen += [c.id for c in response.context['search_results']]
+        cursor = response.context['search_next_cursor']
+        if cursor is None:
+            break
+        params['cursor'] = cursor
+
+    assert len(seen) == len(set(seen)) == 45
+
+    # a mangled cursor falls back to the first page
+    response = client.get(url, {'q': 'algebra', 'cursor': '!!'})
+    assert response.context['search_is_first_page']
+    assert len(response.context['search_results']) == 20
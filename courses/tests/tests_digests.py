@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+from accounts.models import Notification
+from courses.digests import flush_digest, flush_due_digests, record_enrollment
+from courses.models import Course, EnrollmentEvent
+from courses.tasks import notify_teacher_of_enrollment
+
+
+@pytest.mark.django_db
+def test_enrollments_are_coalesced_into_one_notification(course, teacher_user):
+    opened = [record_enrollment(teacher_user.id, course.id, f'Student {i}') for i in range(37)]
+    assert opened == [True] + [False] * 36
+    assert not Notification.objects.exists()
+
+    flush_digest(teacher_user.id, course.id)
+
+    [note] = Notification.objects.filter(user=teacher_user)
+    assert note.message == ('37 students enrolled in your course Test Course: '
+                            'Student 0, Student 1, Student 2 and 34 others.')
+    assert not EnrollmentEvent.objects.exists()
+    assert flush_digest(teacher_user.id, course.id) is None
+
+
+@pytest.mark.django_db
+def test_single_enrollment_keeps_the_plain_message(course, teacher_user):
+    record_enrollment(teacher_user.id, course.id, 'Ada')
+    assert flush_digest(teacher_user.id, course.id).message == (
+        'Ada has enrolled in your course Test Course.')
+
+
+@pytest.mark.django_db
+def test_periodic_flush_only_sends_full_windows(course, teacher_user, settings):
+    settings.ENROLLMENT_DIGEST_WINDOW = 300
+    other = Course.objects.create(title='Other', creator=teacher_user)
+    record_enrollment(teacher_user.id, course.id, 'Ada')
+    record_enrollment(teacher_user.id, other.id, 'Grace')
+    EnrollmentEvent.objects.filter(course=course).update(
+        created_at=timezone.now() - timedelta(minutes=6))
+
+    assert flush_due_digests() == 1
+    assert Notification.objects.get().message.endswith('Test Course.')
+    assert EnrollmentEvent.objects.get().course == other
+
+
+@pytest.mark.django_db
+def test_zero_window_notifies_at_once(course, teacher_user, settings):
+    settings.ENROLLMENT_DIGEST_WINDOW = 0
+    notify_teacher_of_enrollment(teacher_user.id, 'Ada', course.title, course_id=course.id)
+    notify_teacher_of_enrollment(teacher_user.id, 'Grace', course.title)
+
+    assert Notification.objects.filter(user=teacher_user).count() == 2
+    assert not EnrollmentEvent.objects.exists()
@@ -0,0 +1,73 @@
+import pytest
+from django.core.files.base import ContentFile
+from django.urls import reverse
+from courses.models import Enrollment, Material
+
+PAYLOAD = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def material(course, settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    m = Material(course=course, title='Lecture', order=1)
+    m.content.save('lecture.pdf', ContentFile(PAYLOAD), save=True)
+    return m
+
+
+@pytest.fixture
+def url(material):
+    return reverse('courses:material_download', args=[material.id])
+
+
+@pytest.mark.django_db
+def test_download_requires_access(client, url, course, student_user):
+    client.login(username='student', password='pass')
+    assert client.get(url).status_code == 403
+
+    enrollment = Enrollment.objects.create(course=course, user=student_user, blocked=True)
+    assert client.get(url).status_code == 403
+
+    enrollment.blocked = False
+    enrollment.save()
+    response = client.get(url)
+    assert response.status_code == 200
+    assert b''.join(response.streaming_content) == PAYLOAD
+    assert response['Accept-Ranges'] == 'bytes'
+
+
+@pytest.mark.django_db
+def test_download_range_and_etag(client, url, teacher_user):
+    client.login(username='teacher', password='pass')
+    etag = client.get(url)['ETag']
+
+    response = client.get(url, HTTP_RANGE='bytes=100-199')
+    assert response.status_code == 206
+    assert response['Content-Range'] == f'bytes 100-199/{len(PAYLOAD)}'
+    assert b''.join(response.streaming_content) == PAYLOAD[100:200]
+
+    response = client.get(url, HTTP_RANGE='bytes=-10')
+    assert b''.join(response.streaming_content) == PAYLOAD[-10:]
+
+    assert client.get(url, HTTP_RANGE=f'bytes={len(PAYLOAD)}-').status_code == 416
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    # a stale If-Range validator gets the whole file
+    response = client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_download_hands_off_to_proxy(client, url, material, teacher_user, settings):
+    settings.MATERIAL_SENDFILE = 'nginx'
+    settings.MATERIAL_SENDFILE_PREFIX = '/protected-media/'
+    client.login(username='teacher', password='pass')
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response['X-Accel-Redirect'] == f'/protected-media/{material.content.name}'
+    assert response.content == b''
+
+
+@pytest.mark.django_db
+def test_download_of_missing_file_is_404(client, url, material, teacher_user):
+    material.content.storage.delete(material.content.name)
+    client.login(username='teacher', password='pass')
+    assert client.get(url).status_code == 404
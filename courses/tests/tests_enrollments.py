@@ -0,0 +1,79 @@
+import pytest
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from courses.cache import dashboard_key, get_course_version, get_dashboard
+from courses.enrollments import bulk_enroll, read_identifiers
+from courses.models import Enrollment
+
+
+def csv_file(text):
+    return SimpleUploadedFile('cohort.csv', text.encode(), content_type='text/csv')
+
+
+@pytest.fixture
+def cohort(django_user_model):
+    return django_user_model.objects.bulk_create([
+        django_user_model(username=f'stu{i}', email=f'stu{i}@example.com')
+        for i in range(300)
+    ])
+
+
+@pytest.mark.django_db
+def test_read_identifiers_skips_header_and_blank_rows():
+    rows = read_identifiers(csv_file('username,name\nalice,Alice\n\n bob@example.com \n'))
+    assert rows == [(2, 'alice'), (4, 'bob@example.com')]
+
+
+@pytest.mark.django_db
+def test_bulk_enroll_reports_row_errors(course, cohort, student_user, django_user_model):
+    Enrollment.objects.create(course=course, user=student_user)
+    django_user_model.objects.create_user(username='twin1', email='twin@example.com')
+    django_user_model.objects.create_user(username='twin2', email='TWIN@example.com')
+
+    result = bulk_enroll(course, [
+        (1, 'stu0'), (2, 'STU1@example.com'), (3, 'student'),
+        (4, 'nobody'), (5, 'stu0@example.com'), (6, 'twin@example.com'),
+    ])
+
+    assert result['enrolled'] == 2
+    assert result['already_enrolled'] == 1
+    assert result['errors'] == [
+        {'row': 4, 'value': 'nobody', 'error': 'No user with this username or email.'},
+        {'row': 5, 'value': 'stu0@example.com', 'error': 'Duplicate of row 1.'},
+        {'row': 6, 'value': 'twin@example.com', 'error': 'Several users have this email.'},
+    ]
+    assert set(course.enrolled_users.values_list('username', flat=True)) == {
+        'stu0', 'stu1', 'student'}
+
+
+@pytest.mark.django_db
+def test_bulk_enroll_uses_batched_queries(course, cohort, django_assert_max_num_queries):
+    get_dashboard(cohort[0])
+    version = get_course_version(course.id)
+
+    with django_assert_max_num_queries(8):
+        result = bulk_enroll(course, [(i, u.username) for i, u in enumerate(cohort)])
+
+    assert result['enrolled'] == 300
+    assert Enrollment.objects.filter(course=course).count() == 300
+    # the bookkeeping the per-row signals would have done
+    assert cache.get(dashboard_key(cohort[0].id)) is None
+    assert get_course_version(course.id) != version
+
+
+@pytest.mark.django_db
+def test_import_view_is_for_course_teachers(client, course, student_user, teacher_user):
+    url = reverse('courses:enrollment_import', kwargs={'course_id': course.id})
+
+    client.login(username='student', password='pass')
+    assert client.post(url, {'file': csv_file('student\n')}).status_code == 403
+
+    client.login(username='teacher', password='pass')
+    response = client.post(url, {'file': csv_file('student\nghost\n')})
+
+    assert response.status_code == 200
+    result = response.context['result']
+    assert result['enrolled'] == 1
+    assert result['errors'][0]['value'] == 'ghost'
+    assert course.enrolled_users.filter(pk=student_user.pk).exists()
@@ -0,0 +1,97 @@
+import pytest
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from courses.models import Material
+from courses.ordering import ORDER_GAP, next_order, reorder_materials
+
+
+@pytest.fixture
+def materials(course):
+    return [Material.objects.create(course=course, title=f'M{i}', order=(i + 1) * ORDER_GAP)
+            for i in range(5)]
+
+
+def titles(course):
+    return list(course.materials.order_by('order', 'id').values_list('title', flat=True))
+
+
+@pytest.mark.django_db
+def test_full_reorder_is_one_bulk_update(course, materials, django_assert_max_num_queries):
+    new_order = [m.id for m in reversed(materials)]
+    # savepoint + lock + load + park the rows trading places + one bulk
+    # update + release
+    with django_assert_max_num_queries(6):
+        reorder_materials(course, new_order)
+    assert titles(course) == ['M4', 'M3', 'M2', 'M1', 'M0']
+    assert sorted(Material.objects.values_list('order', flat=True)) == [
+        (i + 1) * ORDER_GAP for i in range(5)]
+
+
+@pytest.mark.django_db
+def test_partial_move_only_rewrites_moved_items(course, materials):
+    before = dict(Material.objects.values_list('id', 'order'))
+    reorder_materials(course, [materials[4].id], after=materials[0].id)
+
+    assert titles(course) == ['M0', 'M4', 'M1', 'M2', 'M3']
+    after = dict(Material.objects.values_list('id', 'order'))
+    assert [pk for pk in after if after[pk] != before[pk]] == [materials[4].id]
+
+
+@pytest.mark.django_db
+def test_materials_cannot_share_an_order(course, materials):
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Material.objects.create(course=course, title='Dup', order=materials[0].order)
+
+
+@pytest.mark.django_db
+def test_next_order_appends(course, materials):
+    assert next_order(course.id) == 6 * ORDER_GAP
+
+
+@pytest.mark.django_db
+def test_reorder_view_requires_course_teacher(client, course, materials, student_user, teacher_user):
+    url = reverse('courses:material_reorder', kwargs={'course_id': course.id})
+    payload = {'order': [m.id for m in reversed(materials)]}
+
+    client.login(username='student', password='pass')
+    assert client.post(url, payload, content_type='application/json').status_code == 403
+
+    client.login(username='teacher', password='pass')
+    response = client.post(url, payload, content_type='application/json')
+    assert response.status_code == 200
+    assert response.json()['order'] == payload['order']
+
+    response = client.post(url, {'order': [999]}, content_type='application/json')
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_move_view_steps_one_place(client, course, materials, teacher_user):
+    client.login(username='teacher', password='pass')
+    client.get(reverse('courses:move_material', args=[materials[2].id, 'up']))
+    assert titles(course) == ['M0', 'M2', 'M1', 'M3', 'M4']
+    client.get(reverse('courses:move_material', args=[materials[0].id, 'down']))
+    assert titles(course) == ['M2', 'M0', 'M1', 'M3', 'M4']
+
+
+@pytest.mark.django_db
+def test_material_form_rejects_a_taken_order(client, course, materials, teacher_user):
+    client.login(username='teacher', password='pass')
+    url = reverse('courses:material_create', kwargs={'course_id': course.id})
+
+    response = client.post(url, {'title': 'Dup', 'order': materials[0].order})
+    assert response.status_code == 200
+    assert 'order' in response.context['form'].errors
+
+    client.post(url, {'title': 'Appended'})
+    assert titles(course)[-1] == 'Appended'
+
+
+@pytest.mark.django_db
+def test_upload_rejects_a_taken_order(client, course, materials, teacher_user):
+    client.login(username='teacher', password='pass')
+    response = client.post(
+        reverse('courses:material_upload_start', kwargs={'course_id': course.id}),
+        {'title': 'Dup', 'filename': 'x.pdf', 'size': 10, 'order': materials[0].order},
+        content_type='application/json')
+    assert response.status_code == 400
@@ -0,0 +1,69 @@
+import pytest
+from django.contrib.auth.models import Group
+from courses.enrollments import bulk_enroll
+from courses.models import Course, Enrollment
+from courses.permissions import course_access
+from accounts.roles import get_roles
+
+
+def fresh(user):
+    # a new request loads a new user object, without the per-request memo
+    return type(user).objects.get(pk=user.pk)
+
+
+@pytest.mark.django_db
+def test_access_for_all_courses_is_one_query(course, teacher_user, student_user,
+                                             django_assert_num_queries):
+    other = Course.objects.create(title='Other', creator=student_user)
+    Enrollment.objects.create(course=course, user=student_user, blocked=True)
+
+    user = fresh(student_user)
+    with django_assert_num_queries(1):
+        mine = course_access(user, other)
+        theirs = course_access(user, course.id)
+        course_access(user, 12345)
+    assert mine.creator and mine.teacher
+    assert theirs.enrolled and theirs.blocked and not theirs.can_view_materials
+
+    # later requests read the cached map
+    user = fresh(user)
+    with django_assert_num_queries(0):
+        assert course_access(user, course).blocked
+    assert course_access(fresh(teacher_user), course).teacher
+
+
+@pytest.mark.django_db
+def test_access_cache_follows_membership_changes(course, student_user):
+    assert not course_access(fresh(student_user), course).enrolled
+
+    enrollment = Enrollment.objects.create(course=course, user=student_user)
+    assert course_access(fresh(student_user), course).can_view_materials
+
+    enrollment.blocked = True
+    enrollment.save()
+    assert not course_access(fresh(student_user), course).can_view_materials
+
+    enrollment.delete()
+    course.collaborators.add(student_user)
+    assert course_access(fresh(student_user), course).teacher
+
+    student_user.courses_teaching.clear()
+    assert not course_access(fresh(student_user), course).teacher
+
+    bulk_enroll(course, [(1, 'student')])
+    assert course_access(fresh(student_user), course).enrolled
+
+
+@pytest.mark.django_db
+def test_roles_are_cached_until_groups_change(student_user, django_assert_num_queries):
+    assert not get_roles(fresh(student_user))['teacher']
+    user = fresh(student_user)
+    with django_assert_num_queries(0):
+        get_roles(user)
+
+    teachers, _ = Group.objects.get_or_create(name='teacher')
+    teachers.user_set.add(student_user)
+    assert get_roles(fresh(student_user))['teacher']
+
+    student_user.groups.clear()
+    assert not get_roles(fresh(student_user))['teacher']
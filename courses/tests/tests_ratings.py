@@ -0,0 +1,97 @@
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from courses.models import Course, CourseFeedback, CourseRanking
+from courses.rankings import rating_histogram, refresh_rankings
+
+
+@pytest.fixture
+def reviewers(django_user_model):
+    return [django_user_model.objects.create_user(username=f'reviewer{i}', password='pass')
+            for i in range(3)]
+
+
+@pytest.mark.django_db
+def test_rating_aggregates_follow_feedback_writes(course, reviewers):
+    fb1 = CourseFeedback.objects.create(course=course, user=reviewers[0], rating=8)
+    CourseFeedback.objects.create(course=course, user=reviewers[1], rating=4)
+    course.refresh_from_db()
+    assert (course.rating_sum, course.rating_count) == (12, 2)
+    assert course.rating_avg == pytest.approx(6.0)
+
+    # update goes through a freshly loaded instance, as the views do
+    fb1 = CourseFeedback.objects.get(pk=fb1.pk)
+    fb1.rating = 10
+    fb1.save()
+    course.refresh_from_db()
+    assert (course.rating_sum, course.rating_count) == (14, 2)
+    assert course.average_rating() == pytest.approx(7.0)
+
+    CourseFeedback.objects.filter(course=course).delete()
+    course.refresh_from_db()
+    assert (course.rating_sum, course.rating_count) == (0, 0)
+    assert course.rating_avg is None
+
+
+@pytest.mark.django_db
+def test_rebuild_course_ratings_fixes_drift(course, reviewers):
+    CourseFeedback.objects.create(course=course, user=reviewers[0], rating=9)
+    CourseFeedback.objects.create(course=course, user=reviewers[1], rating=3)
+    Course.objects.filter(pk=course.pk).update(
+        rating_sum=0, rating_count=7, rating_avg=1.5)
+
+    call_command('rebuild_course_ratings')
+
+    course.refresh_from_db()
+    assert (course.rating_sum, course.rating_count) == (12, 2)
+    assert course.feedback_count() == 2
+    assert course.rating_avg == pytest.approx(6.0)
+
+
+@pytest.mark.django_db
+def test_histogram_follows_feedback_writes(course, reviewers):
+    fb = CourseFeedback.objects.create(course=course, user=reviewers[0], rating=8)
+    CourseFeedback.objects.create(course=course, user=reviewers[1], rating=8)
+    CourseFeedback.objects.create(course=course, user=reviewers[2], rating=3)
+    assert dict(rating_histogram(course.id)) == {**dict.fromkeys(range(11), 0), 8: 2, 3: 1}
+
+    fb = CourseFeedback.objects.get(pk=fb.pk)
+    fb.rating = 10
+    fb.save()
+    fb.delete()
+    histogram = dict(rating_histogram(course.id))
+    assert (histogram[8], histogram[10], histogram[3]) == (1, 0, 1)
+
+
+@pytest.mark.django_db
+def test_rankings_use_bayesian_average(teacher_user, django_user_model):
+    users = [django_user_model.objects.create_user(username=f'r{i}') for i in range(20)]
+    lone_ten = Course.objects.create(title='One perfect review', creator=teacher_user)
+    many_nines = Course.objects.create(title='Many nines', creator=teacher_user)
+    poor = Course.objects.create(title='Poor', creator=teacher_user)
+    Course.objects.create(title='Unrated', creator=teacher_user)
+    CourseFeedback.objects.create(course=lone_ten, user=users[0], rating=10)
+    for user in users:
+        CourseFeedback.objects.create(course=many_nines, user=user, rating=9)
+    for user in users[:5]:
+        CourseFeedback.objects.create(course=poor, user=user, rating=2)
+
+    assert refresh_rankings() == 3
+
+    ranked = list(CourseRanking.objects.values_list('course_id', 'position'))
+    assert ranked == [(many_nines.id, 1), (lone_ten.id, 2), (poor.id, 3)]
+    assert CourseRanking.objects.get(course=lone_ten).rating_avg == 10
+
+
+@pytest.mark.django_db
+def test_feedback_section_shows_histogram_and_rank(client, course, reviewers):
+    CourseFeedback.objects.create(course=course, user=reviewers[0], rating=7)
+    refresh_rankings()
+    client.force_login(reviewers[0])
+
+    response = client.get(reverse('courses:course_detail_section',
+                                  kwargs={'course_id': course.id, 'section': 'feedback'}))
+
+    assert b'#1 top rated' in response.content
+    assert b'aria-label="Rating distribution"' in response.content
+    assert b'style="width: 100%"' in response.content
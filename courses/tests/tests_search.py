@@ -0,0 +1,142 @@
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from courses.extraction import index_blob_text
+from courses.models import Course, Enrollment, Material, MaterialText
+from courses.ordering import next_order
+from courses.search import search_materials
+
+
+@pytest.fixture(autouse=True)
+def media(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+
+def make_pdf(text):
+    # smallest PDF with one line of Helvetica text that pypdf can read
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, xref)
+    return out
+
+
+def upload(course, title, data, name='notes.txt'):
+    material = Material.objects.create(
+        course=course, title=title, order=next_order(course.id),
+        content=SimpleUploadedFile(name, data))
+    index_blob_text(material.blob_id)
+    return material
+
+
+@pytest.mark.django_db
+def test_upload_queues_extraction_once_per_content(course, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks() as callbacks:
+        material = Material.objects.create(
+            course=course, title='Week 1', order=1,
+            content=SimpleUploadedFile('week1.txt', b'osmosis'))
+    assert len(callbacks) == 1
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        material.title = 'Week 1 (revised)'
+        material.save()
+    assert callbacks == []
+
+
+@pytest.mark.django_db
+def test_extraction_is_keyed_on_content(course):
+    first = upload(course, 'Week 1', b'osmosis and diffusion')
+    second = upload(course, 'Week 1 copy', b'osmosis and diffusion', name='copy.txt')
+
+    assert first.blob_id == second.blob_id
+    assert MaterialText.objects.get().text == 'osmosis and diffusion'
+    assert index_blob_text(first.blob_id) is False
+
+    first.delete()
+    second.delete()
+    assert not MaterialText.objects.exists()
+
+
+@pytest.mark.django_db
+def test_pdf_text_is_extracted(course):
+    pytest.importorskip('pypdf')
+    material = upload(course, 'Slides', make_pdf('Photosynthesis in chloroplasts'),
+                      name='slides.pdf')
+
+    assert 'Photosynthesis' in material.blob.text.text
+    assert [m.id for m in search_materials(course.creator, 'chloroplasts')] == [material.id]
+
+
+@pytest.mark.django_db
+def test_search_ranks_and_marks_snippets(course):
+    weak = upload(course, 'Intro', b'cells are small. also <mitochondria>', name='a.txt')
+    strong = upload(course, 'Energy', b'mitochondria mitochondria mitochondria', name='b.txt')
+    upload(course, 'Other', b'nothing relevant here', name='c.txt')
+
+    hits = search_materials(course.creator, 'Mitochondria')
+
+    assert [m.id for m in hits] == [strong.id, weak.id]
+    assert hits[0].search_rank > hits[1].search_rank
+    assert '<mark>mitochondria</mark>' in hits[0].search_snippet
+    # file text is escaped, only the match markers are HTML
+    assert '&lt;<mark>mitochondria</mark>&gt;' in hits[1].search_snippet
+    assert search_materials(course.creator, '"') == []
+
+
+@pytest.mark.django_db
+def test_search_is_limited_to_accessible_courses(course, student_user, teacher_user):
+    other = Course.objects.create(title='Other', description='d', creator=teacher_user)
+    mine = upload(course, 'Week 1', b'enzymes', name='a.txt')
+    upload(other, 'Week 1', b'enzymes again', name='b.txt')
+
+    assert search_materials(student_user, 'enzymes') == []
+
+    enrollment = Enrollment.objects.create(course=course, user=student_user)
+    assert [m.id for m in search_materials(student_user, 'enzymes')] == [mine.id]
+
+    enrollment.blocked = True
+    enrollment.save()
+    assert search_materials(student_user, 'enzymes') == []
+
+
+@pytest.mark.django_db
+def test_search_api(client, course, student_user):
+    material = upload(course, 'Week 1', b'the krebs cycle')
+    Enrollment.objects.create(course=course, user=student_user)
+    client.login(username='student', password='pass')
+
+    resp = client.get(reverse('api:material-search-list'), {'q': 'krebs'})
+
+    assert resp.status_code == 200
+    [hit] = resp.json()
+    assert hit['id'] == material.id
+    assert hit['course_title'] == course.title
+    assert '<mark>krebs</mark>' in hit['snippet']
+
+
+@pytest.mark.django_db
+def test_index_command_backfills_missing_text(course):
+    material = Material.objects.create(
+        course=course, title='Week 1', order=1,
+        content=SimpleUploadedFile('week1.txt', b'glycolysis'))
+    assert not MaterialText.objects.exists()
+
+    call_command('index_material_text')
+
+    assert MaterialText.objects.get(blob=material.blob).text == 'glycolysis'
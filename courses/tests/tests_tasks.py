@@ -0,0 +1,40 @@
+import pytest
+from accounts.models import Notification
+from courses.models import Enrollment
+from courses.tasks import notify_students_chunk, student_id_ranges
+
+
+@pytest.fixture
+def students(course, django_user_model):
+    users = django_user_model.objects.bulk_create([
+        django_user_model(username=f'stu{i}') for i in range(25)])
+    Enrollment.objects.bulk_create([
+        Enrollment(course=course, user=user, blocked=(i % 10 == 0))
+        for i, user in enumerate(users)])
+    return users
+
+
+@pytest.mark.django_db
+def test_student_ranges_cover_unblocked_students_once(course, students):
+    ranges = list(student_id_ranges(course.id, chunk_size=10))
+
+    # 22 unblocked students -> 10 + 10 + 2
+    assert len(ranges) == 3
+    assert ranges[0][0] is None and ranges[-1][1] is None
+    assert all(ranges[i][1] == ranges[i + 1][0] for i in range(2))
+
+
+@pytest.mark.django_db
+def test_chunks_notify_each_unblocked_student_once(course, students, django_assert_max_num_queries):
+    for after, upto in student_id_ranges(course.id, chunk_size=10):
+        notify_students_chunk(course.id, 'New material', after, upto)
+
+    notified = list(Notification.objects.values_list('user_id', flat=True))
+    blocked = {u.id for i, u in enumerate(students) if i % 10 == 0}
+    assert sorted(notified) == sorted(u.id for u in students if u.id not in blocked)
+
+    # a chunk costs one read and one insert per batch
+    Notification.objects.all().delete()
+    with django_assert_max_num_queries(3):
+        notify_students_chunk(course.id, 'New material', None, None)
+    assert Notification.objects.count() == 22
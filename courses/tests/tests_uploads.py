@@ -0,0 +1,99 @@
+import hashlib
+from datetime import timedelta
+
+import pytest
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils import timezone
+from courses.models import Material, MaterialUpload
+from courses.uploads import expire_uploads
+
+PAYLOAD = b''.join(bytes([i]) * 1000 for i in range(25))  # 25,000 bytes
+CHUNK = 10_000
+
+
+@pytest.fixture(autouse=True)
+def media(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+
+@pytest.fixture
+def upload(client, course, teacher_user):
+    client.login(username='teacher', password='pass')
+    response = client.post(
+        reverse('courses:material_upload_start', kwargs={'course_id': course.id}),
+        {'title': 'Recording', 'filename': 'lecture.mp4',
+         'size': len(PAYLOAD), 'chunk_size': CHUNK},
+        content_type='application/json')
+    assert response.status_code == 201
+    return response.json()
+
+
+def put_chunk(client, upload_id, index, **extra):
+    data = PAYLOAD[index * CHUNK:(index + 1) * CHUNK]
+    return client.put(
+        reverse('courses:material_upload_chunk', args=[upload_id, index]),
+        data, content_type='application/octet-stream', **extra)
+
+
+@pytest.mark.django_db
+def test_chunked_upload_resumes_and_completes(client, course, upload):
+    upload_id = upload['upload_id']
+    assert upload['chunk_count'] == 3
+    assert upload['missing'] == [0, 1, 2]
+
+    assert put_chunk(client, upload_id, 0).status_code == 200
+    assert put_chunk(client, upload_id, 2).status_code == 200
+
+    # nothing is created until every chunk is in
+    complete_url = reverse('courses:material_upload_complete', args=[upload_id])
+    assert client.post(complete_url).status_code == 400
+    assert not Material.objects.filter(course=course).exists()
+
+    # a resuming client asks what is missing and sends just that
+    status = client.get(reverse('courses:material_upload_status', args=[upload_id])).json()
+    assert status['missing'] == [1]
+    digest = hashlib.sha256(PAYLOAD[CHUNK:2 * CHUNK]).hexdigest()
+    assert put_chunk(client, upload_id, 1, HTTP_X_CHUNK_SHA256=digest).status_code == 200
+
+    status = client.post(complete_url).json()
+    assert status['complete'] is True
+    assert status['sha256'] == hashlib.sha256(PAYLOAD).hexdigest()
+
+    material = Material.objects.get(pk=status['material_id'])
+    assert material.title == 'Recording'
+    assert material.blob.sha256 == status['sha256']
+    with material.content.open('rb') as fh:
+        assert fh.read() == PAYLOAD
+    # the staging chunks are gone
+    assert not default_storage.exists(f'material_uploads/{upload_id}/000000.part')
+
+
+@pytest.mark.django_db
+def test_corrupt_or_misplaced_chunks_are_rejected(client, upload):
+    upload_id = upload['upload_id']
+    response = put_chunk(client, upload_id, 0, HTTP_X_CHUNK_SHA256='0' * 64)
+    assert response.status_code == 400
+    # wrong length for the final chunk
+    response = client.put(
+        reverse('courses:material_upload_chunk', args=[upload_id, 2]),
+        b'x' * CHUNK, content_type='application/octet-stream')
+    assert response.status_code == 400
+    assert MaterialUpload.objects.get(pk=upload_id).chunks.count() == 0
+
+
+@pytest.mark.django_db
+def test_only_course_teachers_start_uploads(client, course, student_user):
+    client.login(username='student', password='pass')
+    response = client.post(
+        reverse('courses:material_upload_start', kwargs={'course_id': course.id}),
+        {'title': 'x', 'filename': 'x.pdf', 'size': 10}, content_type='application/json')
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_abandoned_uploads_expire(client, upload):
+    put_chunk(client, upload['upload_id'], 0)
+    assert expire_uploads() == 0
+    assert expire_uploads(now=timezone.now() + timedelta(days=2)) == 1
+    assert not MaterialUpload.objects.exists()
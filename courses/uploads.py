@@ -0,0 +1,234 @@
+import hashlib
+import io
+from datetime import timedelta
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .blobs import release_blob, store_blob
+from .models import Material, MaterialUpload, MaterialUploadChunk
+from .ordering import next_order, order_taken
+
+# Chunked, resumable material uploads.
+#
+# Each chunk is streamed into its own object in the default storage (so it
+# works the same on the local filesystem and S3) and hashed on the way in.
+# Completing the upload streams the chunks back, in order, into blob
+# storage (courses.blobs), which hashes the whole file before deciding
+# whether the bytes need storing at all. Nothing is ever held in memory
+# beyond one read buffer, whatever the file size.
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 32 * 1024 * 1024
+READ_SIZE = 64 * 1024
+UPLOAD_EXPIRY = timedelta(days=1)
+
+
+class UploadError(ValueError):
+    pass
+
+
+class HashingReader(io.RawIOBase):
+    """Reads at most `limit` bytes from `source`, hashing them as they pass."""
+
+    def __init__(self, source, limit):
+        self.source = source
+        self.remaining = limit
+        self.size = limit
+        self.digest = hashlib.sha256()
+        self.received = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.source.read(size)
+        self.remaining -= len(data)
+        self.received += len(data)
+        self.digest.update(data)
+        return data
+
+
+class ChunkStream(io.RawIOBase):
+    """
+    The stored chunks of an upload read back as one file, one chunk open at
+    a time. Only rewinding to the start is supported.
+    """
+
+    def __init__(self, upload):
+        self.upload = upload
+        self.names = [upload.chunk_name(i) for i in range(upload.chunk_count)]
+        self.size = upload.size
+        self._reset()
+
+    def _reset(self):
+        self._pending = list(self.names)
+        self._current = None
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("ChunkStream can only rewind")
+        self._close_current()
+        self._reset()
+        return 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = READ_SIZE
+        while True:
+            if self._current is None:
+                if not self._pending:
+                    return b""
+                self._current = default_storage.open(self._pending.pop(0), "rb")
+            data = self._current.read(size)
+            if data:
+                self._position += len(data)
+                return data
+            self._close_current()
+
+    def _close_current(self):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+
+    def close(self):
+        self._close_current()
+        super().close()
+
+
+def start_upload(course, uploader, title, filename, size, chunk_size=None, order=None):
+    size = int(size)
+    chunk_size = int(chunk_size or DEFAULT_CHUNK_SIZE)
+    if size <= 0:
+        raise UploadError("size must be positive")
+    if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+        raise UploadError(f"chunk_size must be between 1 and {MAX_CHUNK_SIZE}")
+    if not title or not filename:
+        raise UploadError("title and filename are required")
+    order = None if order in (None, "") else int(order)
+    if order is not None and order_taken(course.id, order):
+        raise UploadError(f"order {order} is already taken in this course")
+    return MaterialUpload.objects.create(
+        course=course, uploader=uploader, title=title,
+        filename=filename[-255:], size=size, chunk_size=chunk_size,
+        order=order,
+    )
+
+
+def receive_chunk(upload, index, stream, length, sha256=None):
+    """
+    Store chunk `index`, read from `stream`. Re-sending a chunk that is
+    already stored with the same checksum is a no-op, so clients can
+    simply retry whatever was in flight when they were interrupted.
+    """
+    if upload.material_id:
+        raise UploadError("upload is already complete")
+    if not 0 <= index < upload.chunk_count:
+        raise UploadError(f"chunk index must be below {upload.chunk_count}")
+    expected = upload.expected_chunk_size(index)
+    if length != expected:
+        raise UploadError(f"chunk {index} must be {expected} bytes")
+
+    existing = upload.chunks.filter(index=index).first()
+    if existing and sha256 and existing.sha256 == sha256.lower():
+        return existing
+
+    reader = HashingReader(stream, length)
+    name = upload.chunk_name(index)
+    default_storage.delete(name)
+    stored = default_storage.save(name, File(reader, name=name))
+    digest = reader.digest.hexdigest()
+    if reader.received != expected or (sha256 and digest != sha256.lower()):
+        default_storage.delete(stored)
+        raise UploadError(f"chunk {index} was truncated or corrupted")
+    if stored != name:
+        # storage refused to overwrite; nothing else may read a stray name
+        default_storage.delete(stored)
+        raise UploadError(f"chunk {index} is being written concurrently")
+
+    chunk, _ = MaterialUploadChunk.objects.update_or_create(
+        upload=upload, index=index,
+        defaults={"size": reader.received, "sha256": digest},
+    )
+    MaterialUpload.objects.filter(pk=upload.pk).update(updated_at=timezone.now())
+    return chunk
+
+
+def missing_chunks(upload):
+    received = set(upload.chunks.values_list("index", flat=True))
+    return [i for i in range(upload.chunk_count) if i not in received]
+
+
+def complete_upload(upload):
+    """Assemble the chunks into a new Material. Returns the Material."""
+    if upload.material_id:
+        return upload.material
+    missing = missing_chunks(upload)
+    if missing:
+        raise UploadError(f"missing chunks: {missing[:20]}")
+
+    # stream the chunks into blob storage outside any transaction; this
+    # takes a blob reference that the new material then owns
+    stream = ChunkStream(upload)
+    try:
+        blob = store_blob(stream, upload.filename)
+    finally:
+        stream.close()
+
+    with transaction.atomic():
+        # a concurrent completion may have won the race meanwhile
+        locked = MaterialUpload.objects.select_for_update().get(pk=upload.pk)
+        if locked.material_id:
+            release_blob(blob.id)
+            return locked.material
+        # next_order takes the course's order lock; an explicit order
+        # taken since the upload started falls back to appending
+        order = next_order(upload.course_id)
+        if upload.order is not None and not order_taken(
+                upload.course_id, upload.order):
+            order = upload.order
+        material = Material(
+            course=upload.course, title=upload.title, blob=blob, order=order)
+        material.content.name = blob.path
+        material.save()
+        locked.material = material
+        locked.sha256 = blob.sha256
+        locked.save(update_fields=["material", "sha256", "updated_at"])
+
+    discard_chunks(locked)
+    return material
+
+
+def discard_chunks(upload):
+    for name in (upload.chunk_name(i) for i in range(upload.chunk_count)):
+        default_storage.delete(name)
+    upload.chunks.all().delete()
+
+
+def expire_uploads(now=None):
+    """Drop unfinished uploads nobody has touched for UPLOAD_EXPIRY."""
+    cutoff = (now or timezone.now()) - UPLOAD_EXPIRY
+    stale = MaterialUpload.objects.filter(
+        material__isnull=True, updated_at__lt=cutoff)
+    count = 0
+    for upload in stale.iterator():
+        discard_chunks(upload)
+        upload.delete()
+        count += 1
+    return count
@@ -4,8 +4,15 @@ from .views import (CourseCreateView,
                     CourseDetailView,
                     MaterialCreateView,
                     MaterialDeleteView,
+                    MaterialDownloadView,
                     MaterialMoveView,
+                    MaterialReorderView,
+                    MaterialUploadStartView,
+                    MaterialUploadStatusView,
+                    MaterialUploadChunkView,
+                    MaterialUploadCompleteView,
                     EnrollView,
+                    EnrollmentImportView,
                     DisenrollView,
                     FeedbackCreateView,
                     BlockStudentView,
@@ -31,6 +38,8 @@ urlpatterns = [
          name="course_feedback_create"),
     path('<int:course_id>/enroll/',
          EnrollView.as_view(), name='enroll'),
+    path('<int:course_id>/enrollments/import/',
+         EnrollmentImportView.as_view(), name='enrollment_import'),
     path('<int:course_id>/disenroll/',
          DisenrollView.as_view(), name='disenroll'),
 
@@ -41,8 +50,20 @@ urlpatterns = [
          MaterialCreateView.as_view(), name='material_create'),
     path('materials/<int:material_id>/delete/',
          MaterialDeleteView.as_view(), name='material_delete'),
+    path('materials/<int:material_id>/download/',
+         MaterialDownloadView.as_view(), name='material_download'),
     path('materials/<int:material_id>/move/<str:direction>/',
          MaterialMoveView.as_view(), name='move_material'),
+    path('<int:course_id>/materials/uploads/',
+         MaterialUploadStartView.as_view(), name='material_upload_start'),
+    path('materials/uploads/<uuid:upload_id>/',
+         MaterialUploadStatusView.as_view(), name='material_upload_status'),
+    path('materials/uploads/<uuid:upload_id>/chunks/<int:index>/',
+         MaterialUploadChunkView.as_view(), name='material_upload_chunk'),
+    path('materials/uploads/<uuid:upload_id>/complete/',
+         MaterialUploadCompleteView.as_view(), name='material_upload_complete'),
+    path('<int:course_id>/materials/reorder/',
+         MaterialReorderView.as_view(), name='material_reorder'),
 
     path('block_student/<int:enrollment_id>/',
          BlockStudentView.as_view(), name='block_student'),
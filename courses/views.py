@@ -1,21 +1,43 @@
 
+import json
+import os
+from functools import partial
+
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
 
 from django.urls import reverse_lazy
-from django.shortcuts import get_object_or_404, redirect
-from django.http import Http404, HttpResponseForbidden
+from django.core.paginator import Paginator
+from django.shortcuts import get_object_or_404, redirect, render
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponseForbidden, JsonResponse
 from django.utils.decorators import method_decorator
+from django.utils.text import slugify
 
+from django.db import transaction
 from django.views import View
 from django.views.generic import CreateView, ListView, DetailView
 from django.views.decorators.csrf import csrf_protect
 
 from django.views.generic.edit import DeleteView
-from .models import Course, Material, CourseFeedback, Enrollment
-from .forms import CourseForm, MaterialForm, CourseFeedbackForm
+from accounts.roles import get_roles
+from .analytics import ANALYTICS_DAYS, STAT_FIELDS, course_daily_stats
+from .cache import FRAGMENT_TIMEOUT, get_course_version, get_dashboard
+from .models import (Course, CourseRanking, Material, MaterialUpload,
+                     CourseFeedback, Enrollment)
+from .downloads import serve_material_file
+from .enrollments import EnrollmentImportError, bulk_enroll, read_identifiers
+from .forms import (CourseForm, MaterialForm, CourseFeedbackForm,
+                    EnrollmentImportForm)
+from .ordering import next_order, reorder_materials
+from .permissions import course_access, is_course_teacher
+from .rankings import rating_histogram
+from .search import search_courses
+from .uploads import (complete_upload, missing_chunks, receive_chunk,
+                      start_upload)
 
 from .tasks import (notify_teacher_of_enrollment,
+                    notify_teacher_of_bulk_enrollment,
                     notify_students_new_material)
 
 
@@ -24,7 +46,8 @@ from .tasks import (notify_teacher_of_enrollment,
 
 class TeacherRequiredMixin(UserPassesTestMixin):
     def test_func(self):
-        return self.request.user.groups.filter(name='teacher').exists()
+        # group names are cached per user, see accounts.roles
+        return get_roles(self.request.user)['teacher']
 
 
 class CourseCreateView(LoginRequiredMixin, TeacherRequiredMixin, CreateView):
@@ -42,6 +65,8 @@ class CourseListView(LoginRequiredMixin, ListView):
     model = Course
     template_name = 'courses/course_list.html'
     context_object_name = 'courses'
+    available_paginate_by = 25
+    search_paginate_by = 20
 
     def get_queryset(self):
         # Return an empty queryset as detailed lists sent via context.
@@ -49,22 +74,42 @@ class CourseListView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
-
-        # Courses the user is enrolled in
-        context['enrolled_courses'] = user.courses_enrolled.all()
-
-        # All other courses available
-        context['all_courses'] = Course.objects.exclude(
-            id__in=user.courses_enrolled.values_list('id', flat=True))
-
-        # Courses the user created
-        context['created_courses'] = Course.objects.filter(creator=user)
 
-        # Courses where the user is a collaborator (but not creator)
-        context['collaborating_courses'] = Course.objects.filter(
-            collaborators=user
-        ).exclude(creator=user)
+        query = self.request.GET.get('q', '').strip()
+        context['search_query'] = query
+        if query:
+            # catalog search replaces the overview lists
+            cursor = self.request.GET.get('cursor')
+            found = Course.objects.only('id', 'title', 'description')
+            try:
+                results, next_cursor = search_courses(
+                    query, self.search_paginate_by, cursor=cursor,
+                    queryset=found)
+            except ValueError:
+                # stale or mangled cursor: start from the first page
+                cursor = None
+                results, next_cursor = search_courses(
+                    query, self.search_paginate_by, queryset=found)
+            context['search_results'] = results
+            context['search_next_cursor'] = next_cursor
+            context['search_is_first_page'] = cursor is None
+            return context
+
+        # enrolled / created / collaborating lists, cached per user
+        dashboard = get_dashboard(self.request.user)
+        context['enrolled_courses'] = dashboard['enrolled_courses']
+        context['created_courses'] = dashboard['created_courses']
+        context['collaborating_courses'] = dashboard['collaborating_courses']
+
+        # All other courses available, one page at a time
+        available = (Course.objects
+                     .exclude(id__in=dashboard['enrolled_ids'])
+                     .order_by('title')
+                     .values('id', 'title'))
+        paginator = Paginator(available, self.available_paginate_by)
+        page = paginator.get_page(self.request.GET.get('page'))
+        context['available_page'] = page
+        context['all_courses'] = page
 
         return context
 
@@ -81,6 +126,15 @@ class CourseDetailView(LoginRequiredMixin, DetailView):
         "feedback":     "courses/course_detail_feedback.html",
         "teacher_area": "courses/course_detail_teacher_area.html",
         "registration": "courses/course_detail_registration.html",
+        "analytics":    "courses/course_detail_analytics.html",
+    }
+    # data each section renders; anything not listed is never fetched
+    SECTION_DATA = {
+        "materials":    ("membership", "fragments", "materials"),
+        "feedback":     ("membership", "fragments", "feedbacks"),
+        "teacher_area": ("fragments", "roster"),
+        "registration": ("membership",),
+        "analytics":    ("analytics",),
     }
     DEFAULT_SECTION = "materials"
 
@@ -99,6 +153,9 @@ class CourseDetailView(LoginRequiredMixin, DetailView):
             raise Http404("Unknown section")
         return [tpl]
 
+    def get_queryset(self):
+        return Course.objects.select_related('creator')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         course = self.object
@@ -107,44 +164,81 @@ class CourseDetailView(LoginRequiredMixin, DetailView):
         section = self.get_section()
         context["active_section"] = section
 
-        # helper flags for template logic
-        context['is_enrolled'] = course.enrolled_users.filter(
-            id=user.id).exists()
-
-        try:
-            enrollment = Enrollment.objects.get(
-                course=course, user=user)
-            context['is_blocked'] = enrollment.blocked
-        except Enrollment.DoesNotExist:
-            context['is_blocked'] = False
-
-        # course detail
+        # course detail shared by every section
         context['course_title'] = course.title
         context['course_description'] = course.description
         context['course_creator'] = course.creator
-        context['course_collaborators'] = course.collaborators.all()
-        context['materials'] = course.materials.order_by('order')
-        context['students'] = Enrollment.objects.filter(course=course)
-        is_creator = (course.creator.id == user.id)
-        context['can_edit_materials'] = is_creator
+        context['can_edit_materials'] = (course.creator_id == user.id)
+        # roles are memoised on the user, so the context processor reuses them
+        context['is_student'] = get_roles(user)['student']
+
+        for name in self.SECTION_DATA.get(section, ()):
+            getattr(self, f"add_{name}_context")(context, course, user)
+        return context
 
-        # course review data
-        feedback = course.feedbacks.select_related(
+    def add_membership_context(self, context, course, user):
+        access = course_access(user, course)
+        context['is_enrolled'] = access.enrolled
+        context['is_blocked'] = access.blocked
+
+    def add_fragments_context(self, context, course, user):
+        # shared fragments are keyed on the course version; the querysets
+        # below stay lazy so a cache hit never touches the tables
+        context['course_version'] = get_course_version(course.id)
+        context['fragment_timeout'] = FRAGMENT_TIMEOUT
+
+    def add_materials_context(self, context, course, user):
+        context['materials'] = course.materials.order_by('order')
+        # the materials fragment only differs between these three views
+        if get_roles(user)['teacher'] and context['can_edit_materials']:
+            context['materials_variant'] = 'editor'
+        elif context['is_student'] and not context['is_enrolled']:
+            context['materials_variant'] = 'locked'
+        else:
+            context['materials_variant'] = 'viewer'
+
+    def add_feedbacks_context(self, context, course, user):
+        context['feedbacks'] = course.feedbacks.select_related(
             'user').order_by('-created_at')
-        context['feedbacks'] = feedback
-        is_student = user.groups.filter(name='student').exists()
-        context['is_student'] = is_student
-        already = feedback.filter(user=user).exists()
+        context['average_rating'] = course.rating_avg
+        context['feedback_count'] = course.rating_count
+        # called by the template, so a cached fragment never queries it
+        context['rating_histogram'] = partial(rating_histogram, course.id)
+        # refreshed on a schedule, not with the course version, so it is
+        # rendered outside the cached fragment
+        context['ranking'] = CourseRanking.objects.filter(course=course).first()
+
+        # only students enrolled on the course can possibly review it
+        already = False
+        if context['is_student'] and context['is_enrolled']:
+            already = CourseFeedback.objects.filter(
+                course=course, user=user).exists()
         context['already_reviewed'] = already
-        context['can_review'] = is_student and context['is_enrolled'] and not already
-        context['average_rating'] = course.average_rating()
-        context['feedback_count'] = course.feedback_count()
+        context['can_review'] = (
+            context['is_student'] and context['is_enrolled'] and not already)
         # provide a crispy form only when they can review
         if context['can_review']:
             context['feedback_form'] = CourseFeedbackForm(
                 user=user, course=course)
 
-        return context
+    def add_analytics_context(self, context, course, user):
+        # reads the daily rollups only, never the enrollment/feedback tables
+        if not is_course_teacher(user, course):
+            raise PermissionDenied
+        days = list(course_daily_stats(course.id))
+        context['analytics_days'] = days
+        context['analytics_period'] = ANALYTICS_DAYS
+        totals = {field: sum(getattr(day, field) for day in days)
+                  for field in STAT_FIELDS}
+        totals['rating_avg'] = (totals['rating_sum'] / totals['feedback_count']
+                                if totals['feedback_count'] else None)
+        context['analytics_totals'] = totals
+
+    def add_roster_context(self, context, course, user):
+        context['course_collaborators'] = course.collaborators.all()
+        context['students'] = (
+            Enrollment.objects.filter(course=course)
+            .select_related('user').order_by('enrolled_at', 'id'))
 
 
 class MaterialCreateView(LoginRequiredMixin, TeacherRequiredMixin, CreateView):
@@ -162,10 +256,19 @@ class MaterialCreateView(LoginRequiredMixin, TeacherRequiredMixin, CreateView):
     def get_success_url(self):
         return reverse_lazy('courses:course_detail', kwargs={'course_id': self.kwargs['course_id']})
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['course'] = get_object_or_404(Course, id=self.kwargs['course_id'])
+        return kwargs
+
     def form_valid(self, form):
-        course = get_object_or_404(Course, id=self.kwargs['course_id'])
+        course = form.course
         form.instance.course = course
-        response = super().form_valid(form)
+        with transaction.atomic():
+            if form.cleaned_data.get('order') is None:
+                # append into the gap after the current last material
+                form.instance.order = next_order(course.id)
+            response = super().form_valid(form)
 
         # Call the celery task asynchronously
         notify_students_new_material.delay(course.id, self.object.title)
@@ -173,6 +276,90 @@ class MaterialCreateView(LoginRequiredMixin, TeacherRequiredMixin, CreateView):
         return response
 
 
+def _upload_status(upload):
+    return {
+        'upload_id': str(upload.id),
+        'size': upload.size,
+        'chunk_size': upload.chunk_size,
+        'chunk_count': upload.chunk_count,
+        'missing': missing_chunks(upload),
+        'complete': upload.material_id is not None,
+        'material_id': upload.material_id,
+        'sha256': upload.sha256 or None,
+    }
+
+
+class MaterialUploadStartView(LoginRequiredMixin, View):
+    """
+    Start a chunked upload. JSON body:
+      {"title", "filename", "size", "chunk_size"?, "order"?}
+    Chunks then go to MaterialUploadChunkView and the upload is turned
+    into a Material by MaterialUploadCompleteView.
+    """
+
+    def post(self, request, course_id):
+        course = get_object_or_404(Course, pk=course_id)
+        if not is_course_teacher(request.user, course):
+            return HttpResponseForbidden("Not authorized")
+        try:
+            payload = json.loads(request.body or b'{}')
+            upload = start_upload(
+                course, request.user,
+                title=payload.get('title', '').strip(),
+                filename=payload.get('filename', '').strip(),
+                size=payload.get('size', 0),
+                chunk_size=payload.get('chunk_size'),
+                order=payload.get('order'),
+            )
+        except (ValueError, TypeError, AttributeError) as e:
+            return JsonResponse({'detail': str(e)}, status=400)
+        return JsonResponse(_upload_status(upload), status=201)
+
+
+class MaterialUploadStatusView(LoginRequiredMixin, View):
+    # resuming clients ask which chunks are still missing
+    def get(self, request, upload_id):
+        upload = get_object_or_404(
+            MaterialUpload, pk=upload_id, uploader=request.user)
+        return JsonResponse(_upload_status(upload))
+
+
+class MaterialUploadChunkView(LoginRequiredMixin, View):
+    """
+    PUT the raw bytes of one chunk. An optional X-Chunk-SHA256 header is
+    verified against the checksum computed while storing the chunk.
+    """
+
+    def put(self, request, upload_id, index):
+        upload = get_object_or_404(
+            MaterialUpload, pk=upload_id, uploader=request.user)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+            chunk = receive_chunk(
+                upload, index, request, length,
+                sha256=request.headers.get('X-Chunk-SHA256'))
+        except ValueError as e:
+            return JsonResponse({'detail': str(e)}, status=400)
+        return JsonResponse({'index': chunk.index, 'sha256': chunk.sha256})
+
+
+class MaterialUploadCompleteView(LoginRequiredMixin, View):
+    def post(self, request, upload_id):
+        upload = get_object_or_404(
+            MaterialUpload.objects.select_related('course'),
+            pk=upload_id, uploader=request.user)
+        already_done = upload.material_id is not None
+        try:
+            material = complete_upload(upload)
+        except ValueError as e:
+            return JsonResponse({'detail': str(e)}, status=400)
+
+        if not already_done:
+            notify_students_new_material.delay(upload.course_id, material.title)
+        upload.refresh_from_db()
+        return JsonResponse(_upload_status(upload))
+
+
 class MaterialDeleteView(LoginRequiredMixin, TeacherRequiredMixin, DeleteView):
 
     model = Material
@@ -183,26 +370,85 @@ class MaterialDeleteView(LoginRequiredMixin, TeacherRequiredMixin, DeleteView):
         return reverse_lazy('courses:course_detail', kwargs={'course_id': self.object.course.id})
 
 
-class MaterialMoveView(View):
+class MaterialDownloadView(LoginRequiredMixin, View):
+    """
+    Access-checked material download: course teachers and enrolled,
+    non-blocked students only. The transfer itself is delegated to
+    courses.downloads (proxy sendfile, ranged FileResponse or S3 URL).
+    """
+
+    def get(self, request, material_id):
+        material = get_object_or_404(
+            Material.objects.select_related('course'), id=material_id)
+        if not material.content:
+            raise Http404("No file attached")
+
+        if not course_access(request.user, material.course_id).can_view_materials:
+            return HttpResponseForbidden("Not authorized")
+
+        # stored under its content hash, so offer the title as the filename
+        ext = os.path.splitext(material.content.name)[1]
+        filename = f"{slugify(material.title) or 'material'}{ext}"
+        return serve_material_file(request, material.content, filename=filename)
+
+
+class MaterialMoveView(LoginRequiredMixin, View):
     def get(self, request, material_id, direction):
-        material = get_object_or_404(Material, id=material_id)
-
-        if direction == 'up':
-            previous = Material.objects.filter(
-                course=material.course, order__lt=material.order).order_by('-order').first()
-            if previous:
-                material.order, previous.order = previous.order, material.order
-                material.save()
-                previous.save()
-        elif direction == 'down':
-            next = Material.objects.filter(
-                course=material.course, order__gt=material.order).order_by('order').first()
-            if next:
-                material.order, next.order = next.order, material.order
-                material.save()
-                next.save()
-
-        return redirect('courses:course_detail', course_id=material.course.id)
+        material = get_object_or_404(
+            Material.objects.select_related('course'), id=material_id)
+        course = material.course
+        if not is_course_teacher(request.user, course):
+            return HttpResponseForbidden("Not authorized")
+
+        # ids only, straight from the (course, order) index
+        ids = list(Material.objects.filter(course=course)
+                   .order_by('order', 'id').values_list('id', flat=True))
+        position = ids.index(material.id)
+
+        # a single step only rewrites the moved material
+        if direction == 'up' and position > 0:
+            after = ids[position - 2] if position > 1 else None
+            reorder_materials(course, [material.id], after=after)
+        elif direction == 'down' and position < len(ids) - 1:
+            reorder_materials(course, [material.id], after=ids[position + 1])
+
+        return redirect('courses:course_detail', course_id=course.id)
+
+
+class MaterialReorderView(LoginRequiredMixin, View):
+    """
+    POST-only batch reorder, as form data or JSON:
+      order=<id>&order=<id>...[&after=<id>]
+      {"order": [<id>, ...], "after": <id>|null}
+    A full ordering lists every material; a partial one moves the listed
+    materials as a block to just after `after` (or the top).
+    """
+
+    def post(self, request, course_id):
+        course = get_object_or_404(Course, pk=course_id)
+        if not is_course_teacher(request.user, course):
+            return HttpResponseForbidden("Not authorized")
+
+        wants_json = request.content_type == 'application/json'
+        try:
+            if wants_json:
+                payload = json.loads(request.body or b'{}')
+                ids, after = payload.get('order', []), payload.get('after')
+            else:
+                ids = request.POST.getlist('order')
+                after = request.POST.get('after') or None
+            materials = reorder_materials(course, ids, after=after)
+        except (ValueError, TypeError, AttributeError) as e:
+            if wants_json:
+                return JsonResponse({'detail': str(e)}, status=400)
+            messages.error(request, f"Could not reorder materials: {e}")
+            return redirect('courses:course_detail_section',
+                            course_id=course.id, section='materials')
+
+        if wants_json:
+            return JsonResponse({'order': [m.id for m in materials]})
+        return redirect('courses:course_detail_section',
+                        course_id=course.id, section='materials')
 
 
 class EnrollView(LoginRequiredMixin, View):
@@ -214,12 +460,57 @@ class EnrollView(LoginRequiredMixin, View):
         notify_teacher_of_enrollment.delay(
             teacher_id=course.creator.id,
             student_name=request.user.get_full_name() or request.user.username,
-            course_title=course.title
+            course_title=course.title,
+            course_id=course.id,
         )
         return redirect('courses:course_detail_section',
                         course_id=course_id, section='registration')
 
 
+class EnrollmentImportView(LoginRequiredMixin, View):
+    """
+    Teachers enroll a cohort from a CSV of usernames / emails in one go;
+    rows that can't be matched are listed back with the reason.
+    """
+    template_name = 'courses/enrollment_import.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        self.course = get_object_or_404(Course, pk=kwargs['course_id'])
+        if request.user.is_authenticated and not is_course_teacher(request.user, self.course):
+            return HttpResponseForbidden("Not authorized")
+        return super().dispatch(request, *args, **kwargs)
+
+    def render(self, form, result=None):
+        return render(self.request, self.template_name, {
+            'course': self.course,
+            'active_section': 'teacher_area',
+            'form': form,
+            'result': result,
+        })
+
+    def get(self, request, course_id):
+        return self.render(EnrollmentImportForm())
+
+    def post(self, request, course_id):
+        form = EnrollmentImportForm(request.POST, request.FILES)
+        if not form.is_valid():
+            return self.render(form)
+        try:
+            result = bulk_enroll(
+                self.course, read_identifiers(form.cleaned_data['file']))
+        except EnrollmentImportError as e:
+            form.add_error('file', str(e))
+            return self.render(form)
+
+        if result['enrolled']:
+            notify_teacher_of_bulk_enrollment.delay(
+                teacher_id=self.course.creator_id,
+                course_title=self.course.title,
+                enrolled_count=result['enrolled'],
+            )
+        return self.render(EnrollmentImportForm(), result)
+
+
 class DisenrollView(LoginRequiredMixin, View):
     def post(self, request, course_id):
         course = get_object_or_404(Course, pk=course_id)
@@ -238,7 +529,7 @@ class FeedbackCreateView(LoginRequiredMixin, View):
         course = get_object_or_404(Course, pk=course_id)
 
         # must be enrolled
-        if not course.enrolled_users.filter(pk=request.user.pk).exists():
+        if not course_access(request.user, course).enrolled:
             messages.error(request, "You must be enrolled to leave feedback.")
             return redirect("courses:course_detail_section", course_id=course_id, section='feedback')
 
@@ -268,12 +559,12 @@ class BlockStudentView(TeacherRequiredMixin, View):
         enrollment = get_object_or_404(Enrollment, id=enrollment_id)
 
         # Ensure request.user has permission (TeacherRequiredMixin helps here. Add checks if needed.)
-        if request.user not in enrollment.course.collaborators.all() and request.user != enrollment.course.creator:
+        if not is_course_teacher(request.user, enrollment.course_id):
             return HttpResponseForbidden("Not authorized")
 
         enrollment.blocked = True
         enrollment.save()
-        return redirect('courses:course_detail_section', course_id=enrollment.course.id, section='teacher_area')
+        return redirect('courses:course_detail_section', course_id=enrollment.course_id, section='teacher_area')
 
 
 @method_decorator(csrf_protect, name='dispatch')
@@ -283,9 +574,9 @@ class UnblockStudentView(TeacherRequiredMixin, View):
         enrollment = get_object_or_404(Enrollment, id=enrollment_id)
 
         # Permission check
-        if request.user not in enrollment.course.collaborators.all() and request.user != enrollment.course.creator:
+        if not is_course_teacher(request.user, enrollment.course_id):
             return HttpResponseForbidden("Not authorized")
 
         enrollment.blocked = False
         enrollment.save()
-        return redirect('courses:course_detail_section', course_id=enrollment.course.id, section='teacher_area')
+        return redirect('courses:course_detail_section', course_id=enrollment.course_id, section='teacher_area')
@@ -37,6 +37,21 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Shared Redis cache when available, per-process memory otherwise
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    }
+
 CELERY_BROKER_URL = "redis://localhost:6379/0"
 CELERY_RESULT_BACKEND = "redis://localhost:6379/0"
 CELERY_TIMEZONE = "UTC"
@@ -172,7 +187,18 @@ else:
         "staticfiles": {
             "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
         },
-    }  # Default primary key field type
+    }
+
+# --- Material downloads ---
+# After the access check, "nginx" hands the transfer to the proxy via
+# X-Accel-Redirect (an internal location aliasing MEDIA_ROOT at
+# MATERIAL_SENDFILE_PREFIX) and "xsendfile" via X-Sendfile (Apache,
+# lighttpd). Empty: Django streams the file itself.
+MATERIAL_SENDFILE = os.environ.get("MATERIAL_SENDFILE", "")
+MATERIAL_SENDFILE_PREFIX = os.environ.get(
+    "MATERIAL_SENDFILE_PREFIX", "/protected-media/")
+
+# Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -217,6 +243,58 @@ CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_IGNORE_RESULT = True
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
+# Enrollment notifications are sent per teacher and course as one digest
+# covering this many seconds of enrollments (0 sends each one at once).
+ENROLLMENT_DIGEST_WINDOW = int(os.getenv("ENROLLMENT_DIGEST_WINDOW", "300"))
+
+# Chat messages older than this many days are moved out of the live table
+# into compressed per-room archive segments (still readable as history).
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", "90"))
+
+# Write-behind chat persistence: messages are broadcast at once and written
+# in batches of up to CHAT_FLUSH_BATCH every CHAT_FLUSH_INTERVAL_MS.
+# Off: each message is inserted before it is broadcast.
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "0") == "1"
+CHAT_FLUSH_INTERVAL_MS = int(os.getenv("CHAT_FLUSH_INTERVAL_MS", "200"))
+CHAT_FLUSH_BATCH = int(os.getenv("CHAT_FLUSH_BATCH", "100"))
+# most messages held while the database is failing; older ones are dropped
+CHAT_BUFFER_MAX = int(os.getenv("CHAT_BUFFER_MAX", "10000"))
+
+# Chat flood control (chat.throttle): (messages per second, burst) per
+# connection and per user. CHAT_THROTTLE_SHARED keeps the per-user limit
+# in the cache so it holds across processes. Consumers with more than
+# CHAT_MAX_BACKLOG room events queued are disconnected.
+CHAT_RATE = (float(os.getenv("CHAT_RATE", "5")),
+             int(os.getenv("CHAT_BURST", "10")))
+CHAT_USER_RATE = (float(os.getenv("CHAT_USER_RATE", "10")),
+                  int(os.getenv("CHAT_USER_BURST", "20")))
+CHAT_THROTTLE_SHARED = os.getenv("CHAT_THROTTLE_SHARED", "0") == "1"
+CHAT_MAX_BACKLOG = int(os.getenv("CHAT_MAX_BACKLOG", "100"))
+
+# Periodic tasks (run `celery -A elearn beat`)
+CELERY_BEAT_SCHEDULE = {
+    "expire-material-uploads": {
+        "task": "courses.tasks.expire_material_uploads",
+        "schedule": 60 * 60,
+    },
+    "flush-enrollment-digests": {
+        "task": "courses.tasks.flush_enrollment_digests",
+        "schedule": 60,
+    },
+    "refresh-course-rankings": {
+        "task": "courses.tasks.refresh_course_rankings",
+        "schedule": 10 * 60,
+    },
+    "rollup-course-activity": {
+        "task": "courses.tasks.rollup_course_activity",
+        "schedule": 5 * 60,
+    },
+    "archive-chat-messages": {
+        "task": "chat.tasks.archive_chat_messages",
+        "schedule": 60 * 60,
+    },
+}
+
 INSTALLED_APPS += ["drf_spectacular"]
 
 REST_FRAMEWORK = {